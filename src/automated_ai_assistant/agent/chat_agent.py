@@ -1,11 +1,79 @@
+import asyncio
 import json
+from functools import lru_cache
+from typing import Optional
 
-from autogen_core import default_subscription, RoutedAgent, message_handler, MessageContext, DefaultTopicId
+from autogen_core import default_subscription, RoutedAgent, message_handler, MessageContext, DefaultTopicId, \
+    CancellationToken, AgentId
 from autogen_core.models import UserMessage, SystemMessage
 from autogen_ext.models import OpenAIChatCompletionClient
 
-from automated_ai_assistant.model.data_types import EndUserMessage
-from automated_ai_assistant.oltp_tracing import logger
+from automated_ai_assistant.agent.task_router import classify_task, routing_system_message
+from automated_ai_assistant.model.data_types import AssistantResponse, EndUserMessage, NextAction, TaskRoute
+from automated_ai_assistant.oltp_tracing import logger, VERBOSE
+from automated_ai_assistant.utils.example_index_utils import ExampleIndex, prompt_top_k, relevant_agents
+from automated_ai_assistant.utils.metrics_utils import counter
+from automated_ai_assistant.utils.deadline_utils import cancellable
+from automated_ai_assistant.utils.profiling_utils import profiled
+from automated_ai_assistant.utils.structured_output import create_structured
+
+speculative_routes = counter("chat_agent.speculative_routes", "Outcomes of speculative intent classification")
+
+
+CHAT_EXAMPLES = [
+    """
+             user : I want to schedule a meeting with john
+             assistant : Sure, I can help with that. Can you please provide me with the start time, duration, attendees, summary, and description of the meeting?
+             user : 10:00 AM, 1 hour
+             assistant : Who else will be attending the meeting?
+             user : john
+             assistant : Can you provide me the email Id of john?
+             user : john@abc.com
+             assistant : Great! What should be the title of the meeting?
+             user : Project discussion
+             assistant : What should be the description of the meeting?
+             user : Discuss the project progress, timelines, and blockers
+             assistant : Great! I have all the required information. Let me schedule the meeting for you.
+             next you will create a prompt message to handoff the task to the task router, like:
+             schedule a meeting with john@abc.com on 23rd January 2026 at 10:00 AM for 1 hour with the title Project discussion and description Discuss the project progress, timelines, and blockers
+    """,
+    """
+             user : I want to schedule a meeting with john@abc.com on 23rd January 2026 at 10:00 AM for 1 hour with the title Project discussion and description Discuss the project progress, timelines, and blockers
+             assistant : Great! I have all the required information. Let me schedule the meeting for you.
+             handoff to the task router: the user's message as is
+    """,
+    """
+             user : Send an email to jane@abc.com
+             assistant : Sure! What should be the subject and the body of the email?
+             user : Weekly report, ask her to share the numbers by Friday
+             assistant : Great! I have all the required information. Let me send the email for you.
+             handoff to the task router: send an email to jane@abc.com with the subject Weekly report and body Could you please share the numbers by Friday?
+    """,
+    """
+             user : Remind me to call the bank
+             assistant : Sure, when should I remind you?
+             user : 24th January 2026 at 9 AM
+             assistant : What should the description of the reminder be?
+             user : Ask about the new card
+             assistant : Got it! Let me set the reminder for you.
+             handoff to the task router: set a reminder on 24th January 2026 at 9:00 AM with the title Call the bank and description Ask about the new card
+    """,
+    """
+             user : Hi there!
+             assistant : Hello! I can schedule meetings, send emails and set reminders for you. How can I help you today?
+             no intent and no handoff yet
+    """,
+    """
+             user : Schedule a meeting with john@abc.com on 23rd January 2026 at 3 PM for 30 minutes with the title Launch and description Launch plan, then email him the agenda with the subject Launch agenda
+             assistant : Great! Let me schedule the meeting and send the agenda for you.
+             intent is null since the request combines several tasks, handoff to the task router: the user's message as is
+    """,
+]
+
+
+@lru_cache(maxsize=None)
+def chat_example_index() -> ExampleIndex:
+    return ExampleIndex([(example, example) for example in CHAT_EXAMPLES])
 
 
 @default_subscription
@@ -22,8 +90,12 @@ class ChatAgent(RoutedAgent):
     def intent(self):
         return ["schedule_meeting", "send_email", "set_reminder"]
 
-    def __init__(self, model_client: OpenAIChatCompletionClient):
+    def __init__(self, model_client: OpenAIChatCompletionClient,
+                 router_model_client: Optional[OpenAIChatCompletionClient] = None,
+                 speculative_routing: bool = False):
         self.model_client = model_client
+        self.router_model_client = router_model_client
+        self.speculative_routing = speculative_routing and router_model_client is not None
         self.system_messages = """You are a helpful personal AI assistant. Helping users with the following tasks:
             1. Schedule meetings
             2. Send emails
@@ -35,32 +107,16 @@ class ChatAgent(RoutedAgent):
                                                                                indent=4) + """
             - Respond to user greetings
             - based on the user's message identify the task type and engage with the user to gather all required information
-            - Once all the information is gathered, use the tool call_task_router to handoff the task to the task router
-
-             example: 
-             user : I want to schedule a meeting with john
-             assistant : Sure, I can help with that. Can you please provide me with the start time, duration, attendees, summary, and description of the meeting?
-             user : 10:00 AM, 1 hour
-             assistant : Who else will be attending the meeting?
-             user : john
-             assistant : Can you provide me the email Id of john?
-             user : john@abc.com
-             assistant : Great! What should be the title of the meeting?
-             user : Project discussion
-             assistant : What should be the description of the meeting?
-             user : Discuss the project progress, timelines, and blockers
-             assistant : Great! I have all the required information. Let me schedule the meeting for you.
-             next you will create a prompt message to handoff the task to the task router, like:
-             schedule a meeting with john@abc.com on 23rd January 2026 at 10:00 AM for 1 hour with the title Project discussion and description Discuss the project progress, timelines, and blockers
-
-             example of the task handoff to the task router:
-             user : I want to schedule a meeting with john@abc.com on 23rd January 2026 at 10:00 AM for 1 hour with the title Project discussion and description Discuss the project progress, timelines, and blockers
-             assistant : Great! I have all the required information. Let me schedule the meeting for you.
+            - Put your message to the user in `reply`
+            - Set `intent` to the identified task type, or null if there is none yet or the request combines several tasks
+            - Once all the information is gathered, set `prompt_to_task_router` to handoff the task to the task router, otherwise leave it null
             """
 
         super().__init__("ChatAgent")
 
     @message_handler
+    @cancellable
+    @profiled("ChatAgent.engage_with_user")
     async def engage_with_user(self, message: EndUserMessage, ctx: MessageContext) -> None:
         """
         Engage with the user until all required information is gathered.
@@ -73,49 +129,111 @@ class ChatAgent(RoutedAgent):
             str: Response to the user
         """
 
-        try:
-
-            tools = [{
-                "name": "determine_next_action",
-                "description": "Determine if the response should be a text message returned to user or calling task_router",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "prompt_to_task_router": {
-                            "type": "string",
-                            "description": "Prompt to handoff the task to the task router"
-                        }
-                    },
-                    "required": ["response_type"]
-                }
-            }]
+        speculation = None
+        speculation_consumed = False
+        speculation_token = CancellationToken()
+        ctx.cancellation_token.add_callback(speculation_token.cancel)
+        if self.speculative_routing:
+            # Classify the raw user message while the chat agent decides whether to hand off.
+            speculation = asyncio.create_task(self._speculate(message.content, speculation_token))
+            speculation.add_done_callback(self._speculation_done)
 
+        try:
             user_message = UserMessage(
                 content=message.content,
                 source="user",
                 type="UserMessage",
             )
             system_message = SystemMessage(
-                content=self.system_messages,
+                content=self.system_message_for(message.content),
                 type="SystemMessage",
             )
-            response = await self.model_client.create(
-                messages=[
-                    user_message,
-                    system_message
-                ],
-                tools=tools
+            next_action = await create_structured(
+                self.model_client,
+                [user_message, system_message],
+                NextAction,
+                source=self.id.type,
+                cancellation_token=ctx.cancellation_token
             )
 
-            logger.info(f"Received response: {response}")
-
-            if response.finish_reason == "function_call":
-                arguments = json.loads(response.content[0].arguments)
-                if "prompt_to_task_router" in arguments:
+            if next_action.prompt_to_task_router:
+                if next_action.reply:
                     await self.publish_message(
-                        message=EndUserMessage(content=arguments["prompt_to_task_router"], source="ChatAgent"),
-                        topic_id=DefaultTopicId(type="task_router")
+                        message=AssistantResponse(content=next_action.reply, source=self.id.type, partial=True),
+                        topic_id=DefaultTopicId(type="user_response")
                     )
+                handoff = EndUserMessage(content=next_action.prompt_to_task_router, source="ChatAgent")
+                speculation_consumed = True
+                route = await self._commit_speculation(speculation, next_action)
+                if route is None:
+                    await self.publish_message(
+                        message=handoff,
+                        topic_id=DefaultTopicId(type="task_router"),
+                        cancellation_token=ctx.cancellation_token
+                    )
+                    return
+                result = await self.send_message(handoff, AgentId(route.agent_type.value, "default"),
+                                                 cancellation_token=ctx.cancellation_token)
+                await self.publish_message(
+                    message=AssistantResponse(content=result.content, source=route.agent_type.value),
+                    topic_id=DefaultTopicId(type="user_response")
+                )
+            else:
+                logger.info("Replying to user: %s", next_action.reply, extra=VERBOSE)
+                await self.publish_message(
+                    message=AssistantResponse(content=next_action.reply, source=self.id.type),
+                    topic_id=DefaultTopicId(type="user_response")
+                )
 
         except Exception as e:
-            logger.error(f"Failed to parse response: {str(e)}")
+            logger.error("Failed to parse response: %s", e)
+
+        finally:
+            if speculation is not None and not speculation.done():
+                speculation_token.cancel()
+                speculation.cancel()
+            elif speculation is not None and not speculation_consumed and not speculation.cancelled() \
+                    and speculation.exception() is None:
+                # Classified in time, but the chat agent replied without handing off.
+                speculative_routes.add(outcome="unused")
+
+    def system_message_for(self, content: str) -> str:
+        """System message with the dialogue examples most similar to the user message."""
+        examples = chat_example_index().search(content, prompt_top_k(2))
+        return self.system_messages + "\n             examples:" + "".join(examples)
+
+    async def _speculate(self, content: str, cancellation_token: CancellationToken) -> TaskRoute:
+        """Classify the raw user message, so a matching hand off can skip the task router's planning call."""
+        return await classify_task(self.router_model_client, routing_system_message(relevant_agents(content)),
+                                   content, source=self.id.type, cancellation_token=cancellation_token)
+
+    @staticmethod
+    def _speculation_done(speculation: asyncio.Task):
+        """Retrieve the outcome of a finished speculation, which no hand off may be waiting for."""
+        if speculation.cancelled():
+            speculative_routes.add(outcome="cancelled")
+            return
+        error = speculation.exception()
+        if error is not None:
+            logger.warning("Speculative routing failed: %s", error)
+            speculative_routes.add(outcome="error")
+
+    async def _commit_speculation(self, speculation: Optional[asyncio.Task],
+                                  next_action: NextAction) -> Optional[TaskRoute]:
+        """
+        Return the speculative route if it matches the intent of the hand off, None otherwise.
+
+        A matching route lets the hand off skip the task router.
+        """
+        if speculation is None:
+            return None
+        try:
+            route = await speculation
+        except (Exception, asyncio.CancelledError):
+            # Counted by `_speculation_done`.
+            return None
+        if route.agent_type != next_action.intent:
+            speculative_routes.add(outcome="mismatched")
+            return None
+        speculative_routes.add(outcome="committed", agent_type=route.agent_type.value)
+        return route
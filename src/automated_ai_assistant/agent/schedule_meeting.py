@@ -1,16 +1,20 @@
-import json
+import asyncio
 from typing import List
 
 from autogen_core import type_subscription, message_handler, MessageContext, RoutedAgent
 from autogen_core.models import UserMessage, LLMMessage, SystemMessage
 from autogen_core.tools import Tool, FunctionTool
 from autogen_ext.models.openai import OpenAIChatCompletionClient
-from automated_ai_assistant.model.data_types import MeetingDetails, EndUserMessage
-from automated_ai_assistant.oltp_tracing import logger
+from automated_ai_assistant.model.data_types import MeetingDetails, EndUserMessage, TaskResult
+from automated_ai_assistant.oltp_tracing import logger, VERBOSE
+from automated_ai_assistant.utils.extraction_utils import extract_meeting_details, narrow_prompt
 from automated_ai_assistant.utils.google_utils import google_api_interface
+from automated_ai_assistant.utils.deadline_utils import cancellable
+from automated_ai_assistant.utils.profiling_utils import profiled
+from automated_ai_assistant.utils.structured_output import create_structured, response_model, type_adapter
 
 
-def schedule_meeting(meeting_details: MeetingDetails) -> str:
+def schedule_meeting(meeting_details: MeetingDetails) -> TaskResult:
     """
     Schedule a meeting using Google Calendar API.
 
@@ -23,16 +27,16 @@ def schedule_meeting(meeting_details: MeetingDetails) -> str:
             attendees: List of attendee email addresses
 
     Returns:
-        str: Confirmation message with meeting link
+        TaskResult: Confirmation message with meeting link, or the error
     """
     try:
-        logger.info(f"Scheduling meeting: {meeting_details}")
+        logger.info("Scheduling meeting: %s", meeting_details, extra=VERBOSE)
         event = google_api_interface().schedule_meeting(
             meeting_details=meeting_details
         )
-        return f"Meeting scheduled successfully: {event.get('htmlLink')}"
+        return TaskResult(content=f"Meeting scheduled successfully: {event.get('htmlLink')}")
     except Exception as e:
-        return f"Failed to schedule meeting: {str(e)}"
+        return TaskResult(content=f"Failed to schedule meeting: {str(e)}", ok=False)
 
 
 def get_schedule_meeting_tool() -> List[Tool]:
@@ -52,7 +56,7 @@ class ScheduleMeetingAgent(RoutedAgent):
         self.model_client = model_client
         self.system_message = """You are a meeting scheduling assistant. Your task is to:
         1. Parse meeting requests to extract: time, duration, attendees, and purpose
-        2. Use the schedule_meeting tool to create the meeting
+        2. Return the meeting details in the requested JSON format
         3. Respond in a friendly, concise manner
 
         For each request, you should:
@@ -65,21 +69,26 @@ class ScheduleMeetingAgent(RoutedAgent):
         )
 
     @message_handler
-    async def handle_message(self, message: EndUserMessage, ctx: MessageContext) -> str:
+    @cancellable
+    @profiled("ScheduleMeetingAgent.handle_message")
+    async def handle_message(self, message: EndUserMessage, ctx: MessageContext) -> TaskResult:
         try:
-            logger.info(f"Received message: {message.content} from source: {message.source}")
+            logger.info("Received message: %s from source: %s", message.content, message.source, extra=VERBOSE)
 
-            session: List[LLMMessage] = [UserMessage(content=message.content, type="UserMessage"),
-                                         SystemMessage(content=self.system_message, type="SystemMessage")]
-            response = await self.model_client.create(messages=session,
-                                                      tools=get_schedule_meeting_tool())
-            logger.info(f"Received response: {response}")
-            if response.finish_reason == 'function_calls':
-                function_call = response.content[0]
-                raw_args = json.loads(function_call.arguments)
-                meeting_details = MeetingDetails(**raw_args['meeting_details'])
-                result = schedule_meeting(meeting_details)
-                return result
+            extraction = extract_meeting_details(message.content)
+            if extraction.complete:
+                logger.info("Resolved meeting details locally, skipping LLM")
+                return await asyncio.to_thread(schedule_meeting, MeetingDetails(**extraction.fields))
+
+            session: List[LLMMessage] = [UserMessage(content=message.content, source=message.source, type="UserMessage"),
+                                         SystemMessage(content=self.system_message + narrow_prompt(extraction),
+                                                       type="SystemMessage")]
+            details = await create_structured(self.model_client, session,
+                                              response_model(MeetingDetails, tuple(extraction.missing)),
+                                              source=self.id.type,
+                                              cancellation_token=ctx.cancellation_token)
+            meeting_details = type_adapter(MeetingDetails).validate_python({**details.model_dump(), **extraction.fields})
+            return await asyncio.to_thread(schedule_meeting, meeting_details)
         except Exception as e:
-            logger.error(f"Error handling message: {str(e)}")
-            return "Failed to schedule the meeting."
+            logger.error("Error handling message: %s", e)
+            return TaskResult(content="Failed to schedule the meeting.", ok=False)
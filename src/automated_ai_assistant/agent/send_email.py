@@ -1,28 +1,32 @@
-import json
+import asyncio
 from typing import List
 
 from autogen_core import type_subscription, RoutedAgent, message_handler, MessageContext
 from autogen_core.models import UserMessage, LLMMessage, SystemMessage
 from autogen_core.tools import Tool, FunctionTool
 from autogen_ext.models import OpenAIChatCompletionClient
-from automated_ai_assistant.model.data_types import EmailDetails, EndUserMessage
-from automated_ai_assistant.oltp_tracing import logger
+from automated_ai_assistant.model.data_types import EmailDetails, EndUserMessage, TaskResult
+from automated_ai_assistant.oltp_tracing import logger, VERBOSE
+from automated_ai_assistant.utils.extraction_utils import extract_email_details, narrow_prompt
 from automated_ai_assistant.utils.google_utils import google_api_interface
+from automated_ai_assistant.utils.deadline_utils import cancellable
+from automated_ai_assistant.utils.profiling_utils import profiled
+from automated_ai_assistant.utils.structured_output import create_structured, response_model, type_adapter
 
 
-def send_email(email_details: EmailDetails) -> str:
+def send_email(email_details: EmailDetails) -> TaskResult:
     """
     :param email_details:
     :return:
     """
     try:
-        logger.info(f"Sending email: {email_details}")
+        logger.info("Sending email: %s", email_details, extra=VERBOSE)
         email = google_api_interface().send_email(
             email_details=email_details
         )
-        return f"Email sent successfully: {email.get('id')}"
+        return TaskResult(content=f"Email sent successfully: {email.get('id')}")
     except Exception as e:
-        return f"Error sending email: {str(e)}"
+        return TaskResult(content=f"Error sending email: {str(e)}", ok=False)
 
 
 def get_send_email_tool() -> List[Tool]:
@@ -42,7 +46,7 @@ class SendEmailAgent(RoutedAgent):
         self.model_client = model_client
         self.system_message = """You are an email sending assistant. Your task is to:
             1. Parse email requests to extract: subject, body, and recipients
-            2. Use the send_email tool to send the email
+            2. Return the email details in the requested JSON format
             3. Respond in a friendly, concise manner
             
             For each request, you should:
@@ -54,20 +58,25 @@ class SendEmailAgent(RoutedAgent):
         )
 
     @message_handler
-    async def handle_message(self, message: EndUserMessage, ctx: MessageContext) -> str:
+    @cancellable
+    @profiled("SendEmailAgent.handle_message")
+    async def handle_message(self, message: EndUserMessage, ctx: MessageContext) -> TaskResult:
         try:
-            logger.info(f"Received message: {message.content} from source: {message.source}")
-            session: List[LLMMessage] = [UserMessage(content=message.content, type="UserMessage"),
-                                         SystemMessage(content=self.system_message, type="SystemMessage")]
-            response = await self.model_client.create(messages=session,
-                                                      tools=get_send_email_tool())
-            logger.info(f"Received response: {response}")
-            if response.finish_reason == 'function_calls':
-                function_call = response.content[0]
-                raw_args = json.loads(function_call.arguments)
-                email_details = EmailDetails(**raw_args['email_details'])
-                result = send_email(email_details)
-                return result
+            logger.info("Received message: %s from source: %s", message.content, message.source, extra=VERBOSE)
+            extraction = extract_email_details(message.content)
+            if extraction.complete:
+                logger.info("Resolved email details locally, skipping LLM")
+                return await asyncio.to_thread(send_email, EmailDetails(**extraction.fields))
+
+            session: List[LLMMessage] = [UserMessage(content=message.content, source=message.source, type="UserMessage"),
+                                         SystemMessage(content=self.system_message + narrow_prompt(extraction),
+                                                       type="SystemMessage")]
+            details = await create_structured(self.model_client, session,
+                                              response_model(EmailDetails, tuple(extraction.missing)),
+                                              source=self.id.type,
+                                              cancellation_token=ctx.cancellation_token)
+            email_details = type_adapter(EmailDetails).validate_python({**details.model_dump(), **extraction.fields})
+            return await asyncio.to_thread(send_email, email_details)
         except Exception as e:
-            logger.error(f"Error handling message: {str(e)}")
-            return "Failed to schedule the meeting."
+            logger.error("Error handling message: %s", e)
+            return TaskResult(content="Failed to send the email.", ok=False)
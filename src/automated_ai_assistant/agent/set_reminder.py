@@ -1,17 +1,22 @@
-import json
-from typing import List
+import asyncio
+from typing import List, Optional
 
 from autogen_core import type_subscription, RoutedAgent, message_handler, MessageContext
 from autogen_core.models import UserMessage, LLMMessage, SystemMessage
 from autogen_core.tools import Tool, FunctionTool
 from autogen_ext.models import OpenAIChatCompletionClient
 
-from automated_ai_assistant.model.data_types import ReminderDetails, EndUserMessage
-from automated_ai_assistant.oltp_tracing import logger
-from automated_ai_assistant.utils.google_utils import google_api_interface
+from automated_ai_assistant.model.data_types import ReminderDetails, EndUserMessage, TaskResult
+from automated_ai_assistant.oltp_tracing import logger, VERBOSE
+from automated_ai_assistant.utils.extraction_utils import extract_reminder_details, narrow_prompt
+from automated_ai_assistant.utils.google_utils import active_user, google_api_interface
+from automated_ai_assistant.utils.deadline_utils import cancellable
+from automated_ai_assistant.utils.profiling_utils import profiled
+from automated_ai_assistant.utils.reminder_utils import default_sink, reminder_backend, reminder_scheduler
+from automated_ai_assistant.utils.structured_output import create_structured, response_model, type_adapter
 
 
-def set_reminder(reminder_details: ReminderDetails) -> str:
+def set_reminder(reminder_details: ReminderDetails) -> TaskResult:
     """
     Set a reminder using Google Calendar API.
 
@@ -22,16 +27,35 @@ def set_reminder(reminder_details: ReminderDetails) -> str:
             reminder_time: Reminder time in ISO format
 
     Returns:
-        str: Confirmation message with reminder link
+        TaskResult: Confirmation message with reminder link, or the error
     """
     try:
-        logger.info(f"Setting reminder: {reminder_details}")
+        logger.info("Setting reminder: %s", reminder_details, extra=VERBOSE)
         reminder = google_api_interface().set_reminder(
             reminder_details=reminder_details
         )
-        return f"Reminder set successfully: {reminder.get('htmlLink')}"
+        return TaskResult(content=f"Reminder set successfully: {reminder.get('htmlLink')}")
     except Exception as e:
-        return f"Error setting reminder: {str(e)}"
+        return TaskResult(content=f"Error setting reminder: {str(e)}", ok=False)
+
+
+async def schedule_local_reminder(reminder_details: ReminderDetails) -> TaskResult:
+    """
+    Store a reminder in the local reminder engine, which fires it through the default sink.
+
+    Args:
+        reminder_details (ReminderDetails): Details of the reminder to set
+
+    Returns:
+        TaskResult: Confirmation message, or the error
+    """
+    try:
+        logger.info("Scheduling local reminder: %s", reminder_details, extra=VERBOSE)
+        sink = default_sink()
+        await reminder_scheduler().schedule(active_user.get(), reminder_details, sink=sink)
+        return TaskResult(content=f"Reminder set for {reminder_details.reminder_time.isoformat()} via {sink}")
+    except Exception as e:
+        return TaskResult(content=f"Error setting reminder: {str(e)}", ok=False)
 
 
 def get_set_reminder_tool() -> List[Tool]:
@@ -47,11 +71,12 @@ def get_set_reminder_tool() -> List[Tool]:
 @type_subscription(topic_type="set_reminder")
 class SetReminderAgent(RoutedAgent):
 
-    def __init__(self, model_client: OpenAIChatCompletionClient):
+    def __init__(self, model_client: OpenAIChatCompletionClient, backend: Optional[str] = None):
         self.model_client = model_client
+        self.backend = backend or reminder_backend()
         self.system_message = """You are a reminder setting assistant. Your task is to:
             1. Parse reminder requests to extract: title, description, and time
-            2. Use the set_reminder tool to create the reminder
+            2. Return the reminder details in the requested JSON format
             3. Respond in a friendly, concise manner
             
             For each request, you should:
@@ -64,20 +89,31 @@ class SetReminderAgent(RoutedAgent):
         )
 
     @message_handler
-    async def handle_message(self, message: EndUserMessage, ctx: MessageContext) -> str:
+    @cancellable
+    @profiled("SetReminderAgent.handle_message")
+    async def handle_message(self, message: EndUserMessage, ctx: MessageContext) -> TaskResult:
         try:
-            logger.info(f"Received message: {message.content} from source: {message.source}")
-            session: List[LLMMessage] = [UserMessage(content=message.content, type="UserMessage"),
-                                         SystemMessage(content=self.system_message, type="SystemMessage")]
-            response = await self.model_client.create(messages=session,
-                                                      tools=get_set_reminder_tool())
-            logger.info(f"Received response: {response}")
-            if response.finish_reason == 'function_calls':
-                function_call = response.content[0]
-                raw_args = json.loads(function_call.arguments)
-                reminder_details = ReminderDetails(**raw_args['reminder_details'])
-                result = set_reminder(reminder_details)
-                return result
+            logger.info("Received message: %s from source: %s", message.content, message.source, extra=VERBOSE)
+            extraction = extract_reminder_details(message.content)
+            if extraction.complete:
+                logger.info("Resolved reminder details locally, skipping LLM")
+                return await self.set_reminder(ReminderDetails(**extraction.fields))
+
+            session: List[LLMMessage] = [UserMessage(content=message.content, source=message.source, type="UserMessage"),
+                                         SystemMessage(content=self.system_message + narrow_prompt(extraction),
+                                                       type="SystemMessage")]
+            details = await create_structured(self.model_client, session,
+                                              response_model(ReminderDetails, tuple(extraction.missing)),
+                                              source=self.id.type,
+                                              cancellation_token=ctx.cancellation_token)
+            reminder_details = type_adapter(ReminderDetails).validate_python({**details.model_dump(), **extraction.fields})
+            return await self.set_reminder(reminder_details)
         except Exception as e:
-            logger.error(f"Error handling message: {str(e)}")
-            return "Failed to schedule the meeting."
+            logger.error("Error handling message: %s", e)
+            return TaskResult(content="Failed to set the reminder.", ok=False)
+
+    async def set_reminder(self, reminder_details: ReminderDetails) -> TaskResult:
+        """Set the reminder with the configured backend, `calendar` or `local`."""
+        if self.backend == "local":
+            return await schedule_local_reminder(reminder_details)
+        return await asyncio.to_thread(set_reminder, reminder_details)
@@ -1,26 +1,25 @@
+import asyncio
 import json
+from typing import Dict, List, Optional
 
 from autogen_core import RoutedAgent, MessageContext, DefaultTopicId, message_handler, \
-    type_subscription
+    type_subscription, CancellationToken, AgentId
 from autogen_core.models import UserMessage, SystemMessage
 from autogen_ext.models.openai import OpenAIChatCompletionClient
 
 from automated_ai_assistant.agent.utils import load_api_key
-from automated_ai_assistant.model.data_types import EndUserMessage
-from automated_ai_assistant.oltp_tracing import logger
+from automated_ai_assistant.model.data_types import AssistantResponse, EndUserMessage, SubTask, TaskPlan, TaskResult, \
+    TaskRoute
+from automated_ai_assistant.oltp_tracing import logger, VERBOSE
+from automated_ai_assistant.utils.example_index_utils import relevant_agents
+from automated_ai_assistant.utils.deadline_utils import cancellable
+from automated_ai_assistant.utils.profiling_utils import profiled
 from automated_ai_assistant.utils.registry_utils import AgentRegistry
+from automated_ai_assistant.utils.structured_output import create_structured, StructuredOutputError
 
 
-@type_subscription(topic_type="task_router")
-class TaskRoutingAgent(RoutedAgent):
-    def __init__(self):
-        self.registry = AgentRegistry()
-        self.api_key = load_api_key()
-        self.model_client = OpenAIChatCompletionClient(
-            model='gpt-3.5-turbo',
-            api_key=self.api_key
-        )
-        self.system_message = """You are a task routing assistant. Your task is to:
+def routing_system_message(agents: Dict[str, dict]) -> str:
+    return """You are a task routing assistant. Your task is to:
             1. Parse task requests to extract: intent, based on the user's message and given examples
             2. Use the registry to route the task to the appropriate specialized agent
             3. Respond in a friendly, concise manner
@@ -28,57 +27,158 @@ class TaskRoutingAgent(RoutedAgent):
             For each request, you should:
             - Identify the intent of the task
             - Use the registry below to find the appropriate specialized agent
-        """ + json.dumps(self.registry.agents, indent=4)
+        """ + json.dumps(agents, indent=4)
+
+
+async def classify_task(
+        model_client: OpenAIChatCompletionClient,
+        system_message: str,
+        content: str,
+        source: str,
+        cancellation_token: Optional[CancellationToken] = None
+) -> TaskRoute:
+    """
+    Determine which specialized agent should handle a task.
+
+    Args:
+        model_client (OpenAIChatCompletionClient): Client used for the routing call
+        system_message (str): Routing prompt built by `routing_system_message`
+        content (str): Task description
+        source (str): Name of the agent asking for the classification
+        cancellation_token (CancellationToken): Token linked to the LLM call
+
+    Returns:
+        TaskRoute: Selected agent type
+    """
+    return await create_structured(
+        model_client,
+        [UserMessage(content=content, source=source, type="UserMessage"),
+         SystemMessage(content=system_message, type="SystemMessage")],
+        TaskRoute,
+        source=source,
+        cancellation_token=cancellation_token
+    )
+
+
+PLANNING_INSTRUCTIONS = """
+            A request may contain several actions, e.g. scheduling a meeting and emailing its agenda.
+            - Split the request into one sub-task per action, each with a self-contained instruction
+            - In `depends_on`, list the indexes of earlier sub-tasks whose result the sub-task needs,
+              leave it empty when the sub-task can run on its own
+        """
+
+
+@type_subscription(topic_type="task_router")
+class TaskRoutingAgent(RoutedAgent):
+    def __init__(self, model_client: Optional[OpenAIChatCompletionClient] = None):
+        self.registry = AgentRegistry()
+        self.model_client = model_client or OpenAIChatCompletionClient(
+            model='gpt-4o-mini',
+            api_key=load_api_key()
+        )
         super().__init__(
             description='Agent that routes tasks to specialized agents'
         )
 
     @message_handler
+    @cancellable
+    @profiled("TaskRoutingAgent.route_task")
     async def route_task(self, message: EndUserMessage, ctx: MessageContext) -> str:
         """
-        Route a task to the appropriate specialized agent.
+        Split a task into sub-tasks and dispatch them to the specialized agents.
+
+        Independent sub-tasks run concurrently, dependent ones wait for the results they need.
+        The aggregated result is published to the `user_response` topic.
 
         Args:
             message (EndUserMessage): user message with task details
             ctx (MessageContext): Message context
 
         Returns:
-            str: Response from the specialized agent
+            str: Aggregated response from the specialized agents
         """
-        logger.info(f"Routing task: {message.content} from source: {message.source}")
-        user_message = UserMessage(
-            content=message.content,
-            source=ctx.topic_id.type,
-            type="UserMessage",
-        )
-        system_message = SystemMessage(
-            content=self.system_message,
-            source=ctx.topic_id.type,
-            type="SystemMessage",
-        )
-        tools = [{
-            "name": "determine_agent",
-            "description": "Determine which specialized agent should handle the task",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "agent_type": {
-                        "type": "string",
-                        "enum": list(self.registry.agents.keys())
-                    }
-                },
-                "required": ["agent_type"]
-            }
-        }]
-        intent = await self.model_client.create(messages=[user_message, system_message],
-                                                tools=tools)
-        logger.info(f"Extracted intent: {intent}")
-        if intent.content[0]:
-            agent_type = json.loads(intent.content[0].arguments)["agent_type"]
-            await self.runtime.publish_message(
-                message,
-                DefaultTopicId(type=agent_type)
+        logger.info("Routing task: %s from source: %s", message.content, message.source, extra=VERBOSE)
+        try:
+            plan = await create_structured(
+                self.model_client,
+                [UserMessage(content=message.content, source=self.id.type, type="UserMessage"),
+                 SystemMessage(content=self.system_message_for(message.content), type="SystemMessage")],
+                TaskPlan,
+                source=self.id.type,
+                cancellation_token=ctx.cancellation_token
             )
-            return f"Routed to {agent_type} agent"
+        except StructuredOutputError as e:
+            logger.error("Failed to determine agent: %s", e)
+            plan = TaskPlan(tasks=[])
+
+        if not plan.tasks:
+            result = "Sorry, I couldn't determine which agent should handle this task."
+        else:
+            logger.info("Extracted intents: %s", [task.agent_type.value for task in plan.tasks])
+            results = await self.dispatch(plan, ctx)
+            result = "\n".join(result.content for result in results)
+
+        await self.publish_message(
+            AssistantResponse(content=result, source=self.id.type),
+            DefaultTopicId(type="user_response")
+        )
+        return result
+
+    def system_message_for(self, content: str) -> str:
+        """Planning prompt listing only the registry entries most relevant to the task."""
+        return routing_system_message(relevant_agents(content)) + PLANNING_INSTRUCTIONS
+
+    async def dispatch(self, plan: TaskPlan, ctx: MessageContext) -> List[TaskResult]:
+        """
+        Run the sub-tasks of a plan, each as soon as the sub-tasks it depends on are done.
+
+        A sub-task whose dependency failed is skipped and reported as failed, so the failure
+        propagates to everything downstream of it. When the plan has several sub-tasks, each
+        result is also published as a partial response.
+
+        Args:
+            plan (TaskPlan): Sub-tasks returned by the planner
+            ctx (MessageContext): Context of the routed message
+
+        Returns:
+            List[TaskResult]: Result of every sub-task, in plan order
+        """
+        runs: List[asyncio.Task] = []
+
+        def describe(task: SubTask) -> str:
+            return task.agent_type.value.replace('_', ' ')
+
+        async def run(index: int, task: SubTask) -> TaskResult:
+            # Only earlier sub-tasks can be awaited, which rules out dependency cycles.
+            dependencies = [i for i in sorted(set(task.depends_on)) if 0 <= i < index]
+            dependency_results = await asyncio.gather(*(runs[i] for i in dependencies))
+            failed = [plan.tasks[i] for i, dependency in zip(dependencies, dependency_results) if not dependency.ok]
+            if failed:
+                logger.warning("Skipping sub-task %s, its dependencies failed", task.agent_type.value)
+                result = TaskResult(content=f"Skipped: did not {describe(task)} because the step to "
+                                            f"{' and '.join(map(describe, failed))} failed.", ok=False)
+            else:
+                content = task.instruction
+                if dependency_results:
+                    content += "\n\nResults of the previous steps:\n" + "\n".join(
+                        dependency.content for dependency in dependency_results)
+                try:
+                    result = await self.send_message(
+                        EndUserMessage(content=content, source=self.id.type),
+                        AgentId(task.agent_type.value, "default"),
+                        cancellation_token=ctx.cancellation_token
+                    )
+                except Exception as e:
+                    logger.error("Sub-task %s failed: %s", task.agent_type.value, e)
+                    result = TaskResult(content=f"Failed to {describe(task)}.", ok=False)
+            if len(plan.tasks) > 1:
+                # Stream each sub-task result to clients that can show it before the plan completes.
+                await self.publish_message(
+                    AssistantResponse(content=result.content, source=task.agent_type.value, partial=True),
+                    DefaultTopicId(type="user_response")
+                )
+            return result
 
-        return "Sorry, I couldn't determine which agent should handle this task."
+        for index, task in enumerate(plan.tasks):
+            runs.append(asyncio.create_task(run(index, task)))
+        return list(await asyncio.gather(*runs))
@@ -1,20 +1,58 @@
+import asyncio
+import os
+import secrets
+from contextlib import asynccontextmanager
+from typing import List, Optional
 from uuid import UUID, uuid4
 
 import uvicorn
 from autogen_core import DefaultTopicId
-from autogen_ext.models.openai import OpenAIChatCompletionClient
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.openapi.models import Response
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response, WebSocket, WebSocketDisconnect, \
+    status
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi_sessions.backends.implementations import InMemoryBackend
 from fastapi_sessions.frontends.implementations import CookieParameters, SessionCookie
+from itsdangerous import BadSignature
+from pydantic import ValidationError
 
-from automated_ai_assistant.agent.utils import load_api_key
 from automated_ai_assistant.model.data_types import EndUserMessage, SessionData, ChatRequest
 from automated_ai_assistant.oltp_tracing import logger
 from automated_ai_assistant.session_verifier import BasicVerifier
+from automated_ai_assistant.utils.deadline_utils import Deadline, request_timeout, run_until_idle
+from automated_ai_assistant.utils.google_utils import active_user, DEFAULT_USER
+from automated_ai_assistant.utils.metrics_utils import metrics_snapshot
+from automated_ai_assistant.utils.model_policy_utils import model_policy
+from automated_ai_assistant.utils.profiling_utils import phase, ProfilingMiddleware, sampler
+from automated_ai_assistant.utils.reminder_utils import reminder_backend, reminder_scheduler
+from automated_ai_assistant.utils.replay_utils import cassette_recorder, RecordingChatCompletionClient
 from automated_ai_assistant.utils.runtime_utils import initialize_agent_runtime
+from automated_ai_assistant.utils.warmup_utils import warm_up, warmup_state
+from automated_ai_assistant.utils.websocket_utils import connection_manager, SenderStopped, websocket_messages
 
-app = FastAPI()
+
+async def run_warm_up():
+    try:
+        await warm_up(model_policy())
+    except Exception as e:
+        warmup_state.steps["model_policy"] = {"status": "failed", "error": str(e)}
+        logger.error("Warm-up failed: %s", e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background so liveness is answered while readiness waits for it.
+    warmup_task = asyncio.create_task(run_warm_up())
+    # Reminders that fell due while the process was down are fired as soon as the scheduler starts.
+    scheduler = reminder_scheduler() if reminder_backend() == "local" else None
+    if scheduler is not None:
+        scheduler.start()
+    yield
+    warmup_task.cancel()
+    if scheduler is not None:
+        await scheduler.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get("/")
@@ -22,6 +60,51 @@ def check_health():
     return "Alive"
 
 
+@app.get("/ready")
+def check_ready():
+    return JSONResponse(warmup_state.to_dict(), status_code=200 if warmup_state.ready else 503)
+
+
+@app.get("/metrics")
+def get_metrics():
+    return metrics_snapshot()
+
+
+def is_admin(token: Optional[str]) -> bool:
+    admin_token = os.environ.get("ASSISTANT_ADMIN_TOKEN")
+    return bool(admin_token and token and secrets.compare_digest(token, admin_token))
+
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+app.add_middleware(ProfilingMiddleware, is_admin=is_admin)
+
+
+@app.post("/admin/profiling", dependencies=[Depends(require_admin)])
+def start_profiling(seconds: float = 30.0):
+    sampler.open_window(seconds)
+    return f"profiling enabled for {seconds} seconds"
+
+
+@app.delete("/admin/profiling", dependencies=[Depends(require_admin)])
+def stop_profiling():
+    sampler.close_window()
+    return "profiling disabled"
+
+
+@app.get("/admin/profiling/flamegraph", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+def get_flamegraph(reset: bool = False):
+    return sampler.collapsed(reset=reset)
+
+
+@app.get("/admin/profiling/requests", dependencies=[Depends(require_admin)])
+def get_request_profiles():
+    return list(sampler.profiles)
+
+
 cookie_params = CookieParameters()
 
 cookie = SessionCookie(
@@ -41,6 +124,22 @@ verifier = BasicVerifier(
     auth_http_exception=HTTPException(status_code=403, detail="invalid session"),
 )
 
+# Same cookie, but anonymous requests fall back to the default Google account.
+optional_cookie = SessionCookie(
+    cookie_name="cookie",
+    identifier="optional_verifier",
+    auto_error=False,
+    secret_key="DONOTUSE",
+    cookie_params=cookie_params,
+)
+
+optional_verifier = BasicVerifier(
+    identifier="optional_verifier",
+    auto_error=False,
+    backend=backend,
+    auth_http_exception=HTTPException(status_code=403, detail="invalid session"),
+)
+
 
 @app.post("/create_session/{name}")
 async def create_session(name: str, response: Response):
@@ -58,29 +157,150 @@ async def whoami(session_data: SessionData = Depends(verifier)):
     return session_data
 
 
-@app.post("/chat")
-async def chat(request: ChatRequest):
+async def watch_disconnect(request: Request, deadline: Deadline, interval: float = 0.5):
+    """Cancel the remaining work of a request as soon as its client disconnects."""
+    while not deadline.is_cancelled():
+        if await request.is_disconnected():
+            deadline.abandon()
+            return
+        await asyncio.sleep(interval)
+
+
+@app.post("/chat", dependencies=[Depends(optional_cookie)])
+async def chat(request: ChatRequest, raw_request: Request,
+               session_data: Optional[SessionData] = Depends(optional_verifier),
+               x_request_timeout: Optional[float] = Header(default=None)):
+    recorder = cassette_recorder()
+    interaction = None
+    deadline = Deadline(request_timeout(x_request_timeout), label="/chat")
+    watcher = asyncio.create_task(watch_disconnect(raw_request, deadline))
     try:
-        api_key = load_api_key()
-        model_client = OpenAIChatCompletionClient(
-            api_key=api_key,
-            model="gpt-4",
-            temperature=0.2
-        )
-        runtime = await initialize_agent_runtime(model_client=model_client)
+        username = session_data.username if session_data else DEFAULT_USER
+        active_user.set(username)
+        policy = model_policy()
+
+        if recorder is not None:
+            interaction = recorder.start(request.message, username)
+            policy = policy.with_clients(lambda client: RecordingChatCompletionClient(client, interaction))
 
-        response = await runtime.publish_message(
+        responses: asyncio.Queue = asyncio.Queue()
+        with phase("runtime.initialize"):
+            runtime = await initialize_agent_runtime(model_policy=policy, response_queue=responses)
+
+        await runtime.publish_message(
             message=EndUserMessage(content=request.message, source="user"),
-            topic_id=DefaultTopicId(type="chat_agent")
+            topic_id=DefaultTopicId(type="chat_agent"),
+            cancellation_token=deadline
         )
-        await runtime.stop_when_idle()
+        if not await run_until_idle(runtime, deadline) and deadline.reason == "deadline":
+            return JSONResponse("Request deadline exceeded.", status_code=504)
 
-        return response
+        replies = [responses.get_nowait() for _ in range(responses.qsize())]
+        return "\n".join(reply.content for reply in replies if not reply.partial)
 
     except Exception as e:
-        logger.error(f"Error handling message: {str(e)}")
+        logger.error("Error handling message: %s", e)
         return "Failed to handle message."
 
+    finally:
+        watcher.cancel()
+        deadline.close()
+        if interaction is not None:
+            recorder.finish(interaction)
+
+
+async def websocket_session(websocket: WebSocket) -> Optional[SessionData]:
+    """Resolve the session of a WebSocket handshake from the same signed cookie as the HTTP routes."""
+    signed_session_id = websocket.cookies.get(cookie.model.name)
+    if not signed_session_id:
+        return None
+    try:
+        session_id = UUID(cookie.signer.loads(signed_session_id, max_age=cookie.cookie_params.max_age))
+    except (BadSignature, ValueError):
+        return None
+    session_data = await backend.read(session_id)
+    if session_data is None or not session_data.username:
+        return None
+    return session_data
+
+
+async def close_quietly(websocket: WebSocket, code: int):
+    """Close a socket that may already be broken."""
+    try:
+        await websocket.close(code=code)
+    except Exception as e:
+        logger.warning("Failed to close WebSocket: %s", e)
+
+
+@app.websocket("/ws/chat")
+async def websocket_chat(websocket: WebSocket):
+    """
+    Chat over a persistent connection bound to the session.
+
+    The session is resolved and the agent runtime started once per connection. Every agent
+    response is streamed as a `{"type": "partial" | "response", "content", "source"}` frame as
+    soon as it is published, and server pushes go through `connection_manager().push`. All
+    frames share the bounded outbox of the connection; if its sender fails, the socket is
+    closed with code 1011.
+    """
+    session_data = await websocket_session(websocket)
+    if session_data is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="invalid session")
+        return
+
+    connections = connection_manager()
+    connection = connections.connect(websocket, session_data.username)
+    if connection is None:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="too many connections")
+        return
+
+    runtime = None
+    deadlines: List[Deadline] = []
+    try:
+        await websocket.accept()
+        active_user.set(session_data.username)
+        runtime = await initialize_agent_runtime(model_policy=model_policy(), response_queue=connection.outbox)
+        connection.start()
+
+        while True:
+            try:
+                request = ChatRequest.model_validate_json(await connection.receive_text())
+            except ValidationError:
+                websocket_messages.add(outcome="invalid")
+                await connection.send({"type": "error", "detail": "expected {\"message\": \"...\"}"})
+                continue
+            if not connection.message_rate.try_acquire():
+                websocket_messages.add(outcome="rate_limited")
+                await connection.send({"type": "error", "detail": "rate limit exceeded"})
+                continue
+            websocket_messages.add(outcome="accepted")
+            deadline = Deadline(request_timeout(), label="/ws/chat")
+            deadlines = [pending for pending in deadlines if pending.remaining() > 0] + [deadline]
+            await runtime.publish_message(
+                message=EndUserMessage(content=request.message, source="user"),
+                topic_id=DefaultTopicId(type="chat_agent"),
+                cancellation_token=deadline
+            )
+
+    except WebSocketDisconnect:
+        pass
+
+    except SenderStopped as e:
+        logger.error("%s", e)
+        await close_quietly(websocket, status.WS_1011_INTERNAL_ERROR)
+
+    except Exception as e:
+        logger.error("Error handling WebSocket chat: %s", e)
+
+    finally:
+        connections.disconnect(connection)
+        for deadline in deadlines:
+            deadline.abandon()
+            deadline.close()
+        if runtime is not None:
+            await runtime.stop()
+        await connection.close()
+
 
 @app.post("/delete_session")
 async def del_session(response: Response, session_id: UUID = Depends(cookie)):
@@ -1,6 +1,6 @@
 from datetime import datetime
 from enum import Enum
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel, EmailStr
 
@@ -16,7 +16,7 @@ class EndUserMessage(BaseModel):
 
 class SessionData(BaseModel):
     username: str
-    messages: List[EndUserMessage]
+    messages: List[EndUserMessage] = []
 
 
 class Intent(BaseModel):
@@ -47,3 +47,35 @@ class AgentEnum(str, Enum):
     SCHEDULE_MEETING = "schedule_meeting"
     SET_REMINDER = "set_reminder"
     SEND_EMAIL = "send_email"
+
+
+class TaskRoute(BaseModel):
+    agent_type: AgentEnum
+
+
+class SubTask(BaseModel):
+    agent_type: AgentEnum
+    instruction: str
+    depends_on: List[int]
+
+
+class TaskPlan(BaseModel):
+    tasks: List[SubTask]
+
+
+class TaskResult(BaseModel):
+    """Outcome of a sub-task handled by a specialized agent."""
+    content: str
+    ok: bool = True
+
+
+class AssistantResponse(BaseModel):
+    content: str
+    source: str
+    partial: bool = False
+
+
+class NextAction(BaseModel):
+    reply: str
+    intent: Optional[AgentEnum]
+    prompt_to_task_router: Optional[str]
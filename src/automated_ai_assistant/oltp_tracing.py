@@ -1,4 +1,12 @@
+import atexit
+import json
 import logging
+import os
+import random
+import re
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue
+from typing import Any, Mapping
 
 from opentelemetry import metrics, trace
 from opentelemetry._logs import set_logger_provider
@@ -12,6 +20,7 @@ from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
 from opentelemetry.sdk.resources import SERVICE_NAME, Resource
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from pydantic import BaseModel
 
 
 def simple_logger():
@@ -23,23 +32,104 @@ def simple_logger():
     return logging
 
 
+EMAIL_PATTERN = re.compile(r"([\w.+-])[\w.+-]*(@[\w-]+(?:\.[\w-]+)+)")
+REDACTED_FIELDS = {'recipients', 'attendees', 'body', 'description'}
+
+# Pass as `extra=VERBOSE` on records carrying full payloads so they are sampled.
+VERBOSE = {'verbose': True}
+
+
+def _redact_value(name: str, value: Any) -> Any:
+    if name not in REDACTED_FIELDS:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [EMAIL_PATTERN.sub(r"\1***\2", str(item)) for item in value]
+    return f"<redacted {len(str(value))} chars>"
+
+
+def redact(value: Any) -> Any:
+    """Redact recipients and bodies from pydantic payloads and JSON strings before they are logged."""
+    if isinstance(value, BaseModel):
+        fields = {name: _redact_value(name, redact(field)) for name, field in value}
+        return f"{type(value).__name__}({', '.join(f'{name}={field!r}' for name, field in fields.items())})"
+    if isinstance(value, str) and value.lstrip().startswith('{'):
+        try:
+            payload = json.loads(value)
+        except ValueError:
+            return value
+        if isinstance(payload, dict):
+            return json.dumps({name: _redact_value(name, field) for name, field in payload.items()})
+    return value
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of the records marked as verbose payloads."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'verbose', False):
+            return True
+        return random.random() < self.rate
+
+
+class RedactionFilter(logging.Filter):
+    """Format the record once, masking email addresses and redacted payload fields."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        try:
+            message = str(record.msg)
+            if isinstance(record.args, Mapping):
+                message = message % {name: redact(arg) for name, arg in record.args.items()}
+            elif record.args:
+                message = message % tuple(redact(arg) for arg in record.args)
+        except Exception:
+            # Leave a record that does not format untouched, its handler reports the error
+            # instead of the exception stopping the listener thread.
+            return True
+        record.msg = EMAIL_PATTERN.sub(r"\1***\2", message)
+        record.args = None
+        return True
+
+
+class LazyQueueHandler(QueueHandler):
+    """Enqueue records untouched so formatting happens on the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def add_log_handler(handler: logging.Handler):
+    """Attach a handler to the background listener, behind the redaction filter."""
+    handler.addFilter(RedactionFilter())
+    log_listener.handlers = log_listener.handlers + (handler,)
+
+
 def configure_logger():
     logger = logging.getLogger("personal_assistant")
     logger.setLevel(logging.INFO)
+    logger.propagate = False
 
     if not logger.hasHandlers():
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
-        formatter = logging.Formatter(
-            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-        )
-        console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
+        queue_handler = LazyQueueHandler(Queue(-1))
+        queue_handler.addFilter(SamplingFilter(float(os.environ.get('ASSISTANT_LOG_SAMPLE_RATE', '0.1'))))
+        logger.addHandler(queue_handler)
 
     return logger
 
 
 logger = configure_logger()
+log_listener = QueueListener(logger.handlers[0].queue, respect_handler_level=True)
+
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.INFO)
+console_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+add_log_handler(console_handler)
+
+log_listener.start()
+atexit.register(log_listener.stop)
 
 
 def configure_oltp_tracing(
@@ -69,8 +159,9 @@ def configure_oltp_tracing(
     logger_provider.add_log_record_processor(BatchLogRecordProcessor(exporter))
     handler = LoggingHandler(level=logging.NOTSET, logger_provider=logger_provider)
 
-    # Attach OTLP handler to root logger
+    # Attach OTLP handler to root logger, and to the listener for the assistant's own queued records
     logging.getLogger().addHandler(handler)
+    add_log_handler(handler)
 
     # # Suppress INFO logs from 'azure.core.pipeline.policies.http_logging_policy'
     # logging.getLogger("azure.core.pipeline.policies.http_logging_policy").setLevel(
@@ -0,0 +1,153 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from autogen_core import CancellationToken, MessageContext
+
+from automated_ai_assistant.oltp_tracing import logger
+from automated_ai_assistant.utils.metrics_utils import counter
+
+deadline_exceeded = counter("request.deadline_exceeded", "Requests whose remaining work was cancelled at the deadline")
+client_disconnects = counter("request.client_disconnects", "Requests whose remaining work was cancelled "
+                                                           "because the client went away")
+
+# Cancellation token of the message being handled, visible to the worker threads of the handler.
+current_cancellation: ContextVar[Optional[CancellationToken]] = ContextVar("current_cancellation", default=None)
+
+
+class RequestCancelled(Exception):
+    """Raised in blocking code that notices the request it works for was cancelled."""
+
+
+def request_timeout(requested: Optional[float] = None) -> float:
+    """Time budget of a request, `ASSISTANT_REQUEST_TIMEOUT` seconds at most."""
+    limit = float(os.environ.get('ASSISTANT_REQUEST_TIMEOUT', '60'))
+    return min(requested, limit) if requested and requested > 0 else limit
+
+
+class Deadline(CancellationToken):
+    """
+    Cancellation token of one request, cancelled when its time budget runs out.
+
+    Passed as the cancellation token of the message published for the request, it reaches
+    every handler through `MessageContext.cancellation_token`. Cancellations are only counted
+    while a handler is still working on the request.
+
+    Args:
+        seconds (float): Time budget of the request
+        label (str): Name of the entry point, used as metric attribute
+    """
+
+    def __init__(self, seconds: float, label: str):
+        super().__init__()
+        self.label = label
+        self.expires = time.monotonic() + seconds
+        self.reason: Optional[str] = None
+        self._active = 0
+        self._timer = asyncio.get_running_loop().call_later(seconds, self._cancel_for, "deadline")
+
+    @property
+    def active(self) -> bool:
+        return self._active > 0
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    def enter(self):
+        self._active += 1
+
+    def exit(self):
+        self._active -= 1
+
+    def _cancel_for(self, reason: str):
+        if self.is_cancelled():
+            return
+        self.reason = reason
+        if self.active:
+            if reason == "deadline":
+                deadline_exceeded.add(path=self.label)
+            else:
+                client_disconnects.add(path=self.label)
+            logger.warning("Cancelling %s request: %s", self.label, reason)
+        self.cancel()
+
+    def abandon(self):
+        """Cancel the remaining work because the client went away."""
+        self._cancel_for("disconnect")
+
+    def close(self):
+        self._timer.cancel()
+
+
+def cancellable(handler):
+    """
+    Decorator making a message handler stop as soon as its cancellation token is cancelled.
+
+    The handler task is linked to the token, so awaits the token does not reach are
+    cancelled too. A call already running in a worker thread, such as a Google API call,
+    still completes, it is only no longer awaited: the token is published in
+    `current_cancellation` so blocking code checks it with `check_cancelled()` before
+    any call with side effects.
+    """
+
+    @functools.wraps(handler)
+    async def wrapper(self, message, ctx: MessageContext):
+        token = ctx.cancellation_token
+        token.link_future(asyncio.current_task())
+        current_cancellation.set(token)
+        if isinstance(token, Deadline):
+            token.enter()
+        try:
+            return await handler(self, message, ctx)
+        finally:
+            if isinstance(token, Deadline):
+                token.exit()
+
+    return wrapper
+
+
+def check_cancelled():
+    """Raise `RequestCancelled` if the message being handled was cancelled."""
+    token = current_cancellation.get()
+    if token is not None and token.is_cancelled():
+        raise RequestCancelled("request cancelled")
+
+
+def sleep(seconds: float):
+    """Blocking sleep that ends early, raising `RequestCancelled`, when the handled message is cancelled."""
+    token = current_cancellation.get()
+    if token is None:
+        time.sleep(seconds)
+        return
+    woken = threading.Event()
+    token.add_callback(woken.set)
+    woken.wait(seconds)
+    check_cancelled()
+
+
+async def run_until_idle(runtime, deadline: Optional[Deadline] = None, grace: float = 5.0) -> bool:
+    """
+    Stop the runtime once idle, waiting no longer than the deadline plus `grace` seconds.
+
+    At the deadline the token cancels every handler working on the request, so the runtime
+    normally drains within the grace period. When it does not, its message loop is stopped
+    and handlers ignoring the cancellation are left to finish on their own.
+
+    Returns:
+        bool: Whether the runtime drained before the deadline
+    """
+    if deadline is None:
+        await runtime.stop_when_idle()
+        return True
+    idle = asyncio.ensure_future(runtime.stop_when_idle())
+    done, _ = await asyncio.wait({idle}, timeout=deadline.remaining() + grace)
+    if not done:
+        logger.error("Runtime of a %s request did not drain after cancellation", deadline.label)
+        # Stopping ends the loop `stop_when_idle` waits on, so both return.
+        await runtime.stop()
+        await idle
+    return not deadline.is_cancelled()
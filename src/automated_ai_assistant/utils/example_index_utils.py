@@ -0,0 +1,100 @@
+import math
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Generic, List, Optional, Sequence, Tuple, TypeVar
+
+from automated_ai_assistant.utils.registry_utils import AgentRegistry
+
+T = TypeVar("T")
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can for from i in is it me my of on or please the to with you your".split()
+)
+
+
+def features(text: str) -> Counter:
+    """
+    Sparse bag of words and character trigrams of `text`.
+
+    Trigrams let morphological variants such as "remind" and "reminder" match without a stemmer.
+    """
+    bag: Counter = Counter()
+    for word in WORD_PATTERN.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        bag[word] += 1
+        padded = f"#{word}#"
+        for i in range(len(padded) - 2):
+            bag[padded[i:i + 3]] += 0.5
+    return bag
+
+
+def _normalize(vector: Dict[str, float]) -> Dict[str, float]:
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    return {key: value / norm for key, value in vector.items()} if norm else {}
+
+
+class ExampleIndex(Generic[T]):
+    """
+    In-memory TF-IDF index returning the entries most similar to a message.
+
+    Built once from the entry texts, with no model download or network access. Queries cost
+    a pass over the entries, which stays in the microseconds for the few hundred entries a
+    registry and example set reach.
+
+    Args:
+        entries (Sequence[Tuple[str, T]]): Text used for matching and the entry it stands for
+    """
+
+    def __init__(self, entries: Sequence[Tuple[str, T]]):
+        self.entries = [entry for _, entry in entries]
+        bags = [features(text) for text, _ in entries]
+        document_frequency: Counter = Counter()
+        for bag in bags:
+            document_frequency.update(bag.keys())
+        self._idf = {term: math.log((1 + len(bags)) / (1 + count)) + 1 for term, count in document_frequency.items()}
+        self._vectors = [self._vector(bag) for bag in bags]
+
+    def _vector(self, bag: Counter) -> Dict[str, float]:
+        return _normalize({term: (1 + math.log(count)) * self._idf[term]
+                           for term, count in bag.items() if term in self._idf and count > 0})
+
+    def search(self, query: str, k: int) -> List[T]:
+        """Return the `k` entries most similar to `query`, most similar first."""
+        vector = self._vector(features(query))
+        scores = [
+            (sum(weight * entry_vector.get(term, 0.0) for term, weight in vector.items()), index)
+            for index, entry_vector in enumerate(self._vectors)
+        ]
+        # Ties, including queries sharing no term with any entry, keep the original entry order.
+        scores.sort(key=lambda score: (-score[0], score[1]))
+        return [self.entries[index] for _, index in scores[:k]]
+
+
+def prompt_top_k(default: int) -> int:
+    return int(os.environ.get('ASSISTANT_PROMPT_TOP_K', default))
+
+
+@lru_cache(maxsize=None)
+def registry_index() -> ExampleIndex:
+    """Index of the specialized agents of the registry, matched on their description and examples."""
+    agents = [(name, entry) for name, entry in AgentRegistry().agents.items() if entry['agent_type'] != 'task_router']
+    return ExampleIndex([(f"{name} {entry['description']} {entry['examples']}", (name, entry))
+                         for name, entry in agents])
+
+
+def relevant_agents(message: str, k: Optional[int] = None) -> Dict[str, dict]:
+    """
+    Registry entries of the `k` agents most relevant to `message`.
+
+    Args:
+        message (str): Task or user message
+        k (int): Number of entries, `ASSISTANT_PROMPT_TOP_K` or 3 by default
+
+    Returns:
+        dict: Subset of `AgentRegistry.agents`
+    """
+    return dict(registry_index().search(message, k or prompt_top_k(3)))
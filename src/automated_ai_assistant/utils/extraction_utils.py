@@ -0,0 +1,265 @@
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import EmailStr, TypeAdapter, ValidationError
+
+MONTHS = {
+    'january': 1, 'jan': 1,
+    'february': 2, 'feb': 2,
+    'march': 3, 'mar': 3,
+    'april': 4, 'apr': 4,
+    'may': 5,
+    'june': 6, 'jun': 6,
+    'july': 7, 'jul': 7,
+    'august': 8, 'aug': 8,
+    'september': 9, 'sep': 9, 'sept': 9,
+    'october': 10, 'oct': 10,
+    'november': 11, 'nov': 11,
+    'december': 12, 'dec': 12,
+}
+
+_MONTH = r"(?P<month>" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\.?"
+_DAY = r"(?P<day>\d{1,2})(?:st|nd|rd|th)?"
+_YEAR = r"(?P<year>\d{4})"
+
+ISO_DATETIME_PATTERN = re.compile(r"\b(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}(?::\d{2})?)\b")
+DATE_PATTERNS = [
+    re.compile(r"\b" + _DAY + r"\s+(?:of\s+)?" + _MONTH + r",?\s+" + _YEAR + r"\b", re.IGNORECASE),
+    re.compile(r"\b" + _MONTH + r"\s+" + _DAY + r",?\s+" + _YEAR + r"\b", re.IGNORECASE),
+    re.compile(r"\b(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})\b"),
+]
+TIME_PATTERNS = [
+    re.compile(r"\b(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<meridiem>[ap])\.?m\b\.?", re.IGNORECASE),
+    re.compile(r"\b(?:at\s+)(?P<hour>[01]?\d|2[0-3]):(?P<minute>\d{2})\b(?!\s*[ap]\.?m\b)", re.IGNORECASE),
+]
+DURATION_PATTERN = re.compile(
+    r"\b(?P<amount>\d+(?:\.\d+)?|an?|one|half an)\s*(?P<unit>hours?|hrs?|minutes?|mins?)\b",
+    re.IGNORECASE
+)
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+
+# A labelled value needs an explicit delimiter: `title: Sync` or `title "Sync"`.
+_QUOTED = r"\"[^\"]+\"|'[^']+'|“[^”]+”"
+_LABELLED = r"\b(?:{labels})\b(?:(?:\s*:\s*|(?:\s+(?:is|as|of))?\s*)(?P<quoted>" + _QUOTED + r")|\s*:\s*(?P<value>\S.*))"
+# Unquoted values end at punctuation, at another label and where a date, time, duration or email starts.
+_BOUNDARY = r"[,;\n]|\.(?=\s|$)|\b(?:(?:with|and)\s+)?(?:the\s+|a\s+)?(?:{others})\b"
+_OTHER_LABEL = r"(?:(?:with|and)\s+)?(?:the\s+|a\s+)?(?:{others})\b"
+_TRAILING_CONNECTORS = re.compile(r"(?:\s+(?:on|at|for|by|with|and))+\s*$", re.IGNORECASE)
+_LEADING_CONNECTORS = re.compile(r"^(?:(?:on|at|for|by|with|and)\s+)+", re.IGNORECASE)
+
+_emails_adapter = TypeAdapter(List[EmailStr])
+
+
+@dataclass
+class Extraction:
+    """
+    Fields resolved locally for a details model, and the ones left to the LLM.
+
+    Free-text fields are only resolved when the user delimited them unambiguously, e.g.
+    `subject: "Lunch"`. Values read with less confidence are kept as `hints` for the prompt,
+    and their fields stay missing.
+    """
+    fields: Dict[str, Any] = field(default_factory=dict)
+    missing: List[str] = field(default_factory=list)
+    hints: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def complete(self) -> bool:
+        return not self.missing
+
+
+def _cut(value: str, others: List[str], long_form: bool = False) -> Tuple[Optional[str], bool]:
+    """
+    Shorten an unquoted value to the text before its first boundary.
+
+    Returns:
+        tuple: The value, and whether it can be trusted. It can when nothing but another label
+            follows it, or for short values such as titles, a date, time, duration or email.
+            Text cut at other punctuation may have been truncated.
+    """
+    ends = [len(value)]
+    boundary = re.compile(_BOUNDARY.format(others="|".join(others)), re.IGNORECASE)
+    for pattern in [boundary, ISO_DATETIME_PATTERN, *DATE_PATTERNS, *TIME_PATTERNS, DURATION_PATTERN, EMAIL_PATTERN]:
+        match = pattern.search(value)
+        if match:
+            ends.append(match.start())
+    end = min(ends)
+    rest = value[end:].lstrip(" ,;.\n")
+    followers = [re.compile(_OTHER_LABEL.format(others="|".join(others)), re.IGNORECASE)]
+    if not long_form:
+        followers += [ISO_DATETIME_PATTERN, *DATE_PATTERNS, *TIME_PATTERNS, DURATION_PATTERN, EMAIL_PATTERN]
+    confident = not rest or any(pattern.match(text) for text in (rest, _LEADING_CONNECTORS.sub("", rest))
+                                for pattern in followers)
+    value = _TRAILING_CONNECTORS.sub("", value[:end]).strip()
+    return (value or None), confident and bool(value)
+
+
+def _labelled_value(text: str, labels: List[str], others: List[str],
+                    long_form: bool = False) -> Tuple[Optional[str], bool]:
+    """
+    Return the value of an explicitly labelled phrase such as `title: X` or `titled "X"`.
+
+    Args:
+        text (str): Request text
+        labels (list): Labels introducing the value
+        others (list): Labels of the other free-text fields, ending an unquoted value
+        long_form (bool): Whether the value is free prose, e.g. a body, that may contain dates
+
+    Returns:
+        tuple: The value or None, and whether it can be trusted without the LLM
+    """
+    match = re.search(_LABELLED.format(labels="|".join(labels)), text, re.IGNORECASE)
+    if not match:
+        return None, False
+    quoted = match.group('quoted')
+    if quoted:
+        value = quoted[1:-1].strip()
+        return (value or None), bool(value)
+    return _cut(match.group('value'), others, long_form)
+
+
+def _unique(values: List[Any]) -> Optional[Any]:
+    """Return the only distinct value, or None when there are zero or several."""
+    distinct = set(values)
+    return distinct.pop() if len(distinct) == 1 else None
+
+
+def extract_datetime(text: str) -> Optional[datetime]:
+    """
+    Resolve a single absolute date and time from the text.
+
+    Only explicit dates with a year are accepted ("3rd January 2025", "January 3, 2025",
+    "2025-01-03") together with one time of day ("3PM", "10:00 AM", "at 15:30").
+    Relative or ambiguous expressions are left to the LLM.
+    """
+    iso = _unique(ISO_DATETIME_PATTERN.findall(text))
+    if iso:
+        try:
+            return datetime.fromisoformat(f"{iso[0]}T{iso[1]}")
+        except ValueError:
+            return None
+
+    dates = []
+    for pattern in DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            month = match.group('month')
+            month = int(month) if month.isdigit() else MONTHS[month.lower().rstrip('.')]
+            dates.append((int(match.group('year')), month, int(match.group('day'))))
+
+    times = []
+    for pattern in TIME_PATTERNS:
+        for match in pattern.finditer(text):
+            hour = int(match.group('hour'))
+            minute = int(match.group('minute') or 0)
+            meridiem = match.groupdict().get('meridiem')
+            if meridiem:
+                if not 1 <= hour <= 12:
+                    continue
+                hour = hour % 12 + (12 if meridiem.lower() == 'p' else 0)
+            times.append((hour, minute))
+
+    date, time = _unique(dates), _unique(times)
+    if date is None or time is None:
+        return None
+    try:
+        return datetime(*date, *time)
+    except ValueError:
+        return None
+
+
+def extract_duration(text: str) -> Optional[timedelta]:
+    """Resolve a duration such as "1 hour", "30 mins" or "1 hour and 30 minutes"."""
+    matches = list(DURATION_PATTERN.finditer(text))
+    if not matches:
+        return None
+
+    # Several amounts are only accepted as one compound phrase ("1 hour 30 minutes").
+    for previous, current in zip(matches, matches[1:]):
+        if text[previous.end():current.start()].strip().lower() not in ('', 'and'):
+            return None
+
+    total = timedelta()
+    for match in matches:
+        amount = match.group('amount').lower()
+        value = {'a': 1.0, 'an': 1.0, 'one': 1.0, 'half an': 0.5}.get(amount)
+        value = float(amount) if value is None else value
+        unit = match.group('unit').lower()
+        total += timedelta(hours=value) if unit.startswith('h') else timedelta(minutes=value)
+    return total if total > timedelta() else None
+
+
+def extract_emails(text: str) -> List[str]:
+    """Return the valid email addresses in the text, in order of appearance."""
+    candidates = list(dict.fromkeys(address.rstrip('.') for address in EMAIL_PATTERN.findall(text)))
+    if not candidates:
+        return []
+    try:
+        return [str(address) for address in _emails_adapter.validate_python(candidates)]
+    except ValidationError:
+        return []
+
+
+def _build(fields: Dict[str, Any], labelled: Dict[str, Tuple[Optional[str], bool]], required: List[str]) -> Extraction:
+    resolved = {name: value for name, value in fields.items() if value not in (None, [], '')}
+    resolved.update({name: value for name, (value, confident) in labelled.items() if value and confident})
+    return Extraction(fields=resolved, missing=[name for name in required if name not in resolved],
+                      hints={name: value for name, (value, confident) in labelled.items() if value and not confident})
+
+
+MEETING_SUMMARY_LABELS = ['title', 'titled', 'summary', 'subject']
+MEETING_DESCRIPTION_LABELS = ['description', 'agenda', 'body']
+
+
+def extract_meeting_details(text: str) -> Extraction:
+    """Pre-extract `MeetingDetails` fields from a meeting request."""
+    start_time = extract_datetime(text)
+    duration = extract_duration(text)
+    return _build({
+        'start_time': start_time,
+        'end_time': start_time + duration if start_time and duration else None,
+        'attendees': extract_emails(text),
+    }, {
+        'summary': _labelled_value(text, MEETING_SUMMARY_LABELS, MEETING_DESCRIPTION_LABELS),
+        'description': _labelled_value(text, MEETING_DESCRIPTION_LABELS, MEETING_SUMMARY_LABELS, long_form=True),
+    }, ['start_time', 'end_time', 'summary', 'description', 'attendees'])
+
+
+def extract_reminder_details(text: str) -> Extraction:
+    """Pre-extract `ReminderDetails` fields from a reminder request."""
+    title = _labelled_value(text, ['title', 'titled'], ['description'])
+    if title[0] is None:
+        # An unlabelled title is only a hint, the LLM still phrases it.
+        match = re.search(r"\bremind\s+me\s+to\s+(?P<value>.+)", text, re.IGNORECASE)
+        if match:
+            title = _cut(match.group('value'), ['description', 'title', 'titled', 'tomorrow', 'today'])[0], False
+    return _build({
+        'reminder_time': extract_datetime(text),
+    }, {
+        'title': title,
+        'description': _labelled_value(text, ['description'], ['title', 'titled'], long_form=True),
+    }, ['title', 'description', 'reminder_time'])
+
+
+def extract_email_details(text: str) -> Extraction:
+    """Pre-extract `EmailDetails` fields from an email request."""
+    return _build({
+        'recipients': extract_emails(text),
+    }, {
+        'subject': _labelled_value(text, ['subject', 'title'], ['body']),
+        'body': _labelled_value(text, ['body'], ['subject', 'title'], long_form=True),
+    }, ['subject', 'body', 'recipients'])
+
+
+def narrow_prompt(extraction: Extraction) -> str:
+    """Describe the already-resolved fields so the LLM only works on the missing slots."""
+    prompt = ""
+    if extraction.fields:
+        resolved = {name: value.isoformat() if isinstance(value, datetime) else value
+                    for name, value in extraction.fields.items()}
+        prompt += (f"\nThe following fields were already resolved and must not be changed: {resolved}"
+                   f"\nOnly determine the missing fields: {', '.join(extraction.missing)}")
+    if extraction.hints:
+        prompt += f"\nValues read from the message, use them unless they are clearly wrong: {extraction.hints}"
+    return prompt
@@ -1,64 +1,195 @@
-import logging
+import argparse
+import hashlib
+import json
 import os
 import os.path
-import pickle
+from collections import OrderedDict
+from contextvars import ContextVar
 from datetime import timedelta
+from threading import Lock
+from typing import Any, Callable, List, Optional
 
-from google.auth.transport import Request
+import httplib2
+from cryptography.fernet import Fernet, InvalidToken
+from google.auth.exceptions import RefreshError
 from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 
 from automated_ai_assistant.model.data_types import MeetingDetails, ReminderDetails, EmailDetails
+from automated_ai_assistant.utils.profiling_utils import profiled
+from automated_ai_assistant.utils.quota_utils import execute, execute_batch
 
-logging.basicConfig(level=logging.INFO)
+DEFAULT_USER = "default"
+
+# Username of the session the current request belongs to.
+active_user: ContextVar[str] = ContextVar("active_user", default=DEFAULT_USER)
+
+# Optional factory replacing GoogleAPIInterface for the current request, used by the record/replay harness.
+api_interceptor: ContextVar[Optional[Callable[[str], Any]]] = ContextVar("api_interceptor", default=None)
+
+SCOPES = [
+    'https://www.googleapis.com/auth/calendar',
+    'https://www.googleapis.com/auth/gmail.send',
+    'https://www.googleapis.com/auth/calendar.readonly'
+]
+# Calendar accepts at most 50 calls per batch request.
+CALENDAR_BATCH_SIZE = 50
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class GoogleAuthorizationRequired(Exception):
+    """Raised when a user has no usable credentials and must complete the OAuth consent out of band."""
+
+    def __init__(self, username: str):
+        super().__init__(
+            f"Google account not authorized for user '{username}', "
+            f"run `python -m automated_ai_assistant.utils.google_utils {username}` to authorize"
+        )
+        self.username = username
+
+
+class EncryptedTokenStore:
+    """Per-user OAuth tokens stored on disk, encrypted with Fernet."""
+
+    def __init__(self, directory: str, key: str):
+        self.directory = directory
+        self._fernet = Fernet(key)
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, username: str) -> str:
+        digest = hashlib.sha256(username.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{digest}.token")
+
+    def load(self, username: str) -> Optional[Credentials]:
+        path = self._path(username)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as token:
+            try:
+                info = json.loads(self._fernet.decrypt(token.read()))
+            except InvalidToken:
+                return None
+        return Credentials.from_authorized_user_info(info, SCOPES)
+
+    def save(self, username: str, creds: Credentials):
+        path = self._path(username)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as token:
+            token.write(self._fernet.encrypt(creds.to_json().encode('utf-8')))
+        os.replace(tmp_path, path)
+
+
+class GoogleCredentialCache:
+    """
+    Bounded LRU of decrypted credentials, keyed by username.
+
+    Refreshes are coalesced: concurrent requests for the same user wait on a single
+    refresh and then reuse its result. Only credentials are shared between threads, the
+    Google services are built per `GoogleAPIInterface` since httplib2 is not thread-safe.
+    """
+
+    REFRESH_LOCK_STRIPES = 64
+
+    def __init__(self, store: EncryptedTokenStore, max_size: int = 256):
+        self.store = store
+        self.max_size = max_size
+        self._entries: OrderedDict[str, Credentials] = OrderedDict()
+        self._lock = Lock()
+        self._refresh_locks = [Lock() for _ in range(self.REFRESH_LOCK_STRIPES)]
+
+    def _cached(self, username: str) -> Optional[Credentials]:
+        with self._lock:
+            creds = self._entries.get(username)
+            if creds is not None:
+                self._entries.move_to_end(username)
+            return creds
+
+    def get(self, username: str) -> Credentials:
+        """
+        Valid credentials of a user, refreshed if expired.
+
+        Raises:
+            GoogleAuthorizationRequired: If the user has no token, or its refresh token was revoked
+        """
+        creds = self._cached(username)
+        if creds is not None and creds.valid:
+            return creds
+
+        with self._refresh_locks[hash(username) % self.REFRESH_LOCK_STRIPES]:
+            # Another request may have refreshed the credentials while we were waiting.
+            creds = self._cached(username)
+            if creds is not None and creds.valid:
+                return creds
+
+            if creds is None:
+                creds = self.store.load(username)
+            if creds is None:
+                raise GoogleAuthorizationRequired(username)
+            if not creds.valid:
+                if not (creds.expired and creds.refresh_token):
+                    raise GoogleAuthorizationRequired(username)
+                try:
+                    creds.refresh(Request())
+                except RefreshError as e:
+                    # The refresh token was revoked or expired, only a new consent helps.
+                    self.invalidate(username)
+                    raise GoogleAuthorizationRequired(username) from e
+                self.store.save(username, creds)
+
+            with self._lock:
+                self._entries[username] = creds
+                self._entries.move_to_end(username)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            return creds
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._entries.pop(username, None)
+
+
+_credential_cache: Optional[GoogleCredentialCache] = None
+_credential_cache_lock = Lock()
+
+
+def credential_cache() -> GoogleCredentialCache:
+    """Process-wide credential cache, configured from the environment on first use."""
+    global _credential_cache
+    with _credential_cache_lock:
+        if _credential_cache is None:
+            key = os.environ.get('GOOGLE_TOKEN_STORE_KEY')
+            if not key:
+                raise RuntimeError("GOOGLE_TOKEN_STORE_KEY must be set to a Fernet key to use the Google APIs")
+            store = EncryptedTokenStore(
+                directory=os.environ.get('GOOGLE_TOKEN_STORE_DIR', os.path.join(project_root, '.tokens')),
+                key=key
+            )
+            _credential_cache = GoogleCredentialCache(
+                store,
+                max_size=int(os.environ.get('GOOGLE_CREDENTIAL_CACHE_SIZE', '256'))
+            )
+        return _credential_cache
 
 
 class GoogleAPIInterface:
-    """Interface for handling Google Calendar and Gmail operations."""
-
-    SCOPES = [
-        'https://www.googleapis.com/auth/calendar',
-        'https://www.googleapis.com/auth/gmail.send',
-        'https://www.googleapis.com/auth/calendar.readonly'
-    ]
-    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    """Interface for handling Google Calendar and Gmail operations on behalf of one user."""
+
+    SCOPES = SCOPES
+    project_root = project_root
     credentials_path = os.path.join(project_root, 'credentials.json')
 
-    def __init__(self, credentials_path=credentials_path, token_path='token.pickle'):
-        self.credentials_path = credentials_path
-        self.token_path = token_path
-        self.creds = None
-        self.calendar_service = None
-        self.gmail_service = None
-        self._authenticate()
-
-    def _authenticate(self):
-        """Handle Google API authentication."""
-        if os.path.exists(self.token_path):
-            with open(self.token_path, 'rb') as token:
-                self.creds = pickle.load(token)
-
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                self.creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    self.credentials_path, self.SCOPES)
-                # Explicitly specify local server parameters
-                self.creds = flow.run_local_server(
-                    port=8080,
-                    prompt='consent',
-                    access_type='offline',
-                    include_granted_scopes='true'
-                )
-
-            with open(self.token_path, 'wb') as token:
-                pickle.dump(self.creds, token)
-
-        self.calendar_service = build('calendar', 'v3', credentials=self.creds)
-        self.gmail_service = build('gmail', 'v1', credentials=self.creds)
+    @profiled("GoogleAPIInterface.authenticate")
+    def __init__(self, username: str = DEFAULT_USER):
+        self.username = username
+        self.creds = credential_cache().get(username)
+        # Each interface gets its own connection, services must not share an httplib2.Http across threads.
+        self.calendar_service = build('calendar', 'v3', http=AuthorizedHttp(self.creds, http=httplib2.Http()))
+        self.gmail_service = build('gmail', 'v1', http=AuthorizedHttp(self.creds, http=httplib2.Http()))
 
+    @profiled("GoogleAPIInterface.schedule_meeting")
     def schedule_meeting(self, meeting_details: MeetingDetails):
         """
         Schedule a meeting on Google Calendar.
@@ -86,29 +217,21 @@ class GoogleAPIInterface:
             event['attendees'] = [{'email': email} for email in meeting_details.attendees]
 
         try:
-            event = self.calendar_service.events().insert(
-                calendarId='primary',
-                body=event,
-                sendUpdates='all'
-            ).execute()
+            event = execute(
+                self.calendar_service.events().insert(
+                    calendarId='primary',
+                    body=event,
+                    sendUpdates='all'
+                ),
+                'calendar', 'events.insert', self.username
+            )
             return event
         except Exception as e:
-            raise Exception(f"Failed to schedule meeting: {str(e)}")
-
-    def set_reminder(self, reminder_details: ReminderDetails):
-        """
-        Set a reminder on Google Calendar.
+            raise Exception(f"Failed to schedule meeting: {str(e)}") from e
 
-        Args:
-            reminder_details: Details of the reminder to set
-                title (str): Reminder title
-                description (str): Reminder description
-                reminder_time (datetime): When to send the reminder
-
-        Returns:
-            dict: Created reminder event
-        """
-        event = {
+    @staticmethod
+    def _reminder_event(reminder_details: ReminderDetails) -> dict:
+        return {
             'summary': reminder_details.title,
             'description': reminder_details.description,
             'start': {
@@ -127,15 +250,51 @@ class GoogleAPIInterface:
             }
         }
 
+    @profiled("GoogleAPIInterface.set_reminder")
+    def set_reminder(self, reminder_details: ReminderDetails):
+        """
+        Set a reminder on Google Calendar.
+
+        Args:
+            reminder_details: Details of the reminder to set
+                title (str): Reminder title
+                description (str): Reminder description
+                reminder_time (datetime): When to send the reminder
+
+        Returns:
+            dict: Created reminder event
+        """
         try:
-            reminder = self.calendar_service.events().insert(
-                calendarId='primary',
-                body=event
-            ).execute()
+            reminder = execute(
+                self.calendar_service.events().insert(
+                    calendarId='primary',
+                    body=self._reminder_event(reminder_details)
+                ),
+                'calendar', 'events.insert', self.username
+            )
             return reminder
         except Exception as e:
-            raise Exception(f"Failed to set reminder: {str(e)}")
+            raise Exception(f"Failed to set reminder: {str(e)}") from e
+
+    @profiled("GoogleAPIInterface.set_reminders")
+    def set_reminders(self, reminders: List[ReminderDetails]) -> List[Optional[dict]]:
+        """
+        Create reminder events on Google Calendar with batch requests.
 
+        Args:
+            reminders (List[ReminderDetails]): Reminders to create
+
+        Returns:
+            List[Optional[dict]]: Created event per reminder, in order, None where the insert failed
+        """
+        requests = [
+            self.calendar_service.events().insert(calendarId='primary', body=self._reminder_event(reminder))
+            for reminder in reminders
+        ]
+        return execute_batch(self.calendar_service, requests, 'calendar', 'events.insert', self.username,
+                             batch_size=CALENDAR_BATCH_SIZE)
+
+    @profiled("GoogleAPIInterface.send_email")
     def send_email(self, email_details: EmailDetails):
         """
         Send an email using Gmail API.
@@ -155,18 +314,46 @@ class GoogleAPIInterface:
 
         raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
         try:
-            email = self.gmail_service.users().messages().send(
-                userId='me',
-                body={'raw': raw_message}
-            ).execute()
+            email = execute(
+                self.gmail_service.users().messages().send(
+                    userId='me',
+                    body={'raw': raw_message}
+                ),
+                'gmail', 'messages.send', self.username
+            )
             return email
         except Exception as e:
-            raise Exception(f"Failed to send email: {str(e)}")
+            raise Exception(f"Failed to send email: {str(e)}") from e
 
 
 def google_api_interface():
-    return GoogleAPIInterface()
+    interceptor = api_interceptor.get()
+    if interceptor is not None:
+        return interceptor(active_user.get())
+    return GoogleAPIInterface(active_user.get())
+
+
+def authorize(username: str, credentials_path: str = GoogleAPIInterface.credentials_path):
+    """
+    Run the interactive OAuth consent for a user and store the resulting token.
+
+    Only meant for the command line, the server never starts an interactive flow.
+    """
+    flow = InstalledAppFlow.from_client_secrets_file(credentials_path, SCOPES)
+    creds = flow.run_local_server(
+        port=8080,
+        prompt='consent',
+        access_type='offline',
+        include_granted_scopes='true'
+    )
+    cache = credential_cache()
+    cache.store.save(username, creds)
+    cache.invalidate(username)
 
 
 if __name__ == '__main__':
-    print("Running Google API Interface")
+    parser = argparse.ArgumentParser(description="Authorize a user's Google account for the assistant")
+    parser.add_argument('username', nargs='?', default=DEFAULT_USER)
+    args = parser.parse_args()
+    authorize(args.username)
+    print(f"Stored Google credentials for {args.username}")
@@ -0,0 +1,95 @@
+import math
+from collections import Counter, deque
+from threading import Lock
+from typing import Any, Deque, Dict, List, Union
+
+from opentelemetry import metrics
+
+meter = metrics.get_meter("personal_assistant")
+
+
+class CounterMetric:
+    """OpenTelemetry counter that also keeps in-process totals for the `/metrics` endpoint."""
+
+    def __init__(self, name: str, description: str, unit: str = "1"):
+        self.name = name
+        self.description = description
+        self._counter = meter.create_counter(name, unit=unit, description=description)
+        self._totals: Counter = Counter()
+        self._lock = Lock()
+
+    def add(self, amount: int = 1, **attributes: str):
+        self._counter.add(amount, attributes)
+        key = tuple(sorted(attributes.items()))
+        with self._lock:
+            self._totals[key] += amount
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{'attributes': dict(key), 'value': value} for key, value in self._totals.items()]
+
+
+class HistogramMetric:
+    """
+    OpenTelemetry histogram that also keeps the most recent values per attribute set,
+    so the `/metrics` endpoint can report percentiles.
+    """
+
+    def __init__(self, name: str, description: str, unit: str = "ms", reservoir: int = 1000):
+        self.name = name
+        self.description = description
+        self._histogram = meter.create_histogram(name, unit=unit, description=description)
+        self._reservoir = reservoir
+        self._values: Dict[tuple, Deque[float]] = {}
+        self._counts: Counter = Counter()
+        self._lock = Lock()
+
+    def record(self, value: float, **attributes: str):
+        self._histogram.record(value, attributes)
+        key = tuple(sorted(attributes.items()))
+        with self._lock:
+            self._values.setdefault(key, deque(maxlen=self._reservoir)).append(value)
+            self._counts[key] += 1
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = [(key, sorted(values), self._counts[key]) for key, values in self._values.items()]
+        return [{
+            'attributes': dict(key),
+            'count': count,
+            'p50': values[math.ceil(0.5 * len(values)) - 1],
+            'p95': values[math.ceil(0.95 * len(values)) - 1],
+            'max': values[-1],
+        } for key, values, count in items]
+
+
+_registry: Dict[str, Union[CounterMetric, HistogramMetric]] = {}
+_registry_lock = Lock()
+
+
+def counter(name: str, description: str, unit: str = "1") -> CounterMetric:
+    """Return the counter registered under `name`, creating it on first use."""
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = CounterMetric(name, description, unit)
+        return _registry[name]
+
+
+def histogram(name: str, description: str, unit: str = "ms") -> HistogramMetric:
+    """Return the histogram registered under `name`, creating it on first use."""
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = HistogramMetric(name, description, unit)
+        return _registry[name]
+
+
+def metrics_snapshot() -> Dict[str, Any]:
+    """
+    Snapshot of every registered metric.
+
+    Returns:
+        dict: Metric name mapped to its description and per-attribute values
+    """
+    with _registry_lock:
+        registered = list(_registry.values())
+    return {metric.name: {'description': metric.description, 'values': metric.snapshot()} for metric in registered}
@@ -0,0 +1,221 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from threading import Lock
+from typing import Any, Callable, Dict, Mapping, Optional, Sequence, Tuple
+
+import yaml
+from autogen_core import CancellationToken
+from autogen_core.models import CreateResult, LLMMessage
+from autogen_ext.models.openai import OpenAIChatCompletionClient
+
+from automated_ai_assistant.agent.utils import load_api_key
+from automated_ai_assistant.oltp_tracing import logger
+from automated_ai_assistant.utils.metrics_utils import counter, histogram
+from automated_ai_assistant.utils.structured_output import schema_name
+
+llm_calls = counter("llm.calls", "LLM calls by agent, task, model and routing decision")
+llm_latency = histogram("llm.latency", "Latency of LLM calls by agent and model")
+validation_failures = counter("llm.validation_failures", "LLM outputs failing validation, kept out of model health")
+fallback_trips = counter("llm.fallback_trips", "Models taken out of rotation after crossing a health threshold")
+
+# Small models for routing and extraction, the larger one for open conversation. Tasks are the
+# names of the requested response schemas, rules are looked up as `agent:task`, `agent`, `default`.
+DEFAULT_POLICY = {
+    'tiers': {
+        'small': {'model': 'gpt-4o-mini'},
+        'large': {'model': 'gpt-4o', 'temperature': 0.2},
+    },
+    'rules': {
+        'default': 'small',
+        'chat_agent': 'large',
+        'task_router': 'small',
+        'schedule_meeting': 'small',
+        'send_email': 'small',
+        'set_reminder': 'small',
+    },
+    'escalation': {'small': 'large'},
+    'fallback': {'large': 'small', 'small': 'large'},
+    'health': {
+        'window': 100,
+        'min_samples': 20,
+        'latency_p95_ms': 10000,
+        'error_rate': 0.25,
+        'cooldown': 60,
+    },
+}
+
+
+class ModelHealth:
+    """
+    Rolling latency and error rate of one model.
+
+    The model is taken out of rotation for `cooldown` seconds once its p95 latency or error
+    rate crosses the threshold, then it gets traffic again with an empty window.
+    """
+
+    def __init__(self, model: str, window: int = 100, min_samples: int = 20, latency_p95_ms: float = 10000,
+                 error_rate: float = 0.25, cooldown: float = 60):
+        self.model = model
+        self.min_samples = min_samples
+        self.latency_p95_ms = latency_p95_ms
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self._samples: deque = deque(maxlen=window)
+        self._tripped_until = 0.0
+        self._lock = Lock()
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._tripped_until
+
+    def record(self, latency_ms: float, ok: bool):
+        with self._lock:
+            self._samples.append((latency_ms, ok))
+            if len(self._samples) < self.min_samples:
+                return
+            latencies = sorted(latency for latency, _ in self._samples)
+            p95 = latencies[math.ceil(0.95 * len(latencies)) - 1]
+            errors = sum(1 for _, succeeded in self._samples if not succeeded) / len(self._samples)
+            if p95 <= self.latency_p95_ms and errors <= self.error_rate:
+                return
+            self._tripped_until = time.monotonic() + self.cooldown
+            self._samples.clear()
+        fallback_trips.add(model=self.model)
+        logger.warning("Model %s out of rotation for %ss, p95 %.0fms, error rate %.2f",
+                       self.model, self.cooldown, p95, errors)
+
+
+class ModelPolicy:
+    """
+    Chooses the model tier of every LLM call from the calling agent and task.
+
+    Args:
+        clients (dict): Chat completion client of each tier
+        rules (dict): Tier per `agent:task`, `agent` or `default`
+        escalation (dict): Larger tier used when the output of a tier fails validation
+        fallback (dict): Alternate tier used while a tier's model is out of rotation
+        health (dict): Health of each tier's model, shared by copies of the policy
+    """
+
+    def __init__(self, clients: Dict[str, Any], rules: Mapping[str, str], escalation: Mapping[str, str],
+                 fallback: Mapping[str, str], health: Dict[str, ModelHealth]):
+        self.clients = clients
+        self.rules = rules
+        self.escalation = escalation
+        self.fallback = fallback
+        self.health = health
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any],
+                    client_factory: Callable[[Dict[str, Any]], Any]) -> "ModelPolicy":
+        health_config = config.get('health', {})
+        return cls(
+            clients={tier: client_factory(dict(settings)) for tier, settings in config['tiers'].items()},
+            rules=config['rules'],
+            escalation=config.get('escalation', {}),
+            fallback=config.get('fallback', {}),
+            health={tier: ModelHealth(settings['model'], **health_config)
+                    for tier, settings in config['tiers'].items()},
+        )
+
+    def with_clients(self, wrap: Callable[[Any], Any]) -> "ModelPolicy":
+        """Copy of the policy whose tier clients are wrapped, e.g. for recording, sharing the model health."""
+        return ModelPolicy({tier: wrap(client) for tier, client in self.clients.items()},
+                           self.rules, self.escalation, self.fallback, self.health)
+
+    def tier(self, agent: str, task: str) -> str:
+        return self.rules.get(f"{agent}:{task}") or self.rules.get(agent) or self.rules['default']
+
+    def route(self, agent: str, task: str, escalate: bool = False) -> Tuple[str, str]:
+        """
+        Tier of a call and the decision that selected it.
+
+        Returns:
+            tuple: Tier name and one of `primary`, `escalated` or `fallback`
+        """
+        tier, decision = self.tier(agent, task), "primary"
+        if escalate and tier in self.escalation:
+            tier, decision = self.escalation[tier], "escalated"
+        alternate = self.fallback.get(tier)
+        if not self.health[tier].available and alternate is not None and self.health[alternate].available:
+            tier, decision = alternate, "fallback"
+        return tier, decision
+
+    def client_for(self, agent: str) -> "PolicyChatCompletionClient":
+        return PolicyChatCompletionClient(self, agent)
+
+
+class PolicyChatCompletionClient:
+    """Chat completion client of one agent, dispatching each call to the tier chosen by the policy."""
+
+    def __init__(self, policy: ModelPolicy, agent: str, escalate: bool = False):
+        self.policy = policy
+        self.agent = agent
+        self.escalate = escalate
+
+    def escalated(self) -> "PolicyChatCompletionClient":
+        """Client for the repair of an output that failed validation."""
+        return PolicyChatCompletionClient(self.policy, self.agent, escalate=True)
+
+    async def create(self, messages: Sequence[LLMMessage], tools=[], json_output=None,
+                     extra_create_args: Mapping[str, Any] = {},
+                     cancellation_token: Optional[CancellationToken] = None) -> CreateResult:
+        task = schema_name(extra_create_args.get("response_format")) or "chat"
+        tier, decision = self.policy.route(self.agent, task, self.escalate)
+        client = self.policy.clients[tier]
+        model = self.policy.health[tier].model
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await client.create(messages=messages, tools=tools, json_output=json_output,
+                                         extra_create_args=extra_create_args,
+                                         cancellation_token=cancellation_token)
+            outcome = "ok"
+            return result
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            latency_ms = (time.perf_counter() - started) * 1000
+            if outcome != "cancelled":
+                self.policy.health[tier].record(latency_ms, outcome == "ok")
+            llm_calls.add(agent=self.agent, task=task, model=model, decision=decision, outcome=outcome)
+            llm_latency.record(latency_ms, agent=self.agent, model=model)
+            logger.info("LLM call %s/%s on %s (%s) took %.0fms: %s",
+                        self.agent, task, model, decision, latency_ms, outcome)
+
+    def validation_failed(self, task: str):
+        """Count an output of `task` that failed validation, apart from the errors of the call itself."""
+        tier, decision = self.policy.route(self.agent, task, self.escalate)
+        validation_failures.add(agent=self.agent, task=task, model=self.policy.health[tier].model, decision=decision)
+
+    def __getattr__(self, name: str) -> Any:
+        tier, _ = self.policy.route(self.agent, "chat", self.escalate)
+        return getattr(self.policy.clients[tier], name)
+
+
+def load_policy_config(path: Optional[str] = None) -> Dict[str, Any]:
+    """Policy read from the YAML file at `path` or `ASSISTANT_MODEL_POLICY`, over the defaults."""
+    path = path or os.environ.get('ASSISTANT_MODEL_POLICY')
+    config = {key: dict(value) for key, value in DEFAULT_POLICY.items()}
+    if path:
+        with open(path, 'r') as file:
+            for key, value in (yaml.safe_load(file) or {}).items():
+                config[key] = {**config.get(key, {}), **value}
+    return config
+
+
+_policy: Optional[ModelPolicy] = None
+
+
+def model_policy() -> ModelPolicy:
+    """Process-wide model policy, so every request reuses the same clients and model health."""
+    global _policy
+    if _policy is None:
+        api_key = load_api_key()
+        _policy = ModelPolicy.from_config(load_policy_config(),
+                                          lambda settings: OpenAIChatCompletionClient(api_key=api_key, **settings))
+    return _policy
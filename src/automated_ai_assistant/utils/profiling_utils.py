@@ -0,0 +1,241 @@
+import asyncio
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+PROFILE_HEADER = "x-profile-request"
+
+
+class RequestProfile:
+    """Wall-clock time spent per agent and phase while handling one request."""
+
+    def __init__(self, path: str):
+        self.id = uuid4().hex
+        self.path = path
+        self.started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.phases: List[Tuple[str, float, float]] = []
+
+    def record(self, name: str, start: float, duration: float):
+        self.phases.append((name, start - self.started, duration))
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+    def breakdown(self) -> Dict[str, Any]:
+        totals: Dict[str, Dict[str, float]] = {}
+        for name, _, duration in self.phases:
+            total = totals.setdefault(name, {'count': 0, 'total_ms': 0.0})
+            total['count'] += 1
+            total['total_ms'] += duration * 1000
+        return {
+            'id': self.id,
+            'path': self.path,
+            'total_ms': round((self.duration or 0.0) * 1000, 3),
+            'phases': {name: {**total, 'total_ms': round(total['total_ms'], 3)} for name, total in totals.items()},
+            'timeline': [{'phase': name, 'offset_ms': round(offset * 1000, 3), 'duration_ms': round(duration * 1000, 3)}
+                         for name, offset, duration in self.phases],
+        }
+
+    def server_timing(self) -> str:
+        """Breakdown formatted as a `Server-Timing` header value."""
+        return ", ".join(f"{name.replace(' ', '_')};dur={total['total_ms']}"
+                         for name, total in self.breakdown()['phases'].items())
+
+
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+
+@contextmanager
+def phase(name: str):
+    """Record the enclosed block as `name` on the current request profile, if any."""
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.record(name, start, time.perf_counter() - start)
+
+
+def profiled(name: str):
+    """
+    Decorator recording each call of a function or coroutine function as phase `name`.
+
+    When no request is being profiled the only overhead is one context variable lookup.
+    """
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                profile = current_profile.get()
+                if profile is None:
+                    return await func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    profile.record(name, start, time.perf_counter() - start)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = current_profile.get()
+            if profile is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.record(name, start, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class StackSampler:
+    """
+    Sampling profiler aggregating the stacks of all threads into collapsed-stack format.
+
+    The output (`frame;frame;frame count` per line) can be fed directly to flamegraph.pl,
+    speedscope or inferno. The sampling thread only runs while a profiling window is open
+    or a profiled request is in flight.
+    """
+
+    def __init__(self, interval: float = 0.005, recent_requests: int = 100):
+        self.interval = interval
+        self.profiles: deque = deque(maxlen=recent_requests)
+        self._stacks: Counter = Counter()
+        self._lock = threading.Lock()
+        self._window_until = 0.0
+        self._in_flight = 0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def window_open(self) -> bool:
+        return time.monotonic() < self._window_until
+
+    @property
+    def active(self) -> bool:
+        return self.window_open or self._in_flight > 0
+
+    def open_window(self, seconds: float):
+        with self._lock:
+            self._window_until = max(self._window_until, time.monotonic() + seconds)
+        self._ensure_running()
+
+    def close_window(self):
+        with self._lock:
+            self._window_until = 0.0
+
+    def request_started(self):
+        with self._lock:
+            self._in_flight += 1
+        self._ensure_running()
+
+    def request_finished(self, profile: RequestProfile):
+        with self._lock:
+            self._in_flight -= 1
+            self.profiles.append(profile.breakdown())
+
+    def collapsed(self, reset: bool = False) -> str:
+        with self._lock:
+            lines = [f"{stack} {count}" for stack, count in self._stacks.most_common()]
+            if reset:
+                self._stacks.clear()
+        return "\n".join(lines)
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self.active:
+                    self._thread = None
+                    return
+            self._sample(own_id)
+            time.sleep(self.interval)
+
+    def _sample(self, own_id: int):
+        samples = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                frame = frame.f_back
+            samples.append(";".join(reversed(stack)))
+        with self._lock:
+            self._stacks.update(samples)
+
+
+sampler = StackSampler()
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling HTTP requests while a window is open or an admin asks for it.
+
+    Other requests are passed straight to the app, with their `receive` channel untouched.
+    Profiled responses carry the phase breakdown in `Server-Timing` and the id of the
+    profile kept by the sampler in `X-Profile-Id`.
+
+    Args:
+        app: Wrapped ASGI application
+        is_admin (Callable): Whether an `x-admin-token` header value grants admin access
+        sampler (StackSampler): Sampler recording the profiled requests
+    """
+
+    def __init__(self, app, is_admin: Callable[[Optional[str]], bool], sampler: StackSampler = sampler):
+        self.app = app
+        self.is_admin = is_admin
+        self.sampler = sampler
+
+    def _wanted(self, scope) -> bool:
+        if self.sampler.window_open:
+            return True
+        headers = dict(scope['headers'])
+        return PROFILE_HEADER.encode('latin-1') in headers and \
+            self.is_admin(headers.get(b'x-admin-token', b'').decode('latin-1'))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope['path'])
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message.get('headers', []),
+                                      (b'server-timing', profile.server_timing().encode('latin-1')),
+                                      (b'x-profile-id', profile.id.encode('latin-1'))]
+            await send(message)
+
+        token = current_profile.set(profile)
+        self.sampler.request_started()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            profile.finish()
+            self.sampler.request_finished(profile)
+            current_profile.reset(token)
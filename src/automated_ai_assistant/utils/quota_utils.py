@@ -0,0 +1,296 @@
+import json
+import os
+import random
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from googleapiclient.errors import HttpError
+
+from automated_ai_assistant.oltp_tracing import logger
+from automated_ai_assistant.utils.deadline_utils import check_cancelled, RequestCancelled, sleep
+from automated_ai_assistant.utils.metrics_utils import counter
+from automated_ai_assistant.utils.rate_limit_utils import TokenBucket
+
+quota_units = counter("google.quota.units", "Google API quota units consumed")
+quota_throttled = counter("google.quota.throttled", "Google API calls delayed by a local token bucket")
+quota_wait = counter("google.quota.wait_ms", "Time Google API calls waited for quota", unit="ms")
+api_retries = counter("google.api.retries", "Google API calls retried after a retryable error")
+api_failures = counter("google.api.failures", "Google API calls that failed after the last attempt")
+
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+# Daily limits only reset the next day, retrying within a request cannot succeed.
+DAILY_LIMIT_REASONS = {'quotaExceeded', 'dailyLimitExceeded'}
+
+
+@dataclass(frozen=True)
+class ApiQuota:
+    """
+    Quota of one Google API in units per minute, for the whole project and for each user.
+
+    Defaults follow the documented default quotas and can be overridden with
+    `GOOGLE_QUOTA_<API>_PROJECT_PER_MINUTE` and `GOOGLE_QUOTA_<API>_USER_PER_MINUTE`
+    to match what the project was granted.
+    """
+    project_per_minute: float
+    user_per_minute: float
+
+    @classmethod
+    def from_env(cls, api: str, project_per_minute: float, user_per_minute: float) -> "ApiQuota":
+        prefix = f"GOOGLE_QUOTA_{api.upper()}"
+        return cls(
+            project_per_minute=float(os.environ.get(f"{prefix}_PROJECT_PER_MINUTE", project_per_minute)),
+            user_per_minute=float(os.environ.get(f"{prefix}_USER_PER_MINUTE", user_per_minute)),
+        )
+
+
+# Quota units consumed per call, Gmail charges by method while Calendar charges one unit per query.
+METHOD_COSTS: Dict[Tuple[str, str], int] = {
+    ('gmail', 'messages.send'): 100,
+}
+
+
+class QuotaExhausted(Exception):
+    """Raised when a call would have to wait longer than allowed for quota."""
+
+
+class GoogleQuota:
+    """
+    Per-project and per-user token buckets for the Google APIs, counted in quota units.
+
+    A rate limit reported by Google pauses the bucket that ran out, so concurrent calls for
+    the same user or project back off together instead of each retrying on its own.
+
+    Args:
+        quotas (dict): Quota of each API, keyed by API name
+        max_wait (float): Longest a call may wait for quota before `QuotaExhausted` is raised
+        max_users (int): Per-user buckets kept, least recently used ones are dropped first
+    """
+
+    def __init__(self, quotas: Dict[str, ApiQuota], max_wait: float = 30.0, max_users: int = 10_000):
+        self.quotas = quotas
+        self.max_wait = max_wait
+        self.max_users = max_users
+        # Buckets hold one second of quota, so a burst cannot spend a whole minute at once.
+        self._project = {api: TokenBucket(quota.project_per_minute / 60, quota.project_per_minute / 60)
+                         for api, quota in quotas.items()}
+        self._users: OrderedDict[Tuple[str, str], TokenBucket] = OrderedDict()
+        self._lock = Lock()
+
+    def user_bucket(self, api: str, username: str) -> TokenBucket:
+        key = (api, username)
+        with self._lock:
+            bucket = self._users.get(key)
+            if bucket is None:
+                rate = self.quotas[api].user_per_minute / 60
+                bucket = self._users[key] = TokenBucket(rate, rate)
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(key)
+            return bucket
+
+    def acquire(self, api: str, method: str, username: str, units: int):
+        """
+        Wait until both the project and the user bucket of `api` can pay for `units`.
+
+        Raises:
+            QuotaExhausted: If the wait would exceed `max_wait`
+        """
+        project, user = self._project[api], self.user_bucket(api, username)
+        delay = max(project.reserve(units), user.reserve(units))
+        if delay > self.max_wait:
+            project.refund(units)
+            user.refund(units)
+            quota_throttled.add(api=api, outcome="rejected")
+            raise QuotaExhausted(f"{api} quota exhausted for {username}, next slot in {delay:.1f}s")
+        if delay > 0:
+            quota_throttled.add(api=api, outcome="delayed")
+            quota_wait.add(round(delay * 1000), api=api)
+            try:
+                sleep(delay)
+            except RequestCancelled:
+                project.refund(units)
+                user.refund(units)
+                raise
+        quota_units.add(units, api=api, method=method)
+
+    def rate_limited(self, api: str, username: str, reason: str, seconds: float):
+        """Pause the bucket matching a rate limit reported by Google."""
+        bucket = self.user_bucket(api, username) if reason == 'userRateLimitExceeded' else self._project[api]
+        bucket.pause(seconds)
+
+
+def error_reason(error: HttpError) -> Optional[str]:
+    """Reason of the first error detail in a Google API error response, e.g. `rateLimitExceeded`."""
+    try:
+        content = json.loads(error.content.decode('utf-8'))
+        return content['error']['errors'][0]['reason']
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+        return None
+
+
+def is_retryable(error: HttpError) -> bool:
+    """Whether a Google API error is transient: 429, 5xx or a rate limit 403, but never a daily limit."""
+    status, reason = error.resp.status, error_reason(error)
+    if reason in DAILY_LIMIT_REASONS:
+        return False
+    if status == 429 or status >= 500:
+        return True
+    return status == 403 and reason in RATE_LIMIT_REASONS
+
+
+def retry_after(error: HttpError) -> Optional[float]:
+    try:
+        return float(error.resp.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 32.0) -> float:
+    """Exponential backoff with full jitter for the given zero-based retry attempt."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def execute(request, api: str, method: str, username: str, max_retries: Optional[int] = None):
+    """
+    Execute a Google API request within quota, retrying transient errors.
+
+    Args:
+        request: Request built by a discovery service, e.g. `service.events().insert(...)`
+        api (str): Name of the API the request belongs to, `calendar` or `gmail`
+        method (str): Method name, used for its quota cost and in metrics
+        username (str): User the request is made for
+        max_retries (int): Retries after the first attempt, `GOOGLE_API_MAX_RETRIES` by default
+
+    Returns:
+        dict: Response of the request
+
+    Raises:
+        HttpError: If the error is not retryable or persists after the last retry
+        QuotaExhausted: If no quota is available within the allowed wait
+        RequestCancelled: If the request the call is made for was cancelled
+    """
+    if max_retries is None:
+        max_retries = int(os.environ.get('GOOGLE_API_MAX_RETRIES', '5'))
+    quota = google_quota()
+    units = METHOD_COSTS.get((api, method), 1)
+    for attempt in range(max_retries + 1):
+        check_cancelled()
+        quota.acquire(api, method, username, units)
+        # Last step before the request, whose side effects cannot be undone once it is sent.
+        check_cancelled()
+        try:
+            return request.execute()
+        except HttpError as e:
+            if not is_retryable(e) or attempt == max_retries:
+                api_failures.add(api=api, method=method, status=str(e.resp.status))
+                raise
+            reason = error_reason(e) or str(e.resp.status)
+            delay = retry_after(e) or backoff_delay(attempt)
+            if e.resp.status == 429 or reason in RATE_LIMIT_REASONS:
+                quota.rate_limited(api, username, reason, delay)
+            api_retries.add(api=api, method=method, reason=reason)
+            logger.warning("%s.%s failed with %s, retry %s in %.2fs", api, method, reason, attempt + 1, delay)
+            sleep(delay)
+
+
+def execute_batch(service, requests: List[Any], api: str, method: str, username: str, batch_size: int = 50,
+                  max_retries: Optional[int] = None) -> List[Optional[dict]]:
+    """
+    Execute requests of the same method in batch requests, within quota.
+
+    Every request is charged to the quota individually, as Google does for batches. Requests
+    failing with a retryable error, or left unanswered by a batch failing with one, are batched
+    again after a backoff, the others are left as None. Responses already received are kept.
+
+    Args:
+        service: Discovery service the requests were built from
+        requests (list): Requests to execute
+        api (str): Name of the API the requests belong to
+        method (str): Method name, used for its quota cost and in metrics
+        username (str): User the requests are made for
+        batch_size (int): Maximum number of requests per batch
+        max_retries (int): Retries of failed requests, `GOOGLE_API_MAX_RETRIES` by default
+
+    Returns:
+        List[Optional[dict]]: Response per request, in order, None where it failed
+    """
+    if max_retries is None:
+        max_retries = int(os.environ.get('GOOGLE_API_MAX_RETRIES', '5'))
+    quota = google_quota()
+    units = METHOD_COSTS.get((api, method), 1)
+    results: List[Optional[dict]] = [None] * len(requests)
+    pending = list(range(len(requests)))
+
+    for attempt in range(max_retries + 1):
+        retry: List[int] = []
+        reasons: List[str] = []
+        answered: Set[int] = set()
+        wait = 0.0
+
+        def store_result(request_id, response, exception):
+            index = int(request_id)
+            answered.add(index)
+            if exception is None:
+                results[index] = response
+            elif isinstance(exception, HttpError) and is_retryable(exception) and attempt < max_retries:
+                retry.append(index)
+                reasons.append(error_reason(exception) or str(exception.resp.status))
+            else:
+                status = exception.resp.status if isinstance(exception, HttpError) else 'error'
+                api_failures.add(api=api, method=method, status=str(status))
+
+        for start in range(0, len(pending), batch_size):
+            check_cancelled()
+            batch = service.new_batch_http_request(callback=store_result)
+            chunk = pending[start:start + batch_size]
+            for index in chunk:
+                quota.acquire(api, method, username, units)
+                batch.add(requests[index], request_id=str(index))
+            check_cancelled()
+            try:
+                batch.execute()
+            except HttpError as e:
+                unanswered = [index for index in chunk if index not in answered]
+                if is_retryable(e) and attempt < max_retries:
+                    retry.extend(unanswered)
+                    reasons.append(error_reason(e) or str(e.resp.status))
+                    wait = max(wait, retry_after(e) or 0.0)
+                else:
+                    api_failures.add(len(unanswered), api=api, method=method, status=str(e.resp.status))
+                    logger.error("Batch of %s %s.%s requests failed with %s",
+                                 len(unanswered), api, method, e.resp.status)
+
+        if not retry:
+            break
+        delay = max(wait, backoff_delay(attempt))
+        for reason in set(reasons):
+            if reason == '429' or reason in RATE_LIMIT_REASONS:
+                quota.rate_limited(api, username, reason, delay)
+        api_retries.add(len(retry), api=api, method=method, reason=reasons[0])
+        logger.warning("%s of %s %s.%s requests failed, retry %s in %.2fs",
+                       len(retry), len(pending), api, method, attempt + 1, delay)
+        pending = sorted(retry)
+        sleep(delay)
+    return results
+
+
+_quota: Optional[GoogleQuota] = None
+_quota_lock = Lock()
+
+
+def google_quota() -> GoogleQuota:
+    """Process-wide Google API quota, configured from the environment on first use."""
+    global _quota
+    with _quota_lock:
+        if _quota is None:
+            _quota = GoogleQuota(
+                {
+                    'calendar': ApiQuota.from_env('calendar', project_per_minute=10_000, user_per_minute=600),
+                    'gmail': ApiQuota.from_env('gmail', project_per_minute=1_200_000, user_per_minute=15_000),
+                },
+                max_wait=float(os.environ.get('GOOGLE_QUOTA_MAX_WAIT', '30')),
+            )
+        return _quota
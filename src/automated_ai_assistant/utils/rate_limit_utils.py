@@ -0,0 +1,64 @@
+import time
+from threading import Lock
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate` tokens per second, up to `capacity`.
+
+    Args:
+        rate (float): Tokens added per second
+        capacity (float): Maximum number of tokens, i.e. the allowed burst
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take `tokens` from the bucket if they are available, without waiting."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._paused_until or self._tokens < min(tokens, self.capacity):
+                return False
+            self._tokens -= min(tokens, self.capacity)
+            return True
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """
+        Take `tokens` from the bucket, going into debt if needed.
+
+        Returns:
+            float: Seconds the caller must wait before using the tokens
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= min(tokens, self.capacity)
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(delay, self._paused_until - now)
+
+    def refund(self, tokens: float = 1.0):
+        """Give back tokens of a reservation that was not used."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + min(tokens, self.capacity))
+
+    def pause(self, seconds: float):
+        """Hold every reservation for `seconds`, e.g. after the server reported a rate limit."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
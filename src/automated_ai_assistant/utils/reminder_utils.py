@@ -0,0 +1,438 @@
+import asyncio
+import heapq
+from abc import ABC, abstractmethod
+import json
+import os
+import random
+import sqlite3
+import time
+import urllib.request
+from dataclasses import dataclass
+from datetime import timezone
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from automated_ai_assistant.model.data_types import ReminderDetails
+from automated_ai_assistant.oltp_tracing import logger
+from automated_ai_assistant.utils.google_utils import GoogleAPIInterface, project_root
+from automated_ai_assistant.utils.metrics_utils import counter
+from automated_ai_assistant.utils.websocket_utils import connection_manager
+
+reminders_scheduled = counter("reminders.scheduled", "Reminders stored by the local reminder engine")
+reminders_delivered = counter("reminders.delivered", "Reminders delivered by a sink")
+reminders_retried = counter("reminders.retried", "Reminder deliveries rescheduled after a failure")
+reminders_failed = counter("reminders.failed", "Reminders given up after the last delivery attempt")
+reminders_fallbacks = counter("reminders.fallbacks", "Reminders handed to the next sink after the last attempt")
+
+
+def due_timestamp(reminder_details: ReminderDetails) -> float:
+    """POSIX timestamp of the reminder time, naive times being UTC as for the calendar events."""
+    reminder_time = reminder_details.reminder_time
+    if reminder_time.tzinfo is None:
+        reminder_time = reminder_time.replace(tzinfo=timezone.utc)
+    return reminder_time.timestamp()
+
+
+@dataclass
+class Reminder:
+    """A stored reminder waiting to be fired through `sink`."""
+    id: int
+    username: str
+    sink: str
+    due: float
+    details: ReminderDetails
+    attempts: int = 0
+
+    def payload(self) -> dict:
+        return {
+            'type': 'reminder',
+            'id': self.id,
+            'username': self.username,
+            **self.details.model_dump(mode='json'),
+        }
+
+
+class ReminderStore:
+    """
+    SQLite store of reminders, indexed by due time.
+
+    Reminders stay pending until a sink acknowledges their delivery, so a crash between firing
+    and acknowledging delivers them again after the restart instead of losing them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS reminders (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT NOT NULL,
+                    sink TEXT NOT NULL,
+                    due REAL NOT NULL,
+                    details TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'pending'
+                )
+            """)
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS reminders_pending ON reminders (due, id) WHERE status = 'pending'"
+            )
+
+    @staticmethod
+    def _reminder(row: Tuple) -> Reminder:
+        id, username, sink, due, details, attempts = row
+        return Reminder(id=id, username=username, sink=sink, due=due,
+                        details=ReminderDetails.model_validate_json(details), attempts=attempts)
+
+    def add(self, username: str, sink: str, reminder_details: ReminderDetails) -> Reminder:
+        due = due_timestamp(reminder_details)
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT INTO reminders (username, sink, due, details) VALUES (?, ?, ?, ?)",
+                (username, sink, due, reminder_details.model_dump_json())
+            )
+        return Reminder(id=cursor.lastrowid, username=username, sink=sink, due=due, details=reminder_details)
+
+    def pending_after(self, after: Tuple[float, int], until: float, limit: int) -> List[Reminder]:
+        """Pending reminders ordered by `(due, id)`, strictly after `after` and due by `until`."""
+        due, id = after
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, username, sink, due, details, attempts FROM reminders "
+                "WHERE status = 'pending' AND (due > ? OR (due = ? AND id > ?)) AND due <= ? "
+                "ORDER BY due, id LIMIT ?",
+                (due, due, id, until, limit)
+            ).fetchall()
+        return [self._reminder(row) for row in rows]
+
+    def mark(self, ids: Iterable[int], status: str):
+        with self._lock:
+            self._connection.executemany("UPDATE reminders SET status = ? WHERE id = ?",
+                                         [(status, id) for id in ids])
+
+    def reschedule(self, reminders: Iterable[Reminder]):
+        with self._lock:
+            self._connection.executemany("UPDATE reminders SET sink = ?, due = ?, attempts = ? WHERE id = ?",
+                                         [(reminder.sink, reminder.due, reminder.attempts, reminder.id)
+                                          for reminder in reminders])
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM reminders WHERE status = 'pending'").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class ReminderSink(ABC):
+    """Destination of due reminders."""
+
+    name = "sink"
+
+    @abstractmethod
+    async def deliver(self, reminders: List[Reminder]) -> Set[int]:
+        """Deliver a batch of reminders and return the ids that were delivered."""
+
+
+class WebSocketSink(ReminderSink):
+    """Pushes reminders to the open `/ws/chat` connections of their user."""
+
+    name = "websocket"
+
+    async def deliver(self, reminders: List[Reminder]) -> Set[int]:
+        manager = connection_manager()
+        # Reminders of users without an open connection are retried, then handed to the next sink.
+        return {reminder.id for reminder in reminders if manager.push(reminder.username, reminder.payload())}
+
+
+class WebhookSink(ReminderSink):
+    """Posts batches of reminders as a JSON array to a webhook."""
+
+    name = "webhook"
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+
+    def _post(self, body: bytes):
+        request = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'},
+                                         method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    async def deliver(self, reminders: List[Reminder]) -> Set[int]:
+        body = json.dumps({'reminders': [reminder.payload() for reminder in reminders]}).encode('utf-8')
+        await asyncio.to_thread(self._post, body)
+        return {reminder.id for reminder in reminders}
+
+
+class CalendarSink(ReminderSink):
+    """Creates the reminders as Google Calendar events, with one batch request per user."""
+
+    name = "calendar"
+
+    async def deliver(self, reminders: List[Reminder]) -> Set[int]:
+        by_user: Dict[str, List[Reminder]] = {}
+        for reminder in reminders:
+            by_user.setdefault(reminder.username, []).append(reminder)
+
+        async def deliver_user(username: str, user_reminders: List[Reminder]) -> Set[int]:
+            interface = await asyncio.to_thread(GoogleAPIInterface, username)
+            events = await asyncio.to_thread(interface.set_reminders,
+                                             [reminder.details for reminder in user_reminders])
+            return {reminder.id for reminder, event in zip(user_reminders, events) if event is not None}
+
+        delivered: Set[int] = set()
+        results = await asyncio.gather(*(deliver_user(username, user_reminders)
+                                         for username, user_reminders in by_user.items()), return_exceptions=True)
+        for username, result in zip(by_user, results):
+            if isinstance(result, BaseException):
+                logger.error("Calendar sync of reminders for %s failed: %s", username, result)
+            else:
+                delivered |= result
+        return delivered
+
+
+class ReminderScheduler:
+    """
+    Fires stored reminders through their sink when they are due.
+
+    Sinks are tried in the configured order: a reminder its sink did not deliver after
+    `max_attempts` moves on to the next sink, and is only marked as failed after the last one.
+    Only reminders due within `horizon` seconds are kept in an in-memory heap, at most
+    `max_loaded` of them, so millions of pending reminders cost disk rather than memory.
+    The store is read in `(due, id)` order behind a cursor: everything up to the cursor is in
+    the heap, everything after it is loaded as the horizon moves. On start the cursor is empty,
+    so reminders that fell due while the process was down are fired first.
+
+    Args:
+        store (ReminderStore): Persistent reminder store
+        sinks (List[ReminderSink]): Available sinks, looked up by name, in fallback order
+        horizon (float): Seconds ahead of now to load into memory
+        max_loaded (int): Maximum number of reminders held in memory
+        batch_size (int): Maximum number of reminders handed to a sink at once
+        max_attempts (int): Delivery attempts on each sink before falling back to the next one
+        retry_delay (float): Base delay of the exponential retry backoff, in seconds
+    """
+
+    def __init__(self, store: ReminderStore, sinks: List[ReminderSink], horizon: float = 300.0,
+                 max_loaded: int = 100_000, batch_size: int = 500, max_attempts: int = 5, retry_delay: float = 5.0):
+        self.store = store
+        self.sinks = {sink.name: sink for sink in sinks}
+        self.horizon = horizon
+        self.max_loaded = max_loaded
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._heap: List[Tuple[float, int, Reminder]] = []
+        self._queued: Set[int] = set()
+        self._cursor: Tuple[float, int] = (float('-inf'), 0)
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def schedule(self, username: str, reminder_details: ReminderDetails, sink: str) -> Reminder:
+        """
+        Store a reminder and queue it if it falls within the loaded part of the schedule.
+
+        Raises:
+            ValueError: If no sink named `sink` is configured
+        """
+        if sink not in self.sinks:
+            raise ValueError(f"Unknown reminder sink '{sink}', expected one of {sorted(self.sinks)}")
+        reminder = await asyncio.to_thread(self.store.add, username, sink, reminder_details)
+        reminders_scheduled.add(sink=sink)
+        self._enqueue(reminder)
+        return reminder
+
+    def _push(self, reminder: Reminder):
+        # A reminder stored while a load was running can be both loaded and enqueued.
+        if reminder.id not in self._queued:
+            self._queued.add(reminder.id)
+            heapq.heappush(self._heap, (reminder.due, reminder.id, reminder))
+
+    def _enqueue(self, reminder: Reminder):
+        # Reminders after the cursor are picked up by the next load instead.
+        if (reminder.due, reminder.id) <= self._cursor:
+            self._push(reminder)
+            if self._heap[0][1] == reminder.id:
+                self._wake.set()
+
+    async def _load(self):
+        until = time.time() + self.horizon
+        room = self.max_loaded - len(self._heap)
+        if room <= 0:
+            return
+        loaded = await asyncio.to_thread(self.store.pending_after, self._cursor, until, room)
+        for reminder in loaded:
+            self._push(reminder)
+        if len(loaded) == room:
+            self._cursor = (loaded[-1].due, loaded[-1].id)
+        else:
+            self._cursor = (until, 2 ** 63 - 1)
+
+    def _fallback(self, sink: str) -> Optional[str]:
+        """Sink tried after `sink`, None when it is the last configured one."""
+        names = list(self.sinks)
+        if sink not in names:
+            return names[0] if names else None
+        index = names.index(sink) + 1
+        return names[index] if index < len(names) else None
+
+    def _pop_due(self, now: float) -> List[Reminder]:
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            reminder = heapq.heappop(self._heap)[2]
+            self._queued.discard(reminder.id)
+            due.append(reminder)
+        return due
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            can_load = len(self._heap) < self.max_loaded
+            if can_load and self._cursor[0] < now + self.horizon / 2:
+                await self._load()
+            due = self._pop_due(now)
+            if due:
+                await self._fire(due)
+                continue
+
+            # Sleep until the next reminder, a newly scheduled earlier one, or the next load.
+            timeout = self.horizon
+            if len(self._heap) < self.max_loaded:
+                timeout = min(timeout, max(0.0, self._cursor[0] - self.horizon / 2 - now))
+            if self._heap:
+                timeout = min(timeout, self._heap[0][0] - now)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, reminders: List[Reminder]):
+        by_sink: Dict[str, List[Reminder]] = {}
+        for reminder in reminders:
+            by_sink.setdefault(reminder.sink, []).append(reminder)
+
+        async def deliver(name: str, batch: List[Reminder]) -> Set[int]:
+            sink = self.sinks.get(name)
+            if sink is None:
+                logger.error("No sink named %s for %s reminders", name, len(batch))
+                return set()
+            try:
+                return await sink.deliver(batch)
+            except Exception as e:
+                logger.error("Delivering %s reminders to %s failed: %s", len(batch), name, e)
+                return set()
+
+        results = await asyncio.gather(*(deliver(name, batch) for name, batch in by_sink.items()))
+        delivered = set().union(*results)
+        retries, failures = [], []
+        for reminder in reminders:
+            if reminder.id in delivered:
+                reminders_delivered.add(sink=reminder.sink)
+                continue
+            reminder.attempts += 1
+            if reminder.attempts >= self.max_attempts:
+                fallback = self._fallback(reminder.sink)
+                if fallback is None:
+                    reminders_failed.add(sink=reminder.sink)
+                    failures.append(reminder.id)
+                    continue
+                reminders_fallbacks.add(sink=reminder.sink, fallback=fallback)
+                logger.warning("Reminder %s not delivered by %s, falling back to %s",
+                               reminder.id, reminder.sink, fallback)
+                reminder.sink, reminder.attempts, reminder.due = fallback, 0, time.time()
+                retries.append(reminder)
+                continue
+            reminders_retried.add(sink=reminder.sink)
+            backoff = self.retry_delay * 2 ** (reminder.attempts - 1)
+            reminder.due = time.time() + backoff * random.uniform(0.5, 1.5)
+            retries.append(reminder)
+
+        await asyncio.to_thread(self.store.mark, delivered, 'delivered')
+        if failures:
+            await asyncio.to_thread(self.store.mark, failures, 'failed')
+        if retries:
+            await asyncio.to_thread(self.store.reschedule, retries)
+            for reminder in retries:
+                self._enqueue(reminder)
+
+
+def configured_sinks() -> List[ReminderSink]:
+    """
+    Sinks enabled by `ASSISTANT_REMINDER_SINKS`, a comma separated list of sink names in fallback order.
+
+    The calendar comes first by default, so reminders of users without an open connection
+    are not lost.
+    """
+    sinks: List[ReminderSink] = []
+    for name in os.environ.get('ASSISTANT_REMINDER_SINKS', 'calendar,websocket').split(','):
+        name = name.strip()
+        if name == WebSocketSink.name:
+            sinks.append(WebSocketSink())
+        elif name == CalendarSink.name:
+            sinks.append(CalendarSink())
+        elif name == WebhookSink.name:
+            url = os.environ.get('ASSISTANT_REMINDER_WEBHOOK_URL')
+            if not url:
+                raise RuntimeError("ASSISTANT_REMINDER_WEBHOOK_URL must be set to use the webhook reminder sink")
+            sinks.append(WebhookSink(url))
+        elif name:
+            raise RuntimeError(f"Unknown reminder sink '{name}'")
+    return sinks
+
+
+_scheduler: Optional[ReminderScheduler] = None
+
+
+def reminder_scheduler() -> ReminderScheduler:
+    """Process-wide reminder scheduler, configured from the `ASSISTANT_REMINDER_*` environment variables."""
+    global _scheduler
+    if _scheduler is None:
+        store = ReminderStore(os.environ.get('ASSISTANT_REMINDER_DB', os.path.join(project_root, '.reminders',
+                                                                                   'reminders.db')))
+        _scheduler = ReminderScheduler(
+            store,
+            configured_sinks(),
+            horizon=float(os.environ.get('ASSISTANT_REMINDER_HORIZON', '300')),
+            max_loaded=int(os.environ.get('ASSISTANT_REMINDER_MAX_LOADED', '100000')),
+            batch_size=int(os.environ.get('ASSISTANT_REMINDER_BATCH_SIZE', '500')),
+        )
+    return _scheduler
+
+
+def reminder_backend() -> str:
+    """Backend of `SetReminderAgent` from `ASSISTANT_REMINDER_BACKEND`: `calendar` (default) or `local`."""
+    return os.environ.get('ASSISTANT_REMINDER_BACKEND', 'calendar')
+
+
+def default_sink() -> str:
+    """Sink of reminders scheduled by the agent, `ASSISTANT_REMINDER_DEFAULT_SINK` or the first configured one."""
+    return os.environ.get('ASSISTANT_REMINDER_DEFAULT_SINK') or next(iter(reminder_scheduler().sinks))
@@ -0,0 +1,299 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import statistics
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+from autogen_core import CancellationToken, DefaultTopicId
+from autogen_core.models import CreateResult, LLMMessage, RequestUsage
+from cryptography.fernet import Fernet
+
+from automated_ai_assistant.model.data_types import EndUserMessage
+from automated_ai_assistant.oltp_tracing import logger
+from automated_ai_assistant.utils.google_utils import active_user, api_interceptor, GoogleAPIInterface
+from automated_ai_assistant.utils.model_policy_utils import load_policy_config, ModelPolicy
+from automated_ai_assistant.utils.structured_output import schema_name
+
+GOOGLE_METHODS = ('schedule_meeting', 'set_reminder', 'send_email')
+
+
+def request_key(messages: Sequence[LLMMessage], extra_create_args: Mapping[str, Any]) -> str:
+    """Stable key of an LLM request, used to match replayed calls to recorded responses."""
+    response_format = extra_create_args.get("response_format")
+    payload = {
+        'messages': [[type(message).__name__, message.content] for message in messages],
+        'response_format': schema_name(response_format) or response_format,
+    }
+    return hashlib.sha1(json.dumps(payload, default=str, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+@dataclass
+class Interaction:
+    """One `/chat` request with the LLM and Google API responses it produced."""
+    message: str
+    username: str
+    offset: float = 0.0
+    duration: float = 0.0
+    llm: List[Dict[str, Any]] = field(default_factory=list)
+    google: List[Dict[str, Any]] = field(default_factory=list)
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'chat': {'message': self.message, 'username': self.username, 'offset': round(self.offset, 3),
+                     'duration': round(self.duration, 3)},
+            'llm': self.llm,
+            'google': self.google,
+        }, separators=(',', ':'), default=str)
+
+    @classmethod
+    def from_json(cls, line: str) -> "Interaction":
+        raw = json.loads(line)
+        return cls(llm=raw['llm'], google=raw['google'], **raw['chat'])
+
+
+class RecordingChatCompletionClient:
+    """Model client wrapper that appends every response to an interaction."""
+
+    def __init__(self, client, interaction: Interaction):
+        self._client = client
+        self._interaction = interaction
+
+    async def create(self, messages: Sequence[LLMMessage], tools=[], json_output=None,
+                     extra_create_args: Mapping[str, Any] = {},
+                     cancellation_token: Optional[CancellationToken] = None) -> CreateResult:
+        started = time.perf_counter()
+        result = await self._client.create(messages=messages, tools=tools, json_output=json_output,
+                                           extra_create_args=extra_create_args,
+                                           cancellation_token=cancellation_token)
+        self._interaction.llm.append({
+            'key': request_key(messages, extra_create_args),
+            'elapsed': round(time.perf_counter() - started, 3),
+            'response': result.model_dump(mode='json'),
+        })
+        return result
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+
+class ReplayChatCompletionClient:
+    """
+    Model client serving recorded responses without any network access.
+
+    Calls are matched by request key first and fall back to recording order, so replays
+    survive prompt changes. Recorded latency is reproduced, divided by `speed`.
+    """
+
+    def __init__(self, interaction: Interaction, speed: float = 1.0):
+        self._pending = list(interaction.llm)
+        self._speed = speed
+        self._usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+
+    async def create(self, messages: Sequence[LLMMessage], tools=[], json_output=None,
+                     extra_create_args: Mapping[str, Any] = {},
+                     cancellation_token: Optional[CancellationToken] = None) -> CreateResult:
+        if not self._pending:
+            raise RuntimeError("No recorded LLM response left in cassette")
+        key = request_key(messages, extra_create_args)
+        recorded = next((entry for entry in self._pending if entry['key'] == key), self._pending[0])
+        self._pending.remove(recorded)
+        if self._speed > 0:
+            await asyncio.sleep(recorded['elapsed'] / self._speed)
+        return CreateResult.model_validate(recorded['response'])
+
+    def actual_usage(self) -> RequestUsage:
+        return self._usage
+
+    def total_usage(self) -> RequestUsage:
+        return self._usage
+
+    @property
+    def capabilities(self):
+        return {'vision': False, 'function_calling': True, 'json_output': True}
+
+
+class RecordingGoogleAPI:
+    """Google API interface wrapper that appends every response to an interaction."""
+
+    def __init__(self, interface: GoogleAPIInterface, interaction: Interaction):
+        self._interface = interface
+        self._interaction = interaction
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._interface, name)
+        if name not in GOOGLE_METHODS:
+            return attribute
+
+        def call(*args, **kwargs):
+            response = attribute(*args, **kwargs)
+            self._interaction.google.append({'call': name, 'response': response})
+            return response
+
+        return call
+
+
+class ReplayGoogleAPI:
+    """Google API interface returning recorded responses in order, per method."""
+
+    def __init__(self, interaction: Interaction):
+        self._pending = list(interaction.google)
+
+    def __getattr__(self, name: str) -> Any:
+        if name not in GOOGLE_METHODS:
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            recorded = next((entry for entry in self._pending if entry['call'] == name), None)
+            if recorded is None:
+                raise RuntimeError(f"No recorded {name} response left in cassette")
+            self._pending.remove(recorded)
+            return recorded['response']
+
+        return call
+
+
+class CassetteRecorder:
+    """
+    Appends interactions of live `/chat` traffic to a JSONL cassette.
+
+    Interactions hold prompts, email bodies and recipients, so every line is encrypted with
+    the Fernet `key` and the cassette can only be replayed by holders of that key.
+    """
+
+    def __init__(self, path: str, key: str):
+        self.path = path
+        self._fernet = Fernet(key)
+        self._started = time.monotonic()
+        self._lock = Lock()
+
+    def start(self, message: str, username: str) -> Interaction:
+        """Begin recording a request and route its Google calls through the recorder."""
+        interaction = Interaction(message=message, username=username, offset=time.monotonic() - self._started)
+        api_interceptor.set(lambda user: RecordingGoogleAPI(GoogleAPIInterface(user), interaction))
+        return interaction
+
+    def finish(self, interaction: Interaction):
+        interaction.duration = time.monotonic() - self._started - interaction.offset
+        line = self._fernet.encrypt(interaction.to_json().encode('utf-8')).decode('ascii')
+        with self._lock:
+            with open(self.path, 'a') as cassette:
+                cassette.write(line + '\n')
+
+
+_recorder: Optional[CassetteRecorder] = None
+
+
+def cassette_recorder() -> Optional[CassetteRecorder]:
+    """
+    Recorder writing to `ASSISTANT_RECORD_CASSETTE`, or None when recording is disabled.
+
+    Recording is refused unless `ASSISTANT_CASSETTE_KEY` holds the Fernet key encrypting the cassette.
+    """
+    global _recorder
+    path = os.environ.get('ASSISTANT_RECORD_CASSETTE')
+    if not path:
+        return None
+    key = os.environ.get('ASSISTANT_CASSETTE_KEY')
+    if not key:
+        logger.error("Not recording %s, ASSISTANT_CASSETTE_KEY must be set to a Fernet key", path)
+        return None
+    if _recorder is None or _recorder.path != path:
+        _recorder = CassetteRecorder(path, key)
+    return _recorder
+
+
+def load_cassette(path: str, key: Optional[str] = None) -> List[Interaction]:
+    """Decrypt the interactions of a cassette with `key`, defaulting to `ASSISTANT_CASSETTE_KEY`."""
+    key = key or os.environ.get('ASSISTANT_CASSETTE_KEY')
+    if not key:
+        raise RuntimeError("ASSISTANT_CASSETTE_KEY must be set to the key the cassette was recorded with")
+    fernet = Fernet(key)
+    with open(path) as cassette:
+        return [Interaction.from_json(fernet.decrypt(line.strip()).decode('utf-8')) for line in cassette
+                if line.strip()]
+
+
+def replay_policy() -> ModelPolicy:
+    """Model policy of the live configuration, whose tier clients are replaced per interaction."""
+    return ModelPolicy.from_config(load_policy_config(), lambda settings: None)
+
+
+async def replay_interaction(interaction: Interaction, speed: float, policy: ModelPolicy) -> float:
+    """Drive the full agent chain for one recorded request and return its latency in seconds."""
+    # Imported here so that the runtime, which imports the agents, is only loaded for replays.
+    from automated_ai_assistant.utils.runtime_utils import initialize_agent_runtime
+
+    active_user.set(interaction.username)
+    google_api = ReplayGoogleAPI(interaction)
+    api_interceptor.set(lambda user: google_api)
+    # Every tier answers from the same recording, the policy still routes, escalates and counts the calls.
+    model_client = ReplayChatCompletionClient(interaction, speed)
+    policy = policy.with_clients(lambda client: model_client)
+
+    started = time.perf_counter()
+    runtime = await initialize_agent_runtime(model_policy=policy, response_queue=asyncio.Queue())
+    await runtime.publish_message(
+        message=EndUserMessage(content=interaction.message, source="user"),
+        topic_id=DefaultTopicId(type="chat_agent")
+    )
+    await runtime.stop_when_idle()
+    return time.perf_counter() - started
+
+
+async def replay_cassette(path: str, speed: float = 1.0, key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Replay a cassette at its recorded pace divided by `speed`, with no network access.
+
+    Args:
+        path (str): Path of the JSONL cassette
+        speed (float): Acceleration factor, 0 replays every request back to back without delays
+        key (str): Fernet key the cassette was recorded with, defaults to `ASSISTANT_CASSETTE_KEY`
+
+    Returns:
+        dict: Latency percentiles and peak traced allocation of the replay
+    """
+    interactions = load_cassette(path, key)
+    # Shared by all interactions, like the process-wide policy of the server.
+    policy = replay_policy()
+
+    async def scheduled(interaction: Interaction) -> float:
+        if speed > 0:
+            await asyncio.sleep(interaction.offset / speed)
+        return await replay_interaction(interaction, speed, policy)
+
+    tracemalloc.start()
+    try:
+        if speed > 0:
+            latencies = await asyncio.gather(*(scheduled(interaction) for interaction in interactions))
+        else:
+            latencies = [await replay_interaction(interaction, speed, policy) for interaction in interactions]
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'latency_p50': statistics.median(latencies) if latencies else 0.0,
+        'latency_p95': latencies[math.ceil(0.95 * len(latencies)) - 1] if latencies else 0.0,
+        'latency_max': latencies[-1] if latencies else 0.0,
+        'peak_allocated_bytes': peak,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a recorded /chat cassette through the agent chain")
+    parser.add_argument('cassette')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="acceleration factor, 0 to replay back to back without delays")
+    args = parser.parse_args()
+    report = asyncio.run(replay_cassette(args.cassette, args.speed))
+    logger.info("Replay finished: %s", report)
+    print(json.dumps(report, indent=4))
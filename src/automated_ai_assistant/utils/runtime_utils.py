@@ -1,19 +1,54 @@
-from autogen_core import SingleThreadedAgentRuntime, AgentType, DefaultSubscription
+import asyncio
+import os
+from typing import Optional
+
+from autogen_core import SingleThreadedAgentRuntime, AgentType, DefaultSubscription, ClosureAgent, ClosureContext, \
+    MessageContext, TypeSubscription
 
 from automated_ai_assistant.agent.chat_agent import ChatAgent
 from automated_ai_assistant.agent.schedule_meeting import ScheduleMeetingAgent
 from automated_ai_assistant.agent.send_email import SendEmailAgent
 from automated_ai_assistant.agent.set_reminder import SetReminderAgent
 from automated_ai_assistant.agent.task_router import TaskRoutingAgent
+from automated_ai_assistant.model.data_types import AssistantResponse
+from automated_ai_assistant.utils.model_policy_utils import ModelPolicy
+
+AGENT_TYPES = ["chat_agent", "task_router", "schedule_meeting", "send_email", "set_reminder"]
 
 
-async def initialize_agent_runtime(model_client) -> SingleThreadedAgentRuntime:
+async def initialize_agent_runtime(model_client=None, router_model_client=None, speculative_routing=None,
+                                   response_queue: Optional[asyncio.Queue] = None,
+                                   reminder_backend: Optional[str] = None,
+                                   model_policy: Optional[ModelPolicy] = None) -> SingleThreadedAgentRuntime:
     """
     Initializes the agent runtime with the required agents and tools.
 
+    Args:
+        model_client: Client used by the chat agent and the specialized agents
+        router_model_client: Client used by the task router, it creates its own when omitted
+        speculative_routing: Classify the task alongside the chat agent call, defaults to
+            the `ASSISTANT_SPECULATIVE_ROUTING` environment variable
+        response_queue: Queue receiving the `AssistantResponse` messages meant for the user
+        reminder_backend: `calendar` or `local`, defaults to the `ASSISTANT_REMINDER_BACKEND`
+            environment variable
+        model_policy: Policy choosing the model of every agent call, replaces `model_client`
+            and `router_model_client` when given
+
     Returns:
         SingleThreadedAgentRuntime: The initialized runtime for managing agents.
     """
+    if speculative_routing is None:
+        speculative_routing = os.environ.get("ASSISTANT_SPECULATIVE_ROUTING", "0") == "1"
+
+    def client_for(agent_type: str, client):
+        return model_policy.client_for(agent_type) if model_policy is not None else client
+
+    router_client = client_for("task_router", router_model_client)
+    schedule_meeting_client = client_for("schedule_meeting", model_client)
+    set_reminder_client = client_for("set_reminder", model_client)
+    send_email_client = client_for("send_email", model_client)
+    chat_agent_client = client_for("chat_agent", model_client)
+
     agent_runtime = SingleThreadedAgentRuntime()
 
     await agent_runtime.add_subscription(
@@ -28,33 +63,47 @@ async def initialize_agent_runtime(model_client) -> SingleThreadedAgentRuntime:
     chat_agent_type = AgentType("chat_agent")
 
     await agent_runtime.register_factory(type=agent_type,
-                                         agent_factory=lambda: TaskRoutingAgent(),
+                                         agent_factory=lambda: TaskRoutingAgent(model_client=router_client),
                                          expected_class=TaskRoutingAgent)
 
     await agent_runtime.register_factory(type=schedule_meeting_type,
-                                         agent_factory=lambda: ScheduleMeetingAgent(model_client=model_client),
+                                         agent_factory=lambda: ScheduleMeetingAgent(model_client=schedule_meeting_client),
                                          expected_class=ScheduleMeetingAgent)
 
     await agent_runtime.register_factory(type=set_reminder_type,
-                                         agent_factory=lambda: SetReminderAgent(model_client=model_client),
+                                         agent_factory=lambda: SetReminderAgent(model_client=set_reminder_client,
+                                                                                  backend=reminder_backend),
                                          expected_class=SetReminderAgent)
 
     await agent_runtime.register_factory(type=send_email_type,
-                                         agent_factory=lambda: SendEmailAgent(model_client=model_client),
+                                         agent_factory=lambda: SendEmailAgent(model_client=send_email_client),
                                          expected_class=SendEmailAgent)
 
     await agent_runtime.register_factory(type=chat_agent_type,
-                                         agent_factory=lambda: ChatAgent(model_client=model_client),
+                                         agent_factory=lambda: ChatAgent(model_client=chat_agent_client,
+                                                                         router_model_client=router_client,
+                                                                         speculative_routing=speculative_routing),
                                          expected_class=ChatAgent)
 
 
-    for agent_type in ["chat_agent", "task_router", "schedule_meeting", "send_email", "set_reminder"]:
+    for agent_type in AGENT_TYPES:
         await agent_runtime.add_subscription(
             DefaultSubscription(
                 topic_type=agent_type,
                 agent_type=agent_type
             )
         )
+    if response_queue is not None:
+        async def collect_response(_agent: ClosureContext, message: AssistantResponse, ctx: MessageContext) -> None:
+            await response_queue.put(message)
+
+        await ClosureAgent.register_closure(
+            agent_runtime,
+            "user_response",
+            collect_response,
+            subscriptions=lambda: [TypeSubscription(topic_type="user_response", agent_type="user_response")]
+        )
+
     agent_runtime.start()
 
     print("Agent runtime initialized successfully.")
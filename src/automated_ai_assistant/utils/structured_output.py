@@ -0,0 +1,184 @@
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type, TypeVar
+
+from autogen_core import CancellationToken
+from autogen_core.models import AssistantMessage, ChatCompletionClient, LLMMessage, UserMessage
+from pydantic import BaseModel, TypeAdapter, ValidationError, create_model
+
+from automated_ai_assistant.oltp_tracing import logger, VERBOSE
+from automated_ai_assistant.utils.metrics_utils import counter
+from automated_ai_assistant.utils.profiling_utils import phase
+
+T = TypeVar("T", bound=BaseModel)
+
+parse_attempts = counter("llm.structured_output.attempts", "Structured LLM outputs validated")
+parse_failures = counter("llm.structured_output.failures", "Structured LLM outputs that failed validation")
+repairs = counter("llm.structured_output.repairs", "Repair re-asks issued after a failed validation")
+
+
+class StructuredOutputError(Exception):
+    """Raised when the LLM output still fails validation after the repair re-ask."""
+
+
+@lru_cache(maxsize=None)
+def type_adapter(model: Type[Any]) -> TypeAdapter:
+    """Return the precompiled validator for `model`, building it once per process."""
+    return TypeAdapter(model)
+
+
+@lru_cache(maxsize=None)
+def response_model(model: Type[T], fields: Optional[Tuple[str, ...]] = None) -> Type[BaseModel]:
+    """
+    Response format asking the LLM only for `fields` of `model`.
+
+    Args:
+        model (Type[BaseModel]): Full details model, e.g. `MeetingDetails`
+        fields (tuple): Field names still to be determined, all fields when omitted
+
+    Returns:
+        Type[BaseModel]: `model` itself or a cached subset model with the same field types
+    """
+    if fields is None or set(fields) == set(model.model_fields):
+        return model
+    return create_model(
+        model.__name__,
+        **{name: (model.model_fields[name].annotation, ...) for name in fields}
+    )
+
+
+def _resolve_ref(root: Dict[str, Any], ref: str) -> Dict[str, Any]:
+    if not ref.startswith("#/"):
+        raise ValueError(f"Unexpected $ref format {ref!r}")
+    resolved = root
+    for key in ref[2:].split("/"):
+        resolved = resolved[key]
+    return resolved
+
+
+def _strict(schema: Dict[str, Any], root: Dict[str, Any]) -> Dict[str, Any]:
+    for definitions in ("$defs", "definitions"):
+        for definition in schema.get(definitions, {}).values():
+            _strict(definition, root)
+    if schema.get("type") == "object" and "additionalProperties" not in schema:
+        schema["additionalProperties"] = False
+    if isinstance(schema.get("properties"), dict):
+        schema["required"] = list(schema["properties"])
+        schema["properties"] = {key: _strict(value, root) for key, value in schema["properties"].items()}
+    if isinstance(schema.get("items"), dict):
+        schema["items"] = _strict(schema["items"], root)
+    if isinstance(schema.get("anyOf"), list):
+        schema["anyOf"] = [_strict(variant, root) for variant in schema["anyOf"]]
+    if isinstance(schema.get("allOf"), list):
+        if len(schema["allOf"]) == 1:
+            schema.update(_strict(schema.pop("allOf")[0], root))
+        else:
+            schema["allOf"] = [_strict(entry, root) for entry in schema["allOf"]]
+    if "default" in schema and schema["default"] is None:
+        schema.pop("default")
+    if "$ref" in schema and len(schema) > 1:
+        # A $ref cannot have sibling keys in strict mode, so it is inlined.
+        ref = schema.pop("$ref")
+        schema.update({**_resolve_ref(root, ref), **schema})
+        return _strict(schema, root)
+    return schema
+
+
+def strict_json_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    JSON schema of `model` in the form required by the strict structured outputs mode.
+
+    Objects forbid additional properties and require every property, `None` defaults are
+    dropped and `$ref`s with sibling keys are inlined. Follows the conversion applied by the
+    OpenAI SDK, which it does not expose publicly.
+    """
+    schema = model.model_json_schema()
+    return _strict(schema, schema)
+
+
+@lru_cache(maxsize=None)
+def response_format(model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    Strict JSON-schema response format of `model`.
+
+    Passed as a plain dict rather than the model class, so the client does not parse the
+    output itself and validation failures reach the repair re-ask of `create_structured`.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": model.__name__, "schema": strict_json_schema(model), "strict": True},
+    }
+
+
+def schema_name(response_format: Any) -> Optional[str]:
+    """Name of the schema requested by a `response_format` create argument, if any."""
+    if isinstance(response_format, dict):
+        return response_format.get("json_schema", {}).get("name")
+    return getattr(response_format, '__name__', None)
+
+
+def _validation_summary(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, item['loc'])) or 'output'}: {item['msg']}" for item in error.errors())
+
+
+async def create_structured(
+        model_client: ChatCompletionClient,
+        messages: Sequence[LLMMessage],
+        response_type: Type[T],
+        source: str,
+        cancellation_token: Optional[CancellationToken] = None
+) -> T:
+    """
+    Request a strict JSON-schema response and validate it, with a single repair re-ask.
+
+    Clients offering `escalated()`, such as the model policy clients, answer the repair
+    re-ask with a larger model.
+
+    Args:
+        model_client (ChatCompletionClient): Client used for the LLM call
+        messages (Sequence[LLMMessage]): Prompt messages
+        response_type (Type[BaseModel]): Model used both as response format and validator
+        source (str): Name of the calling agent, used as source of the repaired answer
+        cancellation_token (CancellationToken): Token linked to the LLM calls
+
+    Returns:
+        BaseModel: Validated instance of `response_type`
+
+    Raises:
+        StructuredOutputError: If the output is still invalid after the repair re-ask
+    """
+    adapter = type_adapter(response_type)
+    schema = response_type.__name__
+    history: List[LLMMessage] = list(messages)
+    client = model_client
+
+    for attempt in ("initial", "repair"):
+        if attempt == "repair" and hasattr(model_client, "escalated"):
+            client = model_client.escalated()
+        with phase(f"{source}.llm"):
+            response = await client.create(
+                messages=history,
+                extra_create_args={"response_format": response_format(response_type)},
+                cancellation_token=cancellation_token
+            )
+        logger.info("Received %s response: %s", schema, response, extra=VERBOSE)
+        content = response.content if isinstance(response.content, str) else ""
+        parse_attempts.add(schema=schema, attempt=attempt)
+        try:
+            with phase(f"{source}.validation"):
+                return adapter.validate_json(content)
+        except ValidationError as e:
+            parse_failures.add(schema=schema, attempt=attempt)
+            if hasattr(client, "validation_failed"):
+                client.validation_failed(schema)
+            logger.warning("%s output failed validation on %s attempt: %s", schema, attempt, _validation_summary(e))
+            if attempt == "repair":
+                raise StructuredOutputError(f"Invalid {schema} output: {_validation_summary(e)}") from e
+            repairs.add(schema=schema)
+            history += [
+                AssistantMessage(content=content, source=source),
+                UserMessage(
+                    content=f"The previous output did not match the {schema} schema: {_validation_summary(e)}. "
+                            f"Return the corrected JSON object only.",
+                    source="validator"
+                )
+            ]
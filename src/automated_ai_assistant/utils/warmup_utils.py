@@ -0,0 +1,106 @@
+import asyncio
+import os
+import time
+from itertools import combinations
+from typing import Any, Dict
+
+from autogen_core.models import UserMessage
+
+from automated_ai_assistant.agent.chat_agent import chat_example_index
+from automated_ai_assistant.model.data_types import EmailDetails, MeetingDetails, NextAction, ReminderDetails, TaskPlan, \
+    TaskRoute
+from automated_ai_assistant.oltp_tracing import logger
+from automated_ai_assistant.utils.example_index_utils import registry_index
+from automated_ai_assistant.utils.google_utils import credential_cache, DEFAULT_USER
+from automated_ai_assistant.utils.model_policy_utils import ModelPolicy
+from automated_ai_assistant.utils.structured_output import response_format, response_model, type_adapter
+
+
+class WarmupState:
+    """Progress of the startup warm-up, reported by the `/ready` endpoint."""
+
+    def __init__(self):
+        self.ready = False
+        self.steps: Dict[str, Dict[str, Any]] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'ready': self.ready, 'steps': self.steps}
+
+
+warmup_state = WarmupState()
+
+
+async def _step(name: str, coroutine, required: bool = True) -> bool:
+    started = time.perf_counter()
+    try:
+        await coroutine
+    except Exception as e:
+        warmup_state.steps[name] = {'status': 'failed' if required else 'skipped', 'error': str(e)}
+        logger.warning("Warm-up step %s failed: %s", name, e)
+        return not required
+    warmup_state.steps[name] = {'status': 'done', 'ms': round((time.perf_counter() - started) * 1000, 3)}
+    return True
+
+
+async def _compile_schemas():
+    # Fill the caches requests look up: validators, strict response formats, and the subset
+    # models asked for when local extraction resolved some fields. `Extraction.missing` keeps
+    # the field order of the model, so every ordered subset covers all of them.
+    for model in (NextAction, TaskRoute, TaskPlan):
+        type_adapter(model)
+        response_format(model)
+    for model in (MeetingDetails, ReminderDetails, EmailDetails):
+        type_adapter(model)
+        names = tuple(model.model_fields)
+        for size in range(1, len(names) + 1):
+            for fields in combinations(names, size):
+                subset = response_model(model, fields)
+                type_adapter(subset)
+                response_format(subset)
+
+
+async def _build_prompt_indexes():
+    registry_index()
+    chat_example_index()
+
+
+async def _open_llm_connection(model_client):
+    # A one token completion establishes the TLS connection kept in the client's pool.
+    await model_client.create(
+        messages=[UserMessage(content="ping", source="warmup")],
+        extra_create_args={"max_tokens": 1}
+    )
+
+
+async def _preload_google_credentials():
+    users = [user for user in os.environ.get('ASSISTANT_WARMUP_USERS', DEFAULT_USER).split(',') if user]
+    cache = credential_cache()
+    for user in users:
+        await asyncio.to_thread(cache.get, user)
+
+
+async def warm_up(policy: ModelPolicy) -> WarmupState:
+    """
+    Prepare the process for traffic before it reports ready.
+
+    Schema compilation and prompt index construction fill the caches every request reads
+    and must succeed; agents are not instantiated, since each request builds its own runtime.
+    Opening the OpenAI connections and preloading the Google credentials of
+    `ASSISTANT_WARMUP_USERS` are best effort, since a missing token should not keep the pod
+    out of rotation.
+
+    Args:
+        policy (ModelPolicy): Model policy whose tier clients are shared by all requests
+
+    Returns:
+        WarmupState: Final state, also kept in `warmup_state`
+    """
+    ok = await _step("schemas", _compile_schemas())
+    ok = ok and await _step("prompt_indexes", _build_prompt_indexes())
+    connections = [_step(f"openai_connection_{tier}", _open_llm_connection(client), required=False)
+                   for tier, client in policy.clients.items()]
+    connections.append(_step("google_credentials", _preload_google_credentials(), required=False))
+    results = await asyncio.gather(*connections)
+    warmup_state.ready = ok and all(results)
+    logger.info("Warm-up finished, ready: %s", warmup_state.ready)
+    return warmup_state
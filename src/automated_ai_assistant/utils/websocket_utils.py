@@ -0,0 +1,185 @@
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Set
+
+from fastapi import WebSocket
+
+from automated_ai_assistant.model.data_types import AssistantResponse
+from automated_ai_assistant.oltp_tracing import logger
+from automated_ai_assistant.utils.metrics_utils import counter
+from automated_ai_assistant.utils.rate_limit_utils import TokenBucket
+
+websocket_connections = counter("websocket.connections", "WebSocket connection attempts by outcome")
+websocket_messages = counter("websocket.messages", "WebSocket chat messages by outcome")
+websocket_pushes = counter("websocket.pushes", "Server-initiated WebSocket pushes by outcome")
+
+
+class SenderStopped(Exception):
+    """Raised when the task writing the frames of a connection stopped before the connection closed."""
+
+
+class ChatConnection:
+    """
+    One `/ws/chat` connection and its bounded outbound queue.
+
+    Agent responses, error frames and server pushes are all written by a single sender task
+    draining `outbox`, so frames from concurrent producers never interleave on the socket
+    and a client that stops reading holds at most `max_pending_frames` frames in memory.
+    Responses and error frames wait for room in the queue, pushes are dropped instead.
+    """
+
+    def __init__(self, websocket: WebSocket, username: str, max_pending_frames: int):
+        self.websocket = websocket
+        self.username = username
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=max_pending_frames)
+        self.message_rate = TokenBucket(
+            rate=float(os.environ.get('ASSISTANT_WS_MESSAGES_PER_SECOND', '1')),
+            capacity=float(os.environ.get('ASSISTANT_WS_MESSAGE_BURST', '5'))
+        )
+        self._sender: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the sender task writing the queued frames."""
+        self._sender = asyncio.create_task(self.send_pending())
+
+    async def close(self):
+        """
+        Stop the sender and discard the frames still queued.
+
+        Handlers of a stopped runtime may still be waiting for room in the outbox, draining it
+        until no frame arrives lets them finish instead of leaking.
+        """
+        if self._sender is not None:
+            self._sender.cancel()
+        while not self.outbox.empty():
+            while not self.outbox.empty():
+                self.outbox.get_nowait()
+            await asyncio.sleep(0)
+
+    async def send(self, payload: Dict[str, Any]):
+        """Queue a frame answering the client, waiting while the outbox is full."""
+        await self.outbox.put(payload)
+
+    def push(self, payload: Dict[str, Any]) -> bool:
+        """Queue a server-initiated frame, dropping it when the client is not keeping up."""
+        try:
+            self.outbox.put_nowait(payload)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def send_pending(self):
+        """Write queued frames to the socket until the connection is closed."""
+        while True:
+            item = await self.outbox.get()
+            if isinstance(item, AssistantResponse):
+                item = {'type': 'partial' if item.partial else 'response', **item.model_dump(exclude={'partial'})}
+            await self.websocket.send_json(item)
+
+    async def receive_text(self) -> str:
+        """
+        Wait for the next text frame of the client while supervising the sender.
+
+        Raises:
+            SenderStopped: If the sender failed first, chained to its exception
+        """
+        receive = asyncio.ensure_future(self.websocket.receive_text())
+        try:
+            await asyncio.wait({receive, self._sender}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not receive.done():
+                receive.cancel()
+        if not self._sender.done():
+            return receive.result()
+        error = None if self._sender.cancelled() else self._sender.exception()
+        raise SenderStopped(f"WebSocket sender of {self.username} stopped: {error}") from error
+
+
+class ConnectionManager:
+    """
+    Open `/ws/chat` connections per user, with global and per-user connection limits.
+
+    Args:
+        max_connections (int): Connections allowed across all users
+        max_connections_per_user (int): Connections allowed for a single user
+        max_pending_frames (int): Frames queued per connection, beyond which pushes are dropped
+            and responses wait
+    """
+
+    def __init__(self, max_connections: int = 1000, max_connections_per_user: int = 5,
+                 max_pending_frames: int = 100):
+        self.max_connections = max_connections
+        self.max_connections_per_user = max_connections_per_user
+        self.max_pending_frames = max_pending_frames
+        self._connections: Dict[str, Set[ChatConnection]] = {}
+        self._count = 0
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def connect(self, websocket: WebSocket, username: str) -> Optional[ChatConnection]:
+        """
+        Register a connection for `username`.
+
+        Returns:
+            ChatConnection: The registered connection, or None when a limit is reached
+        """
+        user_connections = self._connections.get(username, set())
+        if self._count >= self.max_connections or len(user_connections) >= self.max_connections_per_user:
+            websocket_connections.add(outcome="rejected")
+            logger.warning("Rejected WebSocket connection for %s, %s connections open", username, self._count)
+            return None
+        connection = ChatConnection(websocket, username, self.max_pending_frames)
+        self._connections.setdefault(username, set()).add(connection)
+        self._count += 1
+        websocket_connections.add(outcome="accepted")
+        return connection
+
+    def disconnect(self, connection: ChatConnection):
+        user_connections = self._connections.get(connection.username)
+        if user_connections is None or connection not in user_connections:
+            return
+        user_connections.remove(connection)
+        if not user_connections:
+            del self._connections[connection.username]
+        self._count -= 1
+
+    def users(self) -> List[str]:
+        return list(self._connections)
+
+    def push(self, username: str, payload: Dict[str, Any]) -> int:
+        """
+        Send a server-initiated frame, e.g. a completion notice, to every connection of a user.
+
+        Args:
+            username (str): Recipient
+            payload (dict): JSON frame, conventionally with a `type` key
+
+        Returns:
+            int: Number of connections the frame was queued on
+        """
+        delivered = 0
+        for connection in list(self._connections.get(username, ())):
+            if connection.push(payload):
+                delivered += 1
+            else:
+                websocket_pushes.add(outcome="dropped")
+        if delivered:
+            websocket_pushes.add(delivered, outcome="queued")
+        return delivered
+
+
+_manager: Optional[ConnectionManager] = None
+
+
+def connection_manager() -> ConnectionManager:
+    """Process-wide connection manager, configured from the `ASSISTANT_WS_*` environment variables."""
+    global _manager
+    if _manager is None:
+        _manager = ConnectionManager(
+            max_connections=int(os.environ.get('ASSISTANT_WS_MAX_CONNECTIONS', '1000')),
+            max_connections_per_user=int(os.environ.get('ASSISTANT_WS_MAX_CONNECTIONS_PER_USER', '5')),
+            max_pending_frames=int(os.environ.get('ASSISTANT_WS_MAX_PENDING_FRAMES', '100')),
+        )
+    return _manager
@@ -0,0 +1,32 @@
+import asyncio
+from typing import List
+
+from autogen_core.models import CreateResult, RequestUsage
+
+
+class ScriptedClient:
+    """Chat completion client answering with the given contents in turn, or raising them, after `delay` seconds."""
+
+    def __init__(self, *answers, delay: float = 0):
+        self.answers = list(answers)
+        self.delay = delay
+        self.requests: List[dict] = []
+
+    @property
+    def calls(self) -> int:
+        return len(self.requests)
+
+    async def create(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        self.requests.append({'messages': list(messages), **extra_create_args})
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return CreateResult(finish_reason="stop", content=answer,
+                            usage=RequestUsage(prompt_tokens=0, completion_tokens=0), cached=False)
+
+
+def total(metric, **attributes) -> int:
+    """Sum of the values of `metric` recorded with at least the given attributes."""
+    return sum(value['value'] for value in metric.snapshot() if attributes.items() <= value['attributes'].items())
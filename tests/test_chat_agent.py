@@ -0,0 +1,97 @@
+import asyncio
+import json
+from typing import List
+
+import pytest
+from autogen_core import (
+    ClosureAgent, ClosureContext, DefaultSubscription, DefaultTopicId, message_handler, MessageContext, RoutedAgent,
+    SingleThreadedAgentRuntime, TypeSubscription
+)
+
+from automated_ai_assistant.agent.chat_agent import ChatAgent, speculative_routes
+from automated_ai_assistant.model.data_types import AssistantResponse, EndUserMessage, TaskResult
+from tests.conftest import ScriptedClient, total
+
+MESSAGE = "Email bob@example.com about lunch"
+
+
+def next_action(intent=None, handoff=None) -> str:
+    return json.dumps({'reply': "On it.", 'intent': intent, 'prompt_to_task_router': handoff})
+
+
+def route(agent_type: str) -> str:
+    return json.dumps({'agent_type': agent_type})
+
+
+class Recipient(RoutedAgent):
+    """Stand-in for the task router and the specialists, recording the hand offs it receives."""
+
+    def __init__(self, received: List[str]):
+        super().__init__("Test recipient")
+        self.received = received
+
+    @message_handler
+    async def handle(self, message: EndUserMessage, ctx: MessageContext) -> TaskResult:
+        self.received.append(message.content)
+        return TaskResult(content=f"{self.id.type} done")
+
+
+async def chat(chat_client: ScriptedClient, router_client: ScriptedClient):
+    runtime = SingleThreadedAgentRuntime()
+    received = {agent_type: [] for agent_type in ("task_router", "send_email", "set_reminder")}
+    replies = []
+    await ChatAgent.register(runtime, "chat_agent", lambda: ChatAgent(chat_client, router_client,
+                                                                      speculative_routing=True))
+    for agent_type, messages in received.items():
+        await Recipient.register(runtime, agent_type, lambda messages=messages: Recipient(messages))
+    for agent_type in ("chat_agent", *received):
+        await runtime.add_subscription(DefaultSubscription(topic_type=agent_type, agent_type=agent_type))
+
+    async def collect(_agent: ClosureContext, message: AssistantResponse, ctx: MessageContext) -> None:
+        replies.append(message.content)
+
+    await ClosureAgent.register_closure(runtime, "user_response", collect, subscriptions=lambda: [
+        TypeSubscription(topic_type="user_response", agent_type="user_response")])
+    runtime.start()
+    await runtime.publish_message(EndUserMessage(content=MESSAGE, source="user"), DefaultTopicId(type="chat_agent"))
+    await runtime.stop_when_idle()
+    return received, replies
+
+
+@pytest.fixture
+def outcomes():
+    before = {outcome: total(speculative_routes, outcome=outcome)
+              for outcome in ("committed", "mismatched", "cancelled", "unused", "error")}
+    return lambda: {outcome: total(speculative_routes, outcome=outcome) - count for outcome, count in before.items()
+                    if total(speculative_routes, outcome=outcome) != count}
+
+
+def test_matching_speculation_skips_the_task_router(outcomes):
+    received, replies = asyncio.run(chat(ScriptedClient(next_action('send_email', MESSAGE), delay=0.05),
+                                         ScriptedClient(route('send_email'))))
+    assert received == {'task_router': [], 'send_email': [MESSAGE], 'set_reminder': []}
+    assert replies == ["On it.", "send_email done"]
+    assert outcomes() == {'committed': 1}
+
+
+def test_mismatched_speculation_is_discarded(outcomes):
+    received, replies = asyncio.run(chat(ScriptedClient(next_action('send_email', MESSAGE), delay=0.05),
+                                         ScriptedClient(route('set_reminder'))))
+    assert received == {'task_router': [MESSAGE], 'send_email': [], 'set_reminder': []}
+    assert outcomes() == {'mismatched': 1}
+
+
+def test_speculation_is_cancelled_by_a_plain_reply(outcomes):
+    router = ScriptedClient(route('send_email'), delay=5)
+    received, replies = asyncio.run(asyncio.wait_for(chat(ScriptedClient(next_action()), router), 1))
+    assert replies == ["On it."]
+    assert not any(received.values())
+    assert outcomes() == {'cancelled': 1}
+
+
+def test_finished_speculation_without_hand_off_is_counted(outcomes):
+    received, replies = asyncio.run(chat(ScriptedClient(next_action(), delay=0.05),
+                                         ScriptedClient(route('send_email'))))
+    assert replies == ["On it."]
+    assert not any(received.values())
+    assert outcomes() == {'unused': 1}
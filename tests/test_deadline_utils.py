@@ -0,0 +1,165 @@
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+
+import pytest
+from autogen_core import (
+    CancellationToken, default_subscription, DefaultTopicId, message_handler, MessageContext, RoutedAgent,
+    SingleThreadedAgentRuntime
+)
+
+from automated_ai_assistant.utils import quota_utils
+from automated_ai_assistant.utils.deadline_utils import (
+    cancellable, check_cancelled, client_disconnects, current_cancellation, Deadline, deadline_exceeded,
+    request_timeout, RequestCancelled, run_until_idle, sleep
+)
+from automated_ai_assistant.utils.quota_utils import ApiQuota, execute, GoogleQuota
+from tests.conftest import total
+
+
+@dataclass
+class Work:
+    seconds: float
+
+
+@default_subscription
+class Worker(RoutedAgent):
+    """Agent working for the given time, optionally ignoring the first cancellation."""
+
+    def __init__(self, stubborn: bool = False):
+        super().__init__("Test worker")
+        self.stubborn = stubborn
+        self.cancelled = 0
+
+    @message_handler
+    @cancellable
+    async def work(self, message: Work, ctx: MessageContext) -> None:
+        try:
+            await asyncio.sleep(message.seconds)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            if not self.stubborn:
+                raise
+            await asyncio.sleep(message.seconds)
+
+
+async def run_work(seconds: float, budget: float, stubborn: bool = False, grace: float = 5.0):
+    runtime = SingleThreadedAgentRuntime()
+    workers = []
+
+    def factory():
+        workers.append(Worker(stubborn))
+        return workers[-1]
+
+    await Worker.register(runtime, "worker", factory)
+    runtime.start()
+    deadline = Deadline(budget, "test")
+    await runtime.publish_message(Work(seconds), DefaultTopicId(), cancellation_token=deadline)
+    started = time.monotonic()
+    drained = await run_until_idle(runtime, deadline, grace=grace)
+    deadline.close()
+    return runtime, workers[0], deadline, drained, time.monotonic() - started
+
+
+def test_request_timeout_is_capped(monkeypatch):
+    monkeypatch.setenv('ASSISTANT_REQUEST_TIMEOUT', '30')
+    assert request_timeout() == 30
+    assert request_timeout(5) == 5
+    assert request_timeout(120) == 30
+    assert request_timeout(0) == 30
+
+
+def test_request_within_budget_drains():
+    exceeded = total(deadline_exceeded, path="test")
+    _, worker, deadline, drained, elapsed = asyncio.run(run_work(0.01, budget=5))
+    assert drained and not deadline.is_cancelled()
+    assert worker.cancelled == 0
+    assert total(deadline_exceeded, path="test") == exceeded
+
+
+def test_deadline_cancels_the_handler():
+    exceeded = total(deadline_exceeded, path="test")
+    _, worker, deadline, drained, elapsed = asyncio.run(run_work(5, budget=0.1))
+    assert not drained
+    assert deadline.reason == "deadline"
+    assert worker.cancelled == 1
+    assert elapsed < 1
+    assert total(deadline_exceeded, path="test") == exceeded + 1
+
+
+def test_runtime_that_does_not_drain_is_stopped():
+    async def scenario():
+        runtime, worker, _, drained, elapsed = await run_work(0.5, budget=0.05, stubborn=True, grace=0.05)
+        # A stopped runtime can be started again.
+        runtime.start()
+        await runtime.stop()
+        return worker, drained, elapsed
+
+    worker, drained, elapsed = asyncio.run(scenario())
+    assert not drained
+    assert worker.cancelled == 1
+    assert elapsed < 0.4
+
+
+def test_disconnects_are_counted_only_while_handlers_work():
+    async def scenario():
+        idle, busy = Deadline(5, "test"), Deadline(5, "test")
+        busy.enter()
+        idle.abandon()
+        busy.abandon()
+        busy.exit()
+        idle.close()
+        busy.close()
+        return idle, busy
+
+    disconnects = total(client_disconnects, path="test")
+    idle, busy = asyncio.run(scenario())
+    assert idle.is_cancelled() and busy.is_cancelled()
+    assert busy.reason == "disconnect"
+    assert total(client_disconnects, path="test") == disconnects + 1
+
+
+def test_closed_deadline_does_not_expire():
+    async def scenario():
+        deadline = Deadline(0.01, "test")
+        deadline.close()
+        await asyncio.sleep(0.05)
+        return deadline
+
+    assert not asyncio.run(scenario()).is_cancelled()
+
+
+def test_sleep_ends_when_the_request_is_cancelled():
+    token = CancellationToken()
+    current_cancellation.set(token)
+    try:
+        threading.Timer(0.05, token.cancel).start()
+        started = time.monotonic()
+        with pytest.raises(RequestCancelled):
+            sleep(5)
+        assert time.monotonic() - started < 1
+        with pytest.raises(RequestCancelled):
+            check_cancelled()
+    finally:
+        current_cancellation.set(None)
+
+
+def test_cancelled_request_sends_no_google_call(monkeypatch):
+    class Request:
+        calls = 0
+
+        def execute(self):
+            self.calls += 1
+
+    monkeypatch.setattr(quota_utils, '_quota', GoogleQuota({'gmail': ApiQuota(60_000, 60_000)}))
+    token = CancellationToken()
+    token.cancel()
+    current_cancellation.set(token)
+    request = Request()
+    try:
+        with pytest.raises(RequestCancelled):
+            execute(request, 'gmail', 'messages.send', 'alice')
+    finally:
+        current_cancellation.set(None)
+    assert request.calls == 0
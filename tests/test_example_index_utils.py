@@ -0,0 +1,56 @@
+import pytest
+
+from automated_ai_assistant.agent.chat_agent import CHAT_EXAMPLES, chat_example_index
+from automated_ai_assistant.utils.example_index_utils import ExampleIndex, features, prompt_top_k, relevant_agents
+
+
+def test_features_skip_stopwords_and_add_trigrams():
+    bag = features("Remind me to call the bank")
+    assert 'me' not in bag and 'the' not in bag
+    assert bag['remind'] == 1
+    assert bag['#re'] == 0.5
+    # Trigrams let a variant share terms with the word it derives from.
+    assert set(features("reminder")) & set(features("remind"))
+
+
+def test_search_ranks_the_most_similar_entry_first():
+    index = ExampleIndex([
+        ("schedule a meeting with the team", "meeting"),
+        ("send an email to a colleague", "email"),
+        ("set a reminder to buy groceries", "reminder"),
+    ])
+    assert index.search("email my colleague about lunch", 1) == ["email"]
+    assert index.search("I need reminders for groceries", 2)[0] == "reminder"
+    assert index.search("book a meeting", 3)[0] == "meeting"
+
+
+def test_unmatched_queries_keep_the_entry_order():
+    index = ExampleIndex([("alpha", 1), ("beta", 2), ("gamma", 3)])
+    assert index.search("zzz", 2) == [1, 2]
+    assert index.search("", 5) == [1, 2, 3]
+
+
+@pytest.mark.parametrize("message, agent", [
+    ("Schedule a meeting with john@example.com tomorrow at 3PM", "schedule_meeting"),
+    ("Please send an email to jane@example.com about the report", "send_email"),
+    ("Remind me to buy groceries at 5PM", "set_reminder"),
+])
+def test_relevant_agents_rank_the_matching_specialist_first(message, agent):
+    agents = relevant_agents(message, k=2)
+    assert list(agents)[0] == agent
+    assert len(agents) == 2
+    assert 'router' not in agents
+
+
+def test_chat_examples_match_the_task_of_the_message():
+    [example] = chat_example_index().search("send an email to my manager", 1)
+    assert example is CHAT_EXAMPLES[2]
+    [example] = chat_example_index().search("hello!", 1)
+    assert example is CHAT_EXAMPLES[4]
+
+
+def test_top_k_is_configurable(monkeypatch):
+    assert prompt_top_k(2) == 2
+    monkeypatch.setenv('ASSISTANT_PROMPT_TOP_K', '1')
+    assert prompt_top_k(2) == 1
+    assert len(relevant_agents("send an email")) == 1
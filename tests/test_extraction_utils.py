@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from automated_ai_assistant.utils.extraction_utils import (
+    extract_datetime, extract_duration, extract_email_details, extract_emails, extract_meeting_details,
+    extract_reminder_details, narrow_prompt
+)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("on 3rd January 2025 at 3PM", datetime(2025, 1, 3, 15, 0)),
+    ("on January 3, 2025 at 10:00 AM", datetime(2025, 1, 3, 10, 0)),
+    ("on 2025-01-03 at 15:30", datetime(2025, 1, 3, 15, 30)),
+    ("at 2025-01-03T09:15", datetime(2025, 1, 3, 9, 15)),
+    ("tomorrow at 3pm", None),
+    ("on 3 Jan 2025", None),
+    ("on 3 Jan 2025 at 3pm or 4pm", None),
+    ("on 31 Feb 2025 at 3pm", None),
+])
+def test_extract_datetime(text, expected):
+    assert extract_datetime(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("for 1 hour", timedelta(hours=1)),
+    ("for 30 mins", timedelta(minutes=30)),
+    ("for an hour and 30 minutes", timedelta(hours=1, minutes=30)),
+    ("for half an hour", timedelta(minutes=30)),
+    ("for 1 hour, then 30 minutes later", None),
+    ("soon", None),
+])
+def test_extract_duration(text, expected):
+    assert extract_duration(text) == expected
+
+
+def test_extract_emails_deduplicates_in_order():
+    assert extract_emails("Invite b@example.com, a@example.com and b@example.com.") == ['b@example.com',
+                                                                                      'a@example.com']
+
+
+def read(extraction, name):
+    """Value of a field and whether it was trusted, i.e. resolved rather than left as a hint."""
+    if name in extraction.fields:
+        return extraction.fields[name], True
+    return extraction.hints.get(name), False
+
+
+HINT = False
+TRUSTED = True
+NONE = (None, False)
+
+
+@pytest.mark.parametrize("text, summary, description", [
+    ("Schedule a meeting titled Sync with a@b.com on 3 Jan 2025 at 3pm for 1 hour, description: weekly",
+     NONE, ("weekly", TRUSTED)),
+    ('Schedule a meeting titled "Sync" with a@b.com on 3 Jan 2025 at 3pm for 1 hour', ("Sync", TRUSTED), NONE),
+    ("Meeting with a@b.com, title: Sync on 3 Jan 2025 at 3pm and description: weekly review.",
+     ("Sync", TRUSTED), ("weekly review", TRUSTED)),
+    ("title: Budget review with a@b.com for 30 mins", ("Budget review", TRUSTED), NONE),
+    ("Meeting with a@b.com, subject: Hi body: hello", ("Hi", TRUSTED), ("hello", TRUSTED)),
+    ("Meeting with a@b.com, title: Sync, then lunch", ("Sync", HINT), NONE),
+    ("agenda: review the plan on 3 Jan 2025 at 3pm with a@b.com", NONE, ("review the plan", HINT)),
+    ("Set up a sync with the title of the project", NONE, NONE),
+])
+def test_meeting_labels(text, summary, description):
+    extraction = extract_meeting_details(text)
+    assert read(extraction, 'summary') == summary
+    assert read(extraction, 'description') == description
+
+
+@pytest.mark.parametrize("text, subject, body", [
+    ("Email a@b.com, the subject line should be Lunch, body: are you free", NONE, ("are you free", TRUSTED)),
+    ('Email a@b.com with subject "Lunch" and body: are you free tomorrow?',
+     ("Lunch", TRUSTED), ("are you free tomorrow?", TRUSTED)),
+    ("Email a@b.com subject: Lunch; body: see you at noon", ("Lunch", TRUSTED), ("see you at noon", TRUSTED)),
+    ("Email a@b.com, body: hi, are you free", NONE, ("hi", HINT)),
+    ("Email a@b.com, body: 'hi, are you free'", NONE, ("hi, are you free", TRUSTED)),
+    ("Send an email to a@b.com about the subject of lunch", NONE, NONE),
+])
+def test_email_labels(text, subject, body):
+    extraction = extract_email_details(text)
+    assert read(extraction, 'subject') == subject
+    assert read(extraction, 'body') == body
+
+
+@pytest.mark.parametrize("text, title, description", [
+    ("remind me to pay rent with description monthly rent at 9am on 1 Feb 2025", ("pay rent", HINT), NONE),
+    ("remind me to pay rent at 9am on 1 Feb 2025, description: monthly rent",
+     ("pay rent", HINT), ("monthly rent", TRUSTED)),
+    ("remind me to call mom tomorrow", ("call mom", HINT), NONE),
+    ('Set a reminder titled "Dentist" for 2025-03-04 at 08:30', ("Dentist", TRUSTED), NONE),
+])
+def test_reminder_labels(text, title, description):
+    extraction = extract_reminder_details(text)
+    assert read(extraction, 'title') == title
+    assert read(extraction, 'description') == description
+
+
+@pytest.mark.parametrize("extraction, fields", [
+    (extract_meeting_details('Meeting titled "Sync" with a@b.com on 3 Jan 2025 at 3pm for 1 hour, '
+                             'description: weekly'),
+     {'start_time': datetime(2025, 1, 3, 15), 'end_time': datetime(2025, 1, 3, 16), 'attendees': ['a@b.com'],
+      'summary': "Sync", 'description': "weekly"}),
+    (extract_email_details('Email a@b.com, subject: "Lunch", body: "are you free"'),
+     {'recipients': ['a@b.com'], 'subject': "Lunch", 'body': "are you free"}),
+    (extract_reminder_details('Set a reminder titled "Rent" on 1 Feb 2025 at 9am, description: monthly rent'),
+     {'title': "Rent", 'description': "monthly rent", 'reminder_time': datetime(2025, 2, 1, 9)}),
+])
+def test_delimited_values_complete_the_extraction(extraction, fields):
+    assert extraction.complete
+    assert extraction.fields == fields
+    assert extraction.hints == {}
+
+
+def test_hints_leave_the_extraction_incomplete():
+    extraction = extract_reminder_details("remind me to pay rent on 1 Feb 2025 at 9am, description: monthly rent")
+    assert not extraction.complete
+    assert extraction.missing == ['title']
+    assert extraction.hints == {'title': "pay rent"}
+
+
+def test_meeting_structured_fields_are_resolved():
+    extraction = extract_meeting_details("Meeting with a@b.com on 3 Jan 2025 at 3pm for 1 hour")
+    assert extraction.fields == {
+        'start_time': datetime(2025, 1, 3, 15, 0),
+        'end_time': datetime(2025, 1, 3, 16, 0),
+        'attendees': ['a@b.com'],
+    }
+    assert extraction.missing == ['summary', 'description']
+
+
+def test_narrow_prompt_lists_resolved_fields_and_hints():
+    prompt = narrow_prompt(extract_email_details("Email a@b.com, subject: Lunch, body: hi, are you free"))
+    assert "'recipients': ['a@b.com']" in prompt
+    assert "'subject': 'Lunch'" in prompt
+    assert "Only determine the missing fields: body" in prompt
+    assert "{'body': 'hi'}" in prompt
+    assert narrow_prompt(extract_email_details("hello")) == ""
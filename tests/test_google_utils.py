@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+from cryptography.fernet import Fernet
+from google.auth.exceptions import RefreshError
+from google.oauth2.credentials import Credentials
+
+from automated_ai_assistant.utils import google_utils
+from automated_ai_assistant.utils.google_utils import (
+    EncryptedTokenStore, GoogleAPIInterface, GoogleAuthorizationRequired, GoogleCredentialCache
+)
+
+
+class FakeCredentials:
+    """Credentials that become valid after a slow refresh, or fail it."""
+
+    def __init__(self, valid=True, refresh_token="refresh", error=None):
+        self.valid = valid
+        self.expired = not valid
+        self.refresh_token = refresh_token
+        self.error = error
+        self.refreshes = 0
+
+    def refresh(self, request):
+        self.refreshes += 1
+        time.sleep(0.05)
+        if self.error:
+            raise self.error
+        self.valid, self.expired = True, False
+
+
+class FakeStore:
+    def __init__(self, **tokens):
+        self.tokens = tokens
+        self.loads = []
+        self.saves = []
+
+    def load(self, username):
+        self.loads.append(username)
+        return self.tokens.get(username)
+
+    def save(self, username, creds):
+        self.saves.append(username)
+
+
+def test_token_store_round_trips_encrypted_tokens(tmp_path):
+    store = EncryptedTokenStore(str(tmp_path), Fernet.generate_key())
+    creds = Credentials(token="access", refresh_token="refresh-secret", client_id="id", client_secret="secret",
+                        token_uri="https://oauth2.googleapis.com/token")
+    store.save("alice", creds)
+
+    [path] = tmp_path.iterdir()
+    assert "alice" not in path.name
+    assert b"refresh-secret" not in path.read_bytes()
+    loaded = store.load("alice")
+    assert (loaded.token, loaded.refresh_token) == ("access", "refresh-secret")
+    assert store.load("bob") is None
+    # A token encrypted with another key is treated as missing.
+    assert EncryptedTokenStore(str(tmp_path), Fernet.generate_key()).load("alice") is None
+
+
+def test_least_recently_used_credentials_are_dropped():
+    store = FakeStore(alice=FakeCredentials(), bob=FakeCredentials(), carol=FakeCredentials())
+    cache = GoogleCredentialCache(store, max_size=2)
+    alice = cache.get("alice")
+    cache.get("bob")
+    assert cache.get("alice") is alice
+    cache.get("carol")
+    assert list(cache._entries) == ["alice", "carol"]
+    assert store.loads == ["alice", "bob", "carol"]
+
+
+def test_concurrent_refreshes_are_coalesced():
+    creds = FakeCredentials(valid=False)
+    store = FakeStore(alice=creds)
+    cache = GoogleCredentialCache(store)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("alice"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [creds] * 8
+    assert creds.refreshes == 1
+    assert store.loads == ["alice"]
+    assert store.saves == ["alice"]
+
+
+@pytest.mark.parametrize("creds", [
+    None,
+    FakeCredentials(valid=False, refresh_token=None),
+    FakeCredentials(valid=False, error=RefreshError("invalid_grant: Token has been expired or revoked.")),
+])
+def test_unusable_credentials_require_authorization(creds):
+    cache = GoogleCredentialCache(FakeStore(alice=creds))
+    with pytest.raises(GoogleAuthorizationRequired) as error:
+        cache.get("alice")
+    assert error.value.username == "alice"
+    assert "alice" not in cache._entries
+
+
+def test_interfaces_do_not_share_connections(monkeypatch):
+    cache = GoogleCredentialCache(FakeStore(alice=Credentials(token="access")))
+    monkeypatch.setattr(google_utils, '_credential_cache', cache)
+    first, second = GoogleAPIInterface("alice"), GoogleAPIInterface("alice")
+    assert first.creds is second.creds
+    assert first.calendar_service._http is not second.calendar_service._http
+    assert first.calendar_service._http.http is not second.calendar_service._http.http
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import time
+
+import pytest
+from autogen_core.models import UserMessage
+
+from automated_ai_assistant.model.data_types import TaskRoute
+from automated_ai_assistant.utils.model_policy_utils import (
+    DEFAULT_POLICY, llm_calls, load_policy_config, ModelHealth, ModelPolicy, validation_failures
+)
+from automated_ai_assistant.utils.structured_output import create_structured
+from tests.conftest import ScriptedClient, total
+
+MESSAGES = [UserMessage(content="email bob", source="user")]
+
+
+def policy(small: ScriptedClient, large: ScriptedClient, **health) -> ModelPolicy:
+    config = {**DEFAULT_POLICY, 'health': {**DEFAULT_POLICY['health'], **health}}
+    clients = {'small': small, 'large': large}
+    return ModelPolicy.from_config(config, lambda settings: clients['small' if settings['model'] == 'gpt-4o-mini'
+                                                                    else 'large'])
+
+
+def test_health_trips_on_error_rate():
+    health = ModelHealth("gpt-4o-mini", window=10, min_samples=4, error_rate=0.25, cooldown=60)
+    for ok in (True, True, True):
+        health.record(10, ok)
+    health.record(10, False)
+    assert health.available
+    health.record(10, False)
+    assert not health.available
+
+
+def test_health_trips_on_p95_latency():
+    health = ModelHealth("gpt-4o", window=20, min_samples=20, latency_p95_ms=1000, cooldown=60)
+    for _ in range(18):
+        health.record(100, True)
+    health.record(5000, True)
+    assert health.available
+    health.record(5000, True)
+    assert not health.available
+
+
+def test_health_recovers_after_the_cooldown():
+    health = ModelHealth("gpt-4o", window=2, min_samples=2, error_rate=0, cooldown=0.05)
+    health.record(10, False)
+    health.record(10, False)
+    assert not health.available
+    time.sleep(0.06)
+    assert health.available
+    # The window was emptied, a single success does not trip it again.
+    health.record(10, True)
+    assert health.available
+
+
+def test_route_escalates_and_falls_back():
+    routes = policy(ScriptedClient(), ScriptedClient())
+    assert routes.route('send_email', 'EmailDetails') == ('small', 'primary')
+    assert routes.route('chat_agent', 'NextAction') == ('large', 'primary')
+    assert routes.route('send_email', 'EmailDetails', escalate=True) == ('large', 'escalated')
+
+    routes.health['large']._tripped_until = time.monotonic() + 60
+    assert routes.route('chat_agent', 'NextAction') == ('small', 'fallback')
+    assert routes.route('send_email', 'EmailDetails', escalate=True) == ('small', 'fallback')
+
+    # With both models out of rotation the primary tier is kept.
+    routes.health['small']._tripped_until = time.monotonic() + 60
+    assert routes.route('send_email', 'EmailDetails') == ('small', 'primary')
+
+
+def test_rules_are_looked_up_by_agent_and_task():
+    routes = policy(ScriptedClient(), ScriptedClient())
+    routes.rules = {**routes.rules, 'send_email:EmailDetails': 'large'}
+    assert routes.tier('send_email', 'EmailDetails') == 'large'
+    assert routes.tier('send_email', 'chat') == 'small'
+    assert routes.tier('unknown_agent', 'chat') == 'small'
+
+
+def test_repair_uses_the_escalated_tier():
+    small = ScriptedClient(json.dumps({'agent_type': 'fax_machine'}))
+    large = ScriptedClient(json.dumps({'agent_type': 'send_email'}))
+    routes = policy(small, large)
+    failures = total(validation_failures, agent='task_router', model='gpt-4o-mini', decision='primary')
+    escalated = total(llm_calls, agent='task_router', model='gpt-4o', decision='escalated', outcome='ok')
+
+    route = asyncio.run(create_structured(routes.client_for('task_router'), MESSAGES, TaskRoute, source="task_router"))
+
+    assert route.agent_type.value == 'send_email'
+    assert (small.calls, large.calls) == (1, 1)
+    assert total(validation_failures, agent='task_router', model='gpt-4o-mini', decision='primary') == failures + 1
+    assert total(llm_calls, agent='task_router', model='gpt-4o', decision='escalated', outcome='ok') == escalated + 1
+    # The invalid output was a successful call, it does not count against the small model.
+    assert list(routes.health['small']._samples)[-1][1] is True
+
+
+def test_call_errors_count_against_health():
+    routes = policy(ScriptedClient(ConnectionError("reset")), ScriptedClient(), min_samples=1, error_rate=0.5)
+    with pytest.raises(ConnectionError):
+        asyncio.run(routes.client_for('send_email').create(MESSAGES))
+    assert not routes.health['small'].available
+    assert routes.route('send_email', 'chat') == ('large', 'fallback')
+
+
+def test_with_clients_shares_the_model_health():
+    routes = policy(ScriptedClient(), ScriptedClient())
+    wrapped = routes.with_clients(lambda client: ("wrapped", client))
+    assert wrapped.clients['small'][0] == "wrapped"
+    assert wrapped.health is routes.health
+
+
+def test_policy_file_overrides_the_defaults(tmp_path):
+    path = tmp_path / "policy.yaml"
+    path.write_text("rules:\n  send_email: large\nhealth:\n  cooldown: 5\n")
+    config = load_policy_config(str(path))
+    assert config['rules']['send_email'] == 'large'
+    assert config['rules']['task_router'] == 'small'
+    assert config['health']['cooldown'] == 5
+    assert config['health']['window'] == DEFAULT_POLICY['health']['window']
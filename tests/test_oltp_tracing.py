@@ -0,0 +1,62 @@
+import logging
+import time
+
+from automated_ai_assistant.model.data_types import EmailDetails
+from automated_ai_assistant.oltp_tracing import add_log_handler, log_listener, logger, RedactionFilter
+
+
+def record(msg, *args) -> logging.LogRecord:
+    return logging.LogRecord("personal_assistant", logging.INFO, __file__, 1, msg, args, None)
+
+
+def test_payload_fields_and_emails_are_redacted():
+    details = EmailDetails(subject="Lunch", body="are you free", recipients=["alice@example.com"])
+    log_record = record("Sending %s to bob@example.com", details)
+    assert RedactionFilter().filter(log_record)
+    assert log_record.args is None
+    assert "are you free" not in log_record.msg
+    assert "a***@example.com" in log_record.msg
+    assert "b***@example.com" in log_record.msg
+    assert "subject='Lunch'" in log_record.msg
+
+
+def test_mapping_args_are_formatted():
+    log_record = record("%(user)s sent %(body)s", {'user': "bob@example.com", 'body': '{"body": "secret"}'})
+    assert RedactionFilter().filter(log_record)
+    assert log_record.getMessage() == 'b***@example.com sent {"body": "<redacted 6 chars>"}'
+
+
+def test_record_that_does_not_format_is_kept():
+    log_record = record("bad %s %s", 1)
+    assert RedactionFilter().filter(log_record)
+    assert log_record.msg == "bad %s %s"
+    assert log_record.args == (1,)
+
+
+class CollectingHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.messages.append(record.getMessage())
+        except Exception:
+            self.messages.append(None)
+
+
+def test_listener_survives_a_record_that_does_not_format(monkeypatch):
+    # The pytest capture handler would raise on the bad record before it reaches the queue.
+    monkeypatch.setattr(logging, 'raiseExceptions', False)
+    handler = CollectingHandler()
+    add_log_handler(handler)
+    try:
+        logger.info("bad %s %s", 1)
+        logger.info("still logging for %s", "carol@example.com")
+        deadline = time.monotonic() + 5
+        while len(handler.messages) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert handler.messages == [None, "still logging for c***@example.com"]
+    finally:
+        log_listener.handlers = tuple(h for h in log_listener.handlers if h is not handler)
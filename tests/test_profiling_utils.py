@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from automated_ai_assistant.app import app
+from automated_ai_assistant.utils.profiling_utils import (
+    current_profile, phase, PROFILE_HEADER, profiled, RequestProfile, sampler, StackSampler
+)
+
+
+@pytest.fixture
+def profile():
+    profile = RequestProfile("/test")
+    token = current_profile.set(profile)
+    yield profile
+    current_profile.reset(token)
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setenv('ASSISTANT_ADMIN_TOKEN', "secret")
+    yield {'x-admin-token': "secret"}
+    sampler.close_window()
+
+
+def test_phases_are_recorded_on_the_current_profile(profile):
+    with phase("lookup"):
+        time.sleep(0.01)
+    with phase("lookup"):
+        pass
+    profile.finish()
+    breakdown = profile.breakdown()
+    assert breakdown['phases']['lookup']['count'] == 2
+    assert breakdown['phases']['lookup']['total_ms'] >= 10
+    assert [entry['phase'] for entry in breakdown['timeline']] == ["lookup", "lookup"]
+    assert profile.server_timing().startswith("lookup;dur=")
+
+
+def test_phases_are_ignored_without_a_profile():
+    with phase("lookup"):
+        pass
+    assert current_profile.get() is None
+
+
+def test_profiled_functions_and_coroutines(profile):
+    @profiled("sync")
+    def add(a, b):
+        return a + b
+
+    @profiled("async")
+    async def double(a):
+        return a * 2
+
+    assert add(1, 2) == 3
+    assert asyncio.run(double(2)) == 4
+    assert set(profile.breakdown()['phases']) == {"sync", "async"}
+
+
+def test_sampler_collects_stacks_only_while_active():
+    busy = StackSampler(interval=0.001)
+    stop = threading.Event()
+
+    def spin_in_worker():
+        while not stop.is_set():
+            sum(range(100))
+
+    worker = threading.Thread(target=spin_in_worker)
+    worker.start()
+    try:
+        busy.request_started()
+        time.sleep(0.05)
+        busy.request_finished(RequestProfile("/test"))
+    finally:
+        stop.set()
+        worker.join()
+
+    assert "spin_in_worker (test_profiling_utils.py)" in busy.collapsed()
+    assert [profile['path'] for profile in busy.profiles] == ["/test"]
+    # With no request in flight and no window open the sampling thread exits.
+    time.sleep(0.02)
+    assert busy._thread is None
+    busy.collapsed(reset=True)
+    assert busy.collapsed() == ""
+
+
+def test_window_keeps_the_sampler_active():
+    window = StackSampler()
+    window.open_window(60)
+    assert window.active
+    window.close_window()
+    assert not window.active
+
+
+def test_admin_routes_are_hidden_without_the_token(admin):
+    client = TestClient(app)
+    assert client.get("/admin/profiling/requests").status_code == 404
+    assert client.get("/admin/profiling/requests", headers={'x-admin-token': "wrong"}).status_code == 404
+    assert client.get("/admin/profiling/requests", headers=admin).status_code == 200
+
+
+def test_only_admins_can_profile_a_request(admin):
+    client = TestClient(app)
+    assert 'server-timing' not in client.get("/", headers={PROFILE_HEADER: "1"}).headers
+    assert 'server-timing' not in client.get("/", headers={PROFILE_HEADER: "1", 'x-admin-token': "wrong"}).headers
+
+    response = client.get("/", headers={PROFILE_HEADER: "1", **admin})
+    assert response.json() == "Alive"
+    assert 'server-timing' in response.headers
+    assert response.headers['x-profile-id'] in [profile['id'] for profile in sampler.profiles]
+
+
+def test_window_profiles_every_request(admin):
+    client = TestClient(app)
+    assert client.post("/admin/profiling", params={'seconds': 60}, headers=admin).status_code == 200
+    assert 'x-profile-id' in client.get("/").headers
+    assert client.delete("/admin/profiling", headers=admin).status_code == 200
+    assert 'x-profile-id' not in client.get("/").headers
@@ -0,0 +1,223 @@
+import json
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from automated_ai_assistant.utils import quota_utils
+from automated_ai_assistant.utils.quota_utils import (
+    ApiQuota, error_reason, execute, execute_batch, GoogleQuota, is_retryable, QuotaExhausted, retry_after
+)
+from automated_ai_assistant.utils.rate_limit_utils import TokenBucket
+
+
+def http_error(status: int, reason: str = None, headers: dict = None) -> HttpError:
+    content = json.dumps({'error': {'errors': [{'reason': reason}]}} if reason else {}).encode('utf-8')
+    return HttpError(httplib2.Response({'status': status, **(headers or {})}), content)
+
+
+class Request:
+    """Request answering with the given errors, then with a response."""
+
+    def __init__(self, *errors: HttpError):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def execute(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {'id': 'event'}
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(quota_utils, 'sleep', delays.append)
+    return delays
+
+
+@pytest.fixture
+def quota(monkeypatch):
+    quota = GoogleQuota({'calendar': ApiQuota(6000, 6000), 'gmail': ApiQuota(60_000, 60_000)})
+    monkeypatch.setattr(quota_utils, '_quota', quota)
+    return quota
+
+
+def test_bucket_reserve_goes_into_debt():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve(2) == 0
+    assert bucket.reserve(1) == pytest.approx(0.1, abs=0.01)
+    bucket.refund(1)
+    assert bucket.tokens == pytest.approx(0, abs=0.05)
+
+
+def test_bucket_refund_is_capped_at_capacity():
+    bucket = TokenBucket(rate=1, capacity=2)
+    bucket.refund(5)
+    assert bucket.tokens == pytest.approx(2)
+
+
+def test_bucket_pause_holds_reservations():
+    bucket = TokenBucket(rate=100, capacity=100)
+    bucket.pause(5)
+    assert bucket.reserve(1) == pytest.approx(5, abs=0.05)
+    assert not bucket.try_acquire(1)
+    # A shorter pause does not end an ongoing one early.
+    bucket.pause(1)
+    assert bucket.reserve(1) == pytest.approx(5, abs=0.05)
+
+
+def test_acquire_waits_for_the_slower_bucket(monkeypatch):
+    delays = []
+    monkeypatch.setattr(quota_utils, 'sleep', delays.append)
+    quota = GoogleQuota({'gmail': ApiQuota(project_per_minute=60_000, user_per_minute=6_000)})
+    quota.acquire('gmail', 'messages.send', 'alice', 100)
+    quota.acquire('gmail', 'messages.send', 'alice', 100)
+    # The user bucket holds 100 units and refills at 100 units per second.
+    assert delays == [pytest.approx(1.0, abs=0.05)]
+
+
+def test_acquire_rejects_and_refunds_beyond_max_wait():
+    # One unit per second for the user, so a second call right away waits about a second.
+    quota = GoogleQuota({'calendar': ApiQuota(6000, 60)}, max_wait=0.5)
+    quota.acquire('calendar', 'events.insert', 'alice', 1)
+    project_tokens = quota._project['calendar'].tokens
+    with pytest.raises(QuotaExhausted):
+        quota.acquire('calendar', 'events.insert', 'alice', 1)
+    assert quota._project['calendar'].tokens == pytest.approx(project_tokens, abs=0.5)
+    # Another user is not held back by alice's bucket.
+    quota.acquire('calendar', 'events.insert', 'bob', 1)
+
+
+def test_user_rate_limit_pauses_only_the_user_bucket():
+    quota = GoogleQuota({'calendar': ApiQuota(6000, 6000)})
+    quota.rate_limited('calendar', 'alice', 'userRateLimitExceeded', 10)
+    assert quota.user_bucket('calendar', 'alice').reserve(1) == pytest.approx(10, abs=0.05)
+    assert quota.user_bucket('calendar', 'bob').reserve(1) == 0
+    quota.rate_limited('calendar', 'alice', 'rateLimitExceeded', 10)
+    assert quota._project['calendar'].reserve(1) == pytest.approx(10, abs=0.05)
+
+
+def test_least_recently_used_user_buckets_are_dropped():
+    quota = GoogleQuota({'calendar': ApiQuota(6000, 6000)}, max_users=2)
+    alice = quota.user_bucket('calendar', 'alice')
+    quota.user_bucket('calendar', 'bob')
+    quota.user_bucket('calendar', 'alice')
+    quota.user_bucket('calendar', 'carol')
+    assert quota.user_bucket('calendar', 'alice') is alice
+    assert list(quota._users) == [('calendar', 'carol'), ('calendar', 'alice')]
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (http_error(500), True),
+    (http_error(503), True),
+    (http_error(429, 'rateLimitExceeded'), True),
+    (http_error(403, 'rateLimitExceeded'), True),
+    (http_error(403, 'userRateLimitExceeded'), True),
+    (http_error(403, 'quotaExceeded'), False),
+    (http_error(429, 'quotaExceeded'), False),
+    (http_error(403, 'dailyLimitExceeded'), False),
+    (http_error(403, 'forbidden'), False),
+    (http_error(400, 'badRequest'), False),
+    (http_error(404), False),
+])
+def test_retry_classification(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+def test_error_details():
+    assert error_reason(http_error(403, 'rateLimitExceeded')) == 'rateLimitExceeded'
+    assert error_reason(HttpError(httplib2.Response({'status': 500}), b'not json')) is None
+    assert retry_after(http_error(429, headers={'retry-after': '3'})) == 3.0
+    assert retry_after(http_error(429)) is None
+
+
+def test_execute_retries_transient_errors(quota, sleeps):
+    request = Request(http_error(503), http_error(403, 'userRateLimitExceeded', {'retry-after': '2'}))
+    assert execute(request, 'calendar', 'events.insert', 'alice') == {'id': 'event'}
+    assert request.calls == 3
+    assert sleeps[1] == 2.0
+    # The rate limit paused alice's bucket for the other calls made for her.
+    assert quota.user_bucket('calendar', 'alice').reserve(1) > 1
+
+
+@pytest.mark.parametrize("error", [http_error(403, 'quotaExceeded'), http_error(400, 'badRequest')])
+def test_execute_does_not_retry_permanent_errors(quota, sleeps, error):
+    request = Request(error)
+    with pytest.raises(HttpError):
+        execute(request, 'calendar', 'events.insert', 'alice')
+    assert request.calls == 1
+    assert sleeps == []
+
+
+def test_execute_gives_up_after_the_last_retry(quota, sleeps):
+    request = Request(*[http_error(500)] * 3)
+    with pytest.raises(HttpError):
+        execute(request, 'calendar', 'events.insert', 'alice', max_retries=2)
+    assert request.calls == 3
+    assert len(sleeps) == 2
+
+
+def test_execute_charges_the_method_cost(quota, sleeps):
+    def units(method: str) -> int:
+        return sum(value['value'] for value in quota_utils.quota_units.snapshot()
+                   if value['attributes'] == {'api': 'gmail', 'method': method})
+
+    sent, listed = units('messages.send'), units('messages.list')
+    execute(Request(), 'gmail', 'messages.send', 'alice')
+    execute(Request(), 'gmail', 'messages.list', 'alice')
+    assert units('messages.send') - sent == 100
+    assert units('messages.list') - listed == 1
+
+
+class BatchService:
+    """Discovery service whose batches fail as a whole with the error given for their position."""
+
+    def __init__(self, failures: dict):
+        self.failures = failures
+        self.batches = []
+
+    def new_batch_http_request(self, callback):
+        service = self
+
+        class Batch:
+            def __init__(self):
+                self.requests = []
+
+            def add(self, request, request_id):
+                self.requests.append((request, request_id))
+
+            def execute(self):
+                service.batches.append([request_id for _, request_id in self.requests])
+                if len(service.batches) - 1 in service.failures:
+                    raise service.failures[len(service.batches) - 1]
+                for request, request_id in self.requests:
+                    try:
+                        callback(request_id, request.execute(), None)
+                    except HttpError as e:
+                        callback(request_id, None, e)
+
+        return Batch()
+
+
+def test_failed_batch_is_retried_without_losing_responses(quota, sleeps):
+    service = BatchService({1: http_error(429, headers={'retry-after': '3'})})
+    requests = [Request(), Request(), Request(http_error(503)), Request()]
+    results = execute_batch(service, requests, 'gmail', 'messages.get', 'alice', batch_size=2)
+
+    assert results == [{'id': 'event'}] * 4
+    # Only the requests left unanswered are sent again.
+    assert service.batches == [['0', '1'], ['2', '3'], ['2', '3'], ['2']]
+    assert [request.calls for request in requests] == [1, 1, 2, 1]
+    assert sleeps[0] == 3.0
+
+
+def test_permanently_failed_batch_keeps_the_other_responses(quota, sleeps):
+    service = BatchService({1: http_error(400)})
+    results = execute_batch(service, [Request(), Request(), Request()], 'gmail', 'messages.get', 'alice',
+                            batch_size=2)
+
+    assert results == [{'id': 'event'}, {'id': 'event'}, None]
+    assert service.batches == [['0', '1'], ['2']]
+    assert sleeps == []
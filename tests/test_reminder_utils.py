@@ -0,0 +1,188 @@
+import asyncio
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import List, Set
+
+import pytest
+
+from automated_ai_assistant.model.data_types import ReminderDetails
+from automated_ai_assistant.utils.reminder_utils import Reminder, ReminderScheduler, ReminderSink, ReminderStore
+
+
+def details(due: float, title: str = "Pay rent") -> ReminderDetails:
+    return ReminderDetails(title=title, description="Monthly rent",
+                           reminder_time=datetime.fromtimestamp(due, tz=timezone.utc))
+
+
+class RecordingSink(ReminderSink):
+    """Sink delivering every reminder after `failures` failed calls."""
+
+    def __init__(self, name: str, failures: int = 0):
+        self.name = name
+        self.failures = failures
+        self.calls: List[List[int]] = []
+        self.delivered: Set[int] = set()
+
+    async def deliver(self, reminders: List[Reminder]) -> Set[int]:
+        self.calls.append([reminder.id for reminder in reminders])
+        if len(self.calls) <= self.failures:
+            return set()
+        ids = {reminder.id for reminder in reminders}
+        self.delivered |= ids
+        return ids
+
+
+class RaisingSink(ReminderSink):
+    name = "broken"
+
+    async def deliver(self, reminders: List[Reminder]) -> Set[int]:
+        raise ConnectionError("sink unavailable")
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ReminderStore(str(tmp_path / "reminders.db"))
+    yield store
+    store.close()
+
+
+def statuses(store: ReminderStore) -> dict:
+    with sqlite3.connect(store.path) as connection:
+        return {id: (sink, status) for id, sink, status in connection.execute("SELECT id, sink, status FROM reminders")}
+
+
+async def run_until(scheduler: ReminderScheduler, condition, timeout: float = 5.0):
+    scheduler.start()
+    try:
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+    finally:
+        await scheduler.stop()
+
+
+def test_sink_must_implement_deliver():
+    with pytest.raises(TypeError):
+        ReminderSink()
+
+
+def test_pending_after_reads_behind_the_cursor(store):
+    now = time.time()
+    first = store.add("alice", "websocket", details(now))
+    second = store.add("alice", "websocket", details(now))
+    third = store.add("bob", "websocket", details(now + 10))
+    store.add("bob", "websocket", details(now + 1000))
+
+    assert [r.id for r in store.pending_after((float('-inf'), 0), now + 100, 10)] == [first.id, second.id, third.id]
+    assert [r.id for r in store.pending_after((first.due, first.id), now + 100, 10)] == [second.id, third.id]
+    assert [r.id for r in store.pending_after((float('-inf'), 0), now + 100, 1)] == [first.id]
+
+    store.mark([first.id], 'delivered')
+    assert store.pending_count() == 3
+    assert [r.id for r in store.pending_after((float('-inf'), 0), now + 100, 10)] == [second.id, third.id]
+
+
+def test_reminders_survive_a_restart(tmp_path):
+    path = str(tmp_path / "reminders.db")
+    store = ReminderStore(path)
+    reminder = store.add("alice", "calendar", details(time.time() - 60))
+    store.close()
+
+    reopened = ReminderStore(path)
+    try:
+        [loaded] = reopened.pending_after((float('-inf'), 0), time.time(), 10)
+        assert (loaded.id, loaded.username, loaded.sink) == (reminder.id, "alice", "calendar")
+        assert loaded.details == reminder.details
+    finally:
+        reopened.close()
+
+
+def test_overdue_reminders_fire_on_start(store):
+    sink = RecordingSink("websocket")
+    ids = {store.add("alice", "websocket", details(time.time() - 3600)).id for _ in range(3)}
+    scheduler = ReminderScheduler(store, [sink])
+    asyncio.run(run_until(scheduler, lambda: sink.delivered == ids))
+    assert sink.delivered == ids
+    assert len(sink.calls) == 1
+    assert store.pending_count() == 0
+
+
+def test_failed_delivery_is_retried(store):
+    sink = RecordingSink("websocket", failures=2)
+    reminder = store.add("alice", "websocket", details(time.time() - 1))
+    scheduler = ReminderScheduler(store, [sink], retry_delay=0.01)
+    asyncio.run(run_until(scheduler, lambda: reminder.id in sink.delivered))
+    assert len(sink.calls) == 3
+    assert statuses(store)[reminder.id] == ("websocket", 'delivered')
+
+
+def test_undelivered_reminder_falls_back_to_the_next_sink(store):
+    websocket, calendar = RecordingSink("websocket", failures=100), RecordingSink("calendar")
+    reminder = store.add("alice", "websocket", details(time.time() - 1))
+    scheduler = ReminderScheduler(store, [websocket, calendar], max_attempts=2, retry_delay=0.01)
+    asyncio.run(run_until(scheduler, lambda: reminder.id in calendar.delivered))
+    assert len(websocket.calls) == 2
+    assert statuses(store)[reminder.id] == ("calendar", 'delivered')
+
+
+def test_reminder_fails_after_the_last_sink(store):
+    reminder = store.add("alice", "broken", details(time.time() - 1))
+    scheduler = ReminderScheduler(store, [RaisingSink()], max_attempts=2, retry_delay=0.01)
+    asyncio.run(run_until(scheduler, lambda: store.pending_count() == 0))
+    assert statuses(store)[reminder.id] == ("broken", 'failed')
+
+
+def test_only_reminders_within_the_horizon_are_loaded(store):
+    now = time.time()
+    soon = store.add("alice", "websocket", details(now + 10))
+    store.add("alice", "websocket", details(now + 3600))
+    scheduler = ReminderScheduler(store, [RecordingSink("websocket")], horizon=60)
+
+    asyncio.run(scheduler._load())
+    assert [entry[1] for entry in scheduler._heap] == [soon.id]
+    assert now + 60 <= scheduler._cursor[0] < now + 3600
+
+
+def test_cursor_stops_at_the_last_loaded_reminder(store):
+    now = time.time()
+    reminders = [store.add("alice", "websocket", details(now + i)) for i in range(3)]
+    scheduler = ReminderScheduler(store, [RecordingSink("websocket")], horizon=60, max_loaded=2)
+
+    asyncio.run(scheduler._load())
+    assert sorted(entry[1] for entry in scheduler._heap) == [reminders[0].id, reminders[1].id]
+    assert scheduler._cursor == (reminders[1].due, reminders[1].id)
+
+    # A reminder scheduled after the cursor is left to the next load instead of being pushed.
+    scheduler._enqueue(reminders[2])
+    assert len(scheduler._heap) == 2
+
+
+def test_loaded_and_scheduled_reminder_is_fired_once(store):
+    sink = RecordingSink("websocket")
+
+    async def scenario():
+        scheduler = ReminderScheduler(store, [sink])
+        scheduler.start()
+        try:
+            await asyncio.sleep(0.05)
+            reminder = await scheduler.schedule("alice", details(time.time() + 0.1), "websocket")
+            # Loading again must not queue the reminder a second time.
+            scheduler._cursor = (float('-inf'), 0)
+            await scheduler._load()
+            deadline = time.monotonic() + 5
+            while reminder.id not in sink.delivered and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.05)
+            return reminder
+        finally:
+            await scheduler.stop()
+
+    reminder = asyncio.run(scenario())
+    assert sink.calls == [[reminder.id]]
+
+
+def test_schedule_rejects_unknown_sinks(store):
+    scheduler = ReminderScheduler(store, [RecordingSink("websocket")])
+    with pytest.raises(ValueError):
+        asyncio.run(scheduler.schedule("alice", details(time.time()), "pager"))
@@ -0,0 +1,116 @@
+import asyncio
+import json
+
+from autogen_core import DefaultTopicId
+from autogen_core.models import CreateResult, RequestUsage
+from cryptography.fernet import Fernet
+
+from automated_ai_assistant.model.data_types import EndUserMessage
+from automated_ai_assistant.utils import replay_utils
+from automated_ai_assistant.utils.google_utils import active_user
+from automated_ai_assistant.utils.model_policy_utils import llm_calls
+from automated_ai_assistant.utils.replay_utils import (
+    CassetteRecorder, cassette_recorder, load_cassette, RecordingChatCompletionClient, replay_cassette, replay_policy
+)
+from automated_ai_assistant.utils.runtime_utils import initialize_agent_runtime
+from automated_ai_assistant.utils.structured_output import schema_name
+from tests.conftest import total
+
+MESSAGE = "Email bob@example.com about lunch"
+ANSWERS = {
+    'NextAction': {'reply': "Sending it.", 'intent': 'send_email', 'prompt_to_task_router': MESSAGE},
+    'TaskPlan': {'tasks': [{'agent_type': 'send_email', 'instruction': MESSAGE, 'depends_on': []}]},
+    'EmailDetails': {'subject': "Lunch", 'body': "Are you free for lunch?"},
+}
+
+
+class SchemaClient:
+    """Chat completion client answering each request with the content for its response schema."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        self.calls += 1
+        answer = ANSWERS[schema_name(extra_create_args.get('response_format'))]
+        return CreateResult(finish_reason="stop", content=json.dumps(answer),
+                            usage=RequestUsage(prompt_tokens=0, completion_tokens=0), cached=False)
+
+
+class GoogleAPI:
+    """Google API interface of the recorded user, standing in for the live one."""
+    sent = []
+
+    def __init__(self, username: str):
+        self.username = username
+
+    def send_email(self, email_details):
+        self.sent.append((self.username, email_details.subject))
+        return {'id': 'message-1'}
+
+
+async def record(recorder: CassetteRecorder, client: SchemaClient):
+    active_user.set("alice")
+    interaction = recorder.start(MESSAGE, "alice")
+    policy = replay_policy().with_clients(lambda _: RecordingChatCompletionClient(client, interaction))
+    responses = asyncio.Queue()
+    runtime = await initialize_agent_runtime(model_policy=policy, response_queue=responses)
+    await runtime.publish_message(EndUserMessage(content=MESSAGE, source="user"), DefaultTopicId(type="chat_agent"))
+    await runtime.stop_when_idle()
+    recorder.finish(interaction)
+    return [responses.get_nowait().content for _ in range(responses.qsize())]
+
+
+def test_recorded_cassette_replays_without_the_live_services(tmp_path, monkeypatch):
+    monkeypatch.setattr(replay_utils, 'GoogleAPIInterface', GoogleAPI)
+    monkeypatch.setattr(GoogleAPI, 'sent', [])
+    key = Fernet.generate_key().decode('ascii')
+    path = str(tmp_path / "cassette.jsonl")
+    client = SchemaClient()
+
+    replies = asyncio.run(record(CassetteRecorder(path, key), client))
+    assert "Email sent successfully: message-1" in replies
+    assert client.calls == 3
+
+    [interaction] = load_cassette(path, key)
+    assert (interaction.message, interaction.username) == (MESSAGE, "alice")
+    assert len(interaction.llm) == 3
+    assert interaction.google == [{'call': 'send_email', 'response': {'id': 'message-1'}}]
+
+    replays = []
+
+    class ReplayGoogleAPI(replay_utils.ReplayGoogleAPI):
+        def __init__(self, interaction):
+            super().__init__(interaction)
+            replays.append(self)
+
+    monkeypatch.setattr(replay_utils, 'ReplayGoogleAPI', ReplayGoogleAPI)
+    calls = total(llm_calls, agent='task_router', decision='primary', outcome='ok')
+    report = asyncio.run(replay_cassette(path, speed=0, key=key))
+
+    assert report['requests'] == 1
+    assert client.calls == 3
+    # The recorded send_email response was served instead of a live call.
+    assert [replay._pending for replay in replays] == [[]]
+    assert GoogleAPI.sent == [("alice", "Lunch")]
+    # The replay is routed by the model policy, like live traffic.
+    assert total(llm_calls, agent='task_router', decision='primary', outcome='ok') == calls + 1
+
+
+def test_cassette_payloads_are_encrypted(tmp_path, monkeypatch):
+    monkeypatch.setattr(replay_utils, 'GoogleAPIInterface', GoogleAPI)
+    key = Fernet.generate_key().decode('ascii')
+    path = tmp_path / "cassette.jsonl"
+    asyncio.run(record(CassetteRecorder(str(path), key), SchemaClient()))
+
+    content = path.read_text()
+    for secret in ("bob@example.com", "alice", "Are you free"):
+        assert secret not in content
+
+
+def test_recording_is_refused_without_a_key(tmp_path, monkeypatch):
+    monkeypatch.setenv('ASSISTANT_RECORD_CASSETTE', str(tmp_path / "cassette.jsonl"))
+    monkeypatch.delenv('ASSISTANT_CASSETTE_KEY', raising=False)
+    assert cassette_recorder() is None
+    monkeypatch.setenv('ASSISTANT_CASSETTE_KEY', Fernet.generate_key().decode('ascii'))
+    assert cassette_recorder().path == str(tmp_path / "cassette.jsonl")
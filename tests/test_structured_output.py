@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+from typing import Optional
+
+import httpx
+import pytest
+from autogen_core.models import UserMessage
+from autogen_ext.models.openai import OpenAIChatCompletionClient
+from openai import AsyncOpenAI
+from pydantic import BaseModel, Field
+
+from automated_ai_assistant.model.data_types import ReminderDetails, TaskPlan
+from automated_ai_assistant.utils.structured_output import (
+    create_structured, parse_failures, repairs, response_format, response_model, schema_name, strict_json_schema,
+    StructuredOutputError
+)
+from tests.conftest import ScriptedClient, total
+
+VALID = json.dumps({'title': 'Pay rent', 'description': 'Monthly rent', 'reminder_time': '2025-02-01T09:00:00'})
+INVALID = json.dumps({'title': 'Pay rent', 'description': 'Monthly rent', 'reminder_time': 'first of the month'})
+MESSAGES = [UserMessage(content="remind me to pay rent", source="user")]
+
+
+def test_response_format_is_a_strict_schema():
+    format = response_format(ReminderDetails)
+    assert format['type'] == "json_schema"
+    assert format['json_schema']['strict'] is True
+    assert format['json_schema']['schema']['additionalProperties'] is False
+    assert schema_name(format) == "ReminderDetails"
+    assert schema_name(ReminderDetails) == "ReminderDetails"
+
+
+def test_strict_schema_closes_nested_objects():
+    class Note(BaseModel):
+        text: str = Field(description="Note text")
+        plan: Optional[TaskPlan] = None
+
+    schema = strict_json_schema(Note)
+    assert schema['required'] == ['text', 'plan']
+    assert 'default' not in schema['properties']['plan']
+    sub_task = schema['$defs']['SubTask']
+    assert sub_task['additionalProperties'] is False
+    assert sub_task['required'] == ['agent_type', 'instruction', 'depends_on']
+
+
+def test_subset_model_keeps_the_schema_name():
+    subset = response_model(ReminderDetails, ('reminder_time',))
+    assert list(subset.model_fields) == ['reminder_time']
+    assert response_format(subset)['json_schema']['name'] == "ReminderDetails"
+
+
+def test_invalid_answer_is_repaired():
+    client = ScriptedClient(INVALID, VALID)
+    details = asyncio.run(create_structured(client, MESSAGES, ReminderDetails, source="set_reminder"))
+    assert details.title == "Pay rent"
+    assert len(client.requests) == 2
+    repair = client.requests[1]['messages']
+    assert repair[-2].content == INVALID
+    assert "reminder_time" in repair[-1].content
+
+
+def test_still_invalid_after_repair_raises():
+    client = ScriptedClient(INVALID, INVALID)
+    with pytest.raises(StructuredOutputError):
+        asyncio.run(create_structured(client, MESSAGES, ReminderDetails, source="set_reminder"))
+    assert len(client.requests) == 2
+
+
+def test_openai_client_leaves_validation_to_the_repair():
+    failures, repaired = total(parse_failures, schema="ReminderDetails"), total(repairs, schema="ReminderDetails")
+    answers = [INVALID, VALID]
+    bodies = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        bodies.append(json.loads(request.content))
+        return httpx.Response(200, json={
+            'id': 'chatcmpl-1', 'object': 'chat.completion', 'created': 0, 'model': 'gpt-4o-mini-2024-07-18',
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': answers.pop(0)}}],
+            'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2},
+        })
+
+    client = OpenAIChatCompletionClient(model="gpt-4o-mini", api_key="test")
+    client._client = AsyncOpenAI(api_key="test", http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    details = asyncio.run(create_structured(client, MESSAGES, ReminderDetails, source="set_reminder"))
+    assert details.description == "Monthly rent"
+    assert len(bodies) == 2
+    assert bodies[0]['response_format']['json_schema']['strict'] is True
+    assert total(parse_failures, schema="ReminderDetails") == failures + 1
+    assert total(repairs, schema="ReminderDetails") == repaired + 1
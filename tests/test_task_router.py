@@ -0,0 +1,98 @@
+import asyncio
+import json
+import time
+from typing import List
+
+from autogen_core import (
+    ClosureAgent, ClosureContext, DefaultTopicId, message_handler, MessageContext, RoutedAgent,
+    SingleThreadedAgentRuntime, TypeSubscription
+)
+
+from automated_ai_assistant.agent.task_router import TaskRoutingAgent
+from automated_ai_assistant.model.data_types import AssistantResponse, EndUserMessage, TaskResult
+from tests.conftest import ScriptedClient
+
+
+class Specialist(RoutedAgent):
+    """Specialist taking `delay` seconds per sub-task and failing the instructions containing "fail"."""
+
+    def __init__(self, log: List[tuple], delay: float):
+        super().__init__("Test specialist")
+        self.log = log
+        self.delay = delay
+
+    @message_handler
+    async def handle(self, message: EndUserMessage, ctx: MessageContext) -> TaskResult:
+        instruction = message.content.split("\n")[0]
+        self.log.append(("start", instruction, time.monotonic()))
+        await asyncio.sleep(self.delay)
+        self.log.append(("end", instruction, time.monotonic()))
+        if "fail" in instruction:
+            return TaskResult(content=f"Could not {instruction}", ok=False)
+        return TaskResult(content=f"Done: {instruction}")
+
+
+def plan(*tasks) -> str:
+    return json.dumps({'tasks': [{'agent_type': agent_type, 'instruction': instruction, 'depends_on': depends_on}
+                                 for agent_type, instruction, depends_on in tasks]})
+
+
+async def route(plan_json: str, delay: float = 0.1):
+    runtime = SingleThreadedAgentRuntime()
+    log: List[tuple] = []
+    replies: List[AssistantResponse] = []
+    await TaskRoutingAgent.register(runtime, "task_router", lambda: TaskRoutingAgent(ScriptedClient(plan_json)))
+    for agent_type in ("schedule_meeting", "send_email", "set_reminder"):
+        await Specialist.register(runtime, agent_type, lambda: Specialist(log, delay))
+
+    async def collect(_agent: ClosureContext, message: AssistantResponse, ctx: MessageContext) -> None:
+        replies.append(message)
+
+    await ClosureAgent.register_closure(runtime, "user_response", collect, subscriptions=lambda: [
+        TypeSubscription(topic_type="user_response", agent_type="user_response")])
+    runtime.start()
+    await runtime.publish_message(EndUserMessage(content="do it all", source="ChatAgent"),
+                                  DefaultTopicId(type="task_router"))
+    await runtime.stop_when_idle()
+    return log, replies
+
+
+def started(log, instruction):
+    return next(at for event, name, at in log if event == "start" and name == instruction)
+
+
+def ended(log, instruction):
+    return next(at for event, name, at in log if event == "end" and name == instruction)
+
+
+def test_independent_sub_tasks_run_concurrently():
+    log, replies = asyncio.run(route(plan(("schedule_meeting", "book the room", []),
+                                          ("send_email", "email the team", []),
+                                          ("set_reminder", "remind me", []))))
+    # All three start before the first one ends.
+    assert max(started(log, name) for name in ("book the room", "email the team", "remind me")) < \
+        min(ended(log, name) for name in ("book the room", "email the team", "remind me"))
+    assert [reply.partial for reply in replies] == [True, True, True, False]
+    assert replies[-1].content == "Done: book the room\nDone: email the team\nDone: remind me"
+
+
+def test_dependent_sub_task_waits_for_its_dependency():
+    log, replies = asyncio.run(route(plan(("schedule_meeting", "book the room", []),
+                                          ("send_email", "email the link", [0]))))
+    assert started(log, "email the link") >= ended(log, "book the room")
+    assert replies[-1].content == "Done: book the room\nDone: email the link"
+
+
+def test_failure_skips_the_dependent_sub_tasks():
+    log, replies = asyncio.run(route(plan(("schedule_meeting", "fail to book", []),
+                                          ("send_email", "email the link", [0]),
+                                          ("set_reminder", "remind me of the email", [1]),
+                                          ("set_reminder", "remind me anyway", []))))
+    # The skipped sub-tasks never reach their specialist.
+    assert sorted(name for event, name, _ in log if event == "start") == ["fail to book", "remind me anyway"]
+    assert replies[-1].content.split("\n") == [
+        "Could not fail to book",
+        "Skipped: did not send email because the step to schedule meeting failed.",
+        "Skipped: did not set reminder because the step to send email failed.",
+        "Done: remind me anyway",
+    ]
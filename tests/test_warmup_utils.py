@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from automated_ai_assistant.app import app
+from automated_ai_assistant.model.data_types import MeetingDetails
+from automated_ai_assistant.utils import google_utils, warmup_utils
+from automated_ai_assistant.utils.model_policy_utils import DEFAULT_POLICY, ModelPolicy
+from automated_ai_assistant.utils.structured_output import response_format, response_model, type_adapter
+from automated_ai_assistant.utils.warmup_utils import warm_up, warmup_state
+from tests.conftest import ScriptedClient
+
+
+@pytest.fixture
+def state(monkeypatch):
+    monkeypatch.setattr(warmup_state, 'ready', False)
+    monkeypatch.setattr(warmup_state, 'steps', {})
+    monkeypatch.delenv('GOOGLE_TOKEN_STORE_KEY', raising=False)
+    monkeypatch.setattr(google_utils, '_credential_cache', None)
+    return warmup_state
+
+
+def policy(*answers) -> ModelPolicy:
+    return ModelPolicy.from_config(DEFAULT_POLICY, lambda settings: ScriptedClient(*answers))
+
+
+def test_not_ready_before_the_warm_up(state):
+    response = TestClient(app).get("/ready")
+    assert response.status_code == 503
+    assert response.json() == {'ready': False, 'steps': {}}
+
+
+def test_ready_once_the_required_steps_are_done(state):
+    asyncio.run(warm_up(policy("pong")))
+    response = TestClient(app).get("/ready")
+    assert response.status_code == 200
+    steps = response.json()['steps']
+    assert {steps[name]['status'] for name in ("schemas", "prompt_indexes", "openai_connection_small",
+                                               "openai_connection_large")} == {"done"}
+    # Without Google tokens the pod is still ready.
+    assert steps['google_credentials']['status'] == "skipped"
+
+
+def test_failed_required_step_keeps_the_pod_out_of_rotation(state, monkeypatch):
+    def broken_index():
+        raise ValueError("broken registry")
+
+    monkeypatch.setattr(warmup_utils, 'registry_index', broken_index)
+    asyncio.run(warm_up(policy("pong")))
+    response = TestClient(app).get("/ready")
+    assert response.status_code == 503
+    assert response.json()['steps']['prompt_indexes'] == {'status': 'failed', 'error': "broken registry"}
+
+
+def test_warm_up_fills_the_caches_requests_read(state):
+    asyncio.run(warm_up(policy("pong")))
+    hits = response_format.cache_info().hits, type_adapter.cache_info().hits
+    subset = response_model(MeetingDetails, ('summary', 'description'))
+    response_format(subset)
+    type_adapter(subset)
+    assert response_format.cache_info().hits == hits[0] + 1
+    assert type_adapter.cache_info().hits == hits[1] + 1
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from automated_ai_assistant import app as app_module
+from automated_ai_assistant.app import app
+from automated_ai_assistant.model.data_types import AssistantResponse
+from automated_ai_assistant.utils import websocket_utils
+from automated_ai_assistant.utils.websocket_utils import ChatConnection, ConnectionManager, websocket_pushes
+from tests.conftest import total
+
+
+class EchoRuntime:
+    """Agent runtime answering every message with its content on the response queue."""
+
+    def __init__(self, response_queue: asyncio.Queue):
+        self.response_queue = response_queue
+
+    async def publish_message(self, message, topic_id, cancellation_token=None):
+        await self.response_queue.put(AssistantResponse(content=f"echo: {message.content}", source="chat_agent"))
+
+    async def stop(self):
+        pass
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    async def initialize_agent_runtime(model_policy, response_queue):
+        return EchoRuntime(response_queue)
+
+    monkeypatch.setattr(app_module, 'model_policy', lambda: None)
+    monkeypatch.setattr(app_module, 'initialize_agent_runtime', initialize_agent_runtime)
+    manager = ConnectionManager(max_connections=10, max_connections_per_user=1, max_pending_frames=4)
+    monkeypatch.setattr(websocket_utils, '_manager', manager)
+    return manager
+
+
+def signed_in(name: str = "alice") -> TestClient:
+    client = TestClient(app)
+    assert client.post(f"/create_session/{name}").status_code == 200
+    return client
+
+
+def test_connections_require_a_valid_session(manager):
+    client = TestClient(app)
+    for cookies in ({}, {'cookie': "forged"}):
+        client.cookies.clear()
+        client.cookies.update(cookies)
+        with pytest.raises(WebSocketDisconnect) as rejected:
+            with client.websocket_connect("/ws/chat") as websocket:
+                websocket.receive_json()
+        assert rejected.value.code == 1008
+
+    with signed_in().websocket_connect("/ws/chat") as websocket:
+        websocket.send_json({'message': "hi"})
+        assert websocket.receive_json() == {'type': 'response', 'content': "echo: hi", 'source': "chat_agent"}
+        assert manager.users() == ["alice"]
+    assert manager.count == 0
+
+
+def test_connections_beyond_the_limit_are_rejected(manager):
+    client = signed_in()
+    with client.websocket_connect("/ws/chat") as websocket:
+        websocket.send_json({'message': "hi"})
+        websocket.receive_json()
+        with pytest.raises(WebSocketDisconnect) as rejected:
+            with client.websocket_connect("/ws/chat") as second:
+                second.receive_json()
+        assert rejected.value.code == 1013
+    with signed_in("bob").websocket_connect("/ws/chat") as websocket:
+        websocket.send_json({'message': "hi"})
+        assert websocket.receive_json()['content'] == "echo: hi"
+
+
+def test_messages_beyond_the_rate_limit_are_refused(manager, monkeypatch):
+    monkeypatch.setenv('ASSISTANT_WS_MESSAGES_PER_SECOND', '0.001')
+    monkeypatch.setenv('ASSISTANT_WS_MESSAGE_BURST', '1')
+    with signed_in().websocket_connect("/ws/chat") as websocket:
+        websocket.send_json({'message': "first"})
+        assert websocket.receive_json()['content'] == "echo: first"
+        websocket.send_json({'message': "second"})
+        assert websocket.receive_json() == {'type': 'error', 'detail': "rate limit exceeded"}
+        websocket.send_text("not json")
+        assert websocket.receive_json()['type'] == 'error'
+
+
+def test_failing_sender_closes_the_socket(manager, monkeypatch):
+    async def send_pending(self):
+        raise RuntimeError("broken socket")
+
+    monkeypatch.setattr(ChatConnection, 'send_pending', send_pending)
+    with signed_in().websocket_connect("/ws/chat") as websocket:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+        assert closed.value.code == 1011
+    assert manager.count == 0
+
+
+def test_pushes_are_dropped_when_the_outbox_is_full():
+    async def scenario():
+        manager = ConnectionManager(max_pending_frames=2)
+        connection = manager.connect(websocket=None, username="alice")
+        delivered = [manager.push("alice", {'type': 'notice'}) for _ in range(3)]
+        waiting = asyncio.create_task(connection.send({'type': 'error'}))
+        await asyncio.sleep(0)
+        # Answers to the client wait for room rather than being dropped.
+        assert not waiting.done()
+        await connection.close()
+        await waiting
+        return delivered
+
+    dropped = total(websocket_pushes, outcome="dropped")
+    assert asyncio.run(scenario()) == [1, 1, 0]
+    assert total(websocket_pushes, outcome="dropped") == dropped + 1